@@ -7,3 +7,8 @@ class AccountsConfig(AppConfig):
     
     def ready(self):
         import accounts.signals
+        from branchpoint_backend.metrics import register_metrics
+        from .blacklist import jti_blacklist
+        from .login_pool import login_pool
+        register_metrics('token_blacklist_filter', jti_blacklist.stats)
+        register_metrics('login_hash_pool', login_pool.stats)
@@ -0,0 +1,150 @@
+"""
+Avatar upload pipeline.
+
+An uploaded avatar is written to the local "avatar_staging" storage and the
+request returns straight away with the profile's avatar status "pending".
+A Celery task (`accounts.tasks.process_avatar_upload`) then crops it into
+square thumbnails of every size in AVATAR_THUMBNAIL_SIZES, saves them to the
+"thumbnails" storage (Cloudinary, or the local filesystem in dev), records
+their names on the profile and deletes the staged original. Clients only
+ever get thumbnail URLs.
+"""
+
+import logging
+import uuid
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import storages
+from django.db import transaction
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_DIR = 'avatars/thumbnails'
+
+
+def staging_storage():
+    return storages['avatar_staging']
+
+
+def thumbnail_storage():
+    return storages['thumbnails']
+
+
+def thumbnail_urls(profile):
+    """{size name: URL} for the profile's thumbnails, or None"""
+    if not profile.avatar_thumbnails:
+        return None
+    storage = thumbnail_storage()
+    return {size: storage.url(name) for size, name in profile.avatar_thumbnails.items()}
+
+
+def set_avatar(profile, upload):
+    """
+    Stage a new avatar (or remove it when `upload` is None) and queue the
+    background work. The profile is saved.
+    """
+    from .models import Profile
+
+    old_staged = profile.avatar.name if profile.avatar else None
+    old_thumbnails = list(profile.avatar_thumbnails.values())
+
+    if upload is None:
+        profile.avatar = None
+        profile.avatar_thumbnails = {}
+        profile.avatar_status = Profile.AVATAR_NONE
+    else:
+        profile.avatar = upload
+        profile.avatar_status = Profile.AVATAR_PENDING
+    profile.save()
+
+    from .tasks import delete_avatar_files, process_avatar_upload
+
+    def enqueue():
+        try:
+            if old_staged:
+                staging_storage().delete(old_staged)
+            if upload is None:
+                if old_thumbnails:
+                    delete_avatar_files.delay(old_thumbnails)
+            else:
+                process_avatar_upload.delay(profile.pk)
+        except Exception:
+            # The profile stays pending; `process_avatars` picks it up.
+            logger.exception('Could not queue avatar processing for profile %s', profile.pk)
+
+    transaction.on_commit(enqueue)
+
+
+def make_thumbnail(image, edge):
+    """Centre-crop `image` to a square and scale it to `edge` pixels"""
+    thumbnail = ImageOps.fit(image, (edge, edge), Image.Resampling.LANCZOS)
+    buffer = BytesIO()
+    thumbnail.save(buffer, format='JPEG', quality=85, optimize=True)
+    return buffer.getvalue()
+
+
+def process_avatar(profile_id):
+    """
+    Turn a profile's staged avatar into thumbnails. Safe to run more than
+    once: a profile that is no longer pending is left alone, and if a newer
+    avatar was staged meanwhile the thumbnails made here are discarded.
+    """
+    from .models import Profile
+
+    profile = Profile.objects.filter(pk=profile_id).first()
+    if profile is None or profile.avatar_status != Profile.AVATAR_PENDING or not profile.avatar:
+        return
+    staged = profile.avatar.name
+    staging = staging_storage()
+
+    try:
+        with staging.open(staged, 'rb') as source:
+            image = Image.open(source)
+            image = ImageOps.exif_transpose(image).convert('RGB')
+    except FileNotFoundError:
+        # Replaced by a newer upload; that upload has its own task.
+        return
+    except (UnidentifiedImageError, OSError):
+        logger.warning('Avatar for profile %s is not a readable image', profile_id)
+        if Profile.objects.filter(pk=profile_id, avatar=staged).update(
+            avatar=None, avatar_status=Profile.AVATAR_FAILED
+        ):
+            staging.delete(staged)
+        return
+
+    storage = thumbnail_storage()
+    token = uuid.uuid4().hex[:8]
+    thumbnails = {}
+    for size, edge in settings.AVATAR_THUMBNAIL_SIZES.items():
+        name = f'{THUMBNAIL_DIR}/{profile.user_id}-{size}-{token}.jpg'
+        thumbnails[size] = storage.save(name, ContentFile(make_thumbnail(image, edge)))
+
+    # Only publish the thumbnails if the staged file is still the current one.
+    updated = Profile.objects.filter(
+        pk=profile_id, avatar=staged, avatar_status=Profile.AVATAR_PENDING
+    ).update(avatar=None, avatar_thumbnails=thumbnails, avatar_status=Profile.AVATAR_READY)
+    if not updated:
+        delete_files(thumbnails.values())
+        return
+
+    staging.delete(staged)
+    delete_files(profile.avatar_thumbnails.values())
+
+
+def mark_failed(profile_id):
+    from .models import Profile
+    Profile.objects.filter(pk=profile_id, avatar_status=Profile.AVATAR_PENDING).update(
+        avatar_status=Profile.AVATAR_FAILED
+    )
+
+
+def delete_files(names):
+    storage = thumbnail_storage()
+    for name in names:
+        try:
+            storage.delete(name)
+        except Exception:
+            logger.warning('Could not delete avatar thumbnail %s', name, exc_info=True)
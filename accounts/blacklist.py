@@ -0,0 +1,231 @@
+"""
+In-memory filter of blacklisted refresh token JTIs.
+
+Every refresh/logout verifies the incoming token against simplejwt's
+blacklist tables. Blacklisted tokens are rare compared to valid ones, so a
+Bloom filter answers "definitely not blacklisted" for almost every token
+without touching the database. Only a "maybe" falls through to the DB.
+
+Each server process builds its filter from the unexpired blacklisted
+tokens when it starts (`start()`, called from wsgi.py/asgi.py) and keeps
+it current through a Redis pub/sub channel that every process publishes
+newly blacklisted JTIs to. While the subscription is not healthy, or the
+filter is still loading, every check goes to the DB.
+"""
+
+import hashlib
+import logging
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from redis.exceptions import RedisError
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+from branchpoint_backend.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings"""
+
+    def __init__(self, capacity, error_rate):
+        if capacity <= 0:
+            raise ValueError('capacity must be positive')
+        if not 0 < error_rate < 1:
+            raise ValueError('error_rate must be between 0 and 1')
+
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = max(8, int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))))
+        self.num_hashes = max(1, int(round(self.num_bits / capacity * math.log(2))))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, item):
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+    @property
+    def is_full(self):
+        return self.count >= self.capacity
+
+
+class JTIBlacklistFilter:
+    """
+    Process-local Bloom filter of blacklisted JTIs kept in sync over Redis.
+
+    `is_blacklisted()` is the only method callers need; it returns the
+    authoritative answer and only queries the DB when the filter can't rule
+    the JTI out.
+    """
+
+    def __init__(self):
+        # Guards the filter, which the sync thread and request threads
+        # both add to, and the counters
+        self._lock = threading.Lock()
+        self._filter = None
+        # JTIs added while a reload is building the next filter
+        self._pending = None
+        self._subscriber = None
+        self._in_sync = threading.Event()
+        self._loaded_at = 0
+        self.db_checks = 0
+        self.filter_hits = 0
+
+    @property
+    def config(self):
+        return settings.TOKEN_BLACKLIST_FILTER
+
+    def start(self):
+        """Load the filter and subscribe in the background, at process start"""
+        if self.config['ENABLED']:
+            self._ensure_started()
+
+    def _ensure_started(self):
+        if self._subscriber is None:
+            with self._lock:
+                if self._subscriber is None:
+                    self._subscriber = threading.Thread(
+                        target=self._listen, name='jti-blacklist-sync', daemon=True
+                    )
+                    self._subscriber.start()
+
+    def load(self):
+        """(Re)build the filter from the unexpired blacklisted tokens"""
+        with self._lock:
+            self._pending = []
+        bloom = BloomFilter(self.config['CAPACITY'], self.config['ERROR_RATE'])
+        try:
+            jtis = BlacklistedToken.objects.filter(
+                token__expires_at__gt=timezone.now()
+            ).values_list('token__jti', flat=True).iterator(chunk_size=2000)
+            for jti in jtis:
+                bloom.add(jti)
+        except BaseException:
+            with self._lock:
+                self._pending = None
+            raise
+
+        with self._lock:
+            # Blacklisted after the query started; they may not be in it.
+            for jti in self._pending:
+                if jti not in bloom:
+                    bloom.add(jti)
+            self._pending = None
+            self._filter = bloom
+            self._loaded_at = time.monotonic()
+        if bloom.is_full:
+            logger.warning(
+                'JTI blacklist filter holds %s entries, above its capacity of %s; '
+                'raise TOKEN_BLACKLIST_FILTER["CAPACITY"]', bloom.count, bloom.capacity
+            )
+
+    def add(self, jti):
+        """Record a blacklisted JTI locally"""
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append(jti)
+            # A process hears its own publishes too, and Redis may deliver a
+            # JTI we already have; count each one once towards capacity.
+            if self._filter is not None and jti not in self._filter:
+                self._filter.add(jti)
+
+    def publish(self, jti):
+        """Record a blacklisted JTI locally and tell every other process"""
+        self.add(jti)
+        try:
+            get_redis().publish(self.config['CHANNEL'], jti)
+        except RedisError:
+            logger.exception('Could not publish blacklisted JTI %s', jti)
+
+    def might_contain(self, jti):
+        if not self.config['ENABLED']:
+            return True
+        self._ensure_started()
+        if not self._in_sync.is_set() or self._filter is None:
+            return True
+        return jti in self._filter
+
+    def is_blacklisted(self, jti):
+        if not self.might_contain(jti):
+            with self._lock:
+                self.filter_hits += 1
+            return False
+        with self._lock:
+            self.db_checks += 1
+        return BlacklistedToken.objects.filter(token__jti=jti).exists()
+
+    def _listen(self):
+        channel = self.config['CHANNEL']
+        retry_delay = 1
+        while True:
+            pubsub = None
+            try:
+                pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(channel)
+                # Subscribe before loading so nothing published while the
+                # filter is being built is missed.
+                self._reload()
+                self._in_sync.set()
+                retry_delay = 1
+                while True:
+                    message = pubsub.get_message(timeout=1.0)
+                    if message and message['type'] == 'message':
+                        self.add(message['data'].decode())
+                    self._reload_if_full()
+            except Exception:
+                logger.warning('JTI blacklist sync lost; checks fall back to the DB', exc_info=True)
+            finally:
+                self._in_sync.clear()
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except RedisError:
+                        pass
+            time.sleep(retry_delay)
+            retry_delay = min(retry_delay * 2, 30)
+
+    def _reload_if_full(self):
+        # Expired entries are dropped on reload, which keeps the
+        # false-positive rate near the configured one. At most every ten
+        # minutes, in case the unexpired ones alone fill it.
+        if self._filter.is_full and time.monotonic() - self._loaded_at > 600:
+            self._reload()
+
+    def _reload(self):
+        try:
+            self.load()
+        finally:
+            # This thread lives for the whole process; don't pin a DB
+            # connection to it between reloads.
+            connection.close()
+
+    def stats(self):
+        bloom = self._filter
+        return {
+            'in_sync': self._in_sync.is_set(),
+            'entries': bloom.count if bloom else 0,
+            'capacity': bloom.capacity if bloom else self.config['CAPACITY'],
+            'size_bytes': len(bloom.bits) if bloom else 0,
+            'hash_functions': bloom.num_hashes if bloom else 0,
+            'filter_hits': self.filter_hits,
+            'db_checks': self.db_checks,
+        }
+
+
+jti_blacklist = JTIBlacklistFilter()
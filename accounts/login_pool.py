@@ -0,0 +1,123 @@
+"""
+Bounded thread pool for login password hashing.
+
+Checking a password is deliberately slow (PBKDF2, ~100ms of CPU). On a
+sync worker every login holds the whole worker for that long, so a burst
+of logins starves unrelated requests. The async login view instead hands
+`authenticate()` to this pool and awaits it, keeping the event loop free.
+
+hashlib releases the GIL while hashing, so the pool's threads really run
+in parallel. The pool admits at most WORKERS running plus QUEUE_SIZE
+waiting logins per process; beyond that callers get `LoginQueueFull`
+straight away (the view answers 503 with Retry-After), which keeps
+latency bounded instead of letting the queue grow without limit.
+"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.db import close_old_connections
+
+from branchpoint_backend.metrics import LatencyStats
+
+
+class LoginQueueFull(Exception):
+    """Every worker is busy and the wait queue is full"""
+
+
+class LoginQueueTimeout(Exception):
+    """The login waited in the queue longer than QUEUE_TIMEOUT"""
+
+
+class LoginHashPool:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pending = 0
+        self._running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self._wait_ms = LatencyStats()
+        self._hash_ms = LatencyStats()
+
+    @property
+    def config(self):
+        return settings.LOGIN_HASH_POOL
+
+    @property
+    def capacity(self):
+        return self.config['WORKERS'] + self.config['QUEUE_SIZE']
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.config['WORKERS'], thread_name_prefix='login-hash'
+                    )
+        return self._executor
+
+    async def authenticate(self, request, email, password):
+        """
+        Run `authenticate()` on the pool and return the user or None.
+
+        Raises LoginQueueFull or LoginQueueTimeout when the login was
+        shed instead of checked.
+        """
+        with self._lock:
+            if self._pending >= self.capacity:
+                self.rejected += 1
+                raise LoginQueueFull()
+            self._pending += 1
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._get_executor(), self._run, time.monotonic(), request, email, password
+        )
+
+    def _run(self, submitted, request, email, password):
+        # The counters are released here rather than in authenticate() so a
+        # cancelled request still counts until its hashing actually ends.
+        started = time.monotonic()
+        waited = started - submitted
+        with self._lock:
+            self._running += 1
+        self._wait_ms.add(waited * 1000)
+        try:
+            if waited > self.config['QUEUE_TIMEOUT']:
+                with self._lock:
+                    self.timed_out += 1
+                raise LoginQueueTimeout()
+            try:
+                return authenticate(request=request, username=email, password=password)
+            finally:
+                close_old_connections()
+                with self._lock:
+                    self.completed += 1
+                self._hash_ms.add((time.monotonic() - started) * 1000)
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._pending -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.config['WORKERS'],
+                'queue_size': self.config['QUEUE_SIZE'],
+                'running': self._running,
+                'queued': self._pending - self._running,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'timed_out': self.timed_out,
+                'queue_wait_ms': self._wait_ms.summary(),
+                'hash_ms': self._hash_ms.summary(),
+            }
+
+
+login_pool = LoginHashPool()
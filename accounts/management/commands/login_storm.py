@@ -0,0 +1,135 @@
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+
+from accounts.models import User, Profile
+from branchpoint_backend.metrics import percentile
+
+EMAIL_DOMAIN = 'loadtest.invalid'
+
+
+class Command(BaseCommand):
+    help = (
+        'Simulate a shift-change login storm against a running server: many '
+        'users log in at once while a probe measures the latency of an '
+        'unrelated endpoint'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://localhost:8000', help='Server to test')
+        parser.add_argument('--path', default='/api/accounts/login/async/',
+                            help='Login endpoint (use /api/accounts/login/ for the sync view)')
+        parser.add_argument('--users', type=int, default=200, help='Number of logins to fire')
+        parser.add_argument('--concurrency', type=int, default=100, help='Simultaneous clients')
+        parser.add_argument('--password', default='Storm-pass-123', help='Password for the load test users')
+        parser.add_argument('--probe-interval', type=float, default=0.05,
+                            help='Seconds between probe requests (0 disables the probe)')
+        parser.add_argument('--metrics-token', default='', help='METRICS_TOKEN, to print the pool metrics afterwards')
+        parser.add_argument('--skip-setup', action='store_true', help="Don't create the load test users")
+        parser.add_argument('--cleanup', action='store_true', help='Delete the load test users and exit')
+
+    def handle(self, *args, **options):
+        if options['cleanup']:
+            deleted, _ = User.objects.filter(email__endswith='@' + EMAIL_DOMAIN).delete()
+            self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} load test objects'))
+            return
+
+        emails = [f'storm-{i}@{EMAIL_DOMAIN}' for i in range(options['users'])]
+        if not options['skip_setup']:
+            self._create_users(emails, options['password'])
+
+        base_url = options['base_url'].rstrip('/')
+        results = []
+        probes = []
+        done = threading.Event()
+        local = threading.local()
+
+        def session():
+            if not hasattr(local, 'session'):
+                local.session = requests.Session()
+            return local.session
+
+        def login(email):
+            started = time.perf_counter()
+            try:
+                response = session().post(
+                    base_url + options['path'],
+                    json={'email': email, 'password': options['password']},
+                    timeout=60,
+                )
+                outcome = response.status_code
+            except requests.RequestException as exc:
+                outcome = type(exc).__name__
+            results.append((outcome, (time.perf_counter() - started) * 1000))
+
+        def probe():
+            probe_session = requests.Session()
+            while not done.is_set():
+                started = time.perf_counter()
+                try:
+                    probe_session.post(base_url + '/api/accounts/check-email/',
+                                       json={'email': 'probe@' + EMAIL_DOMAIN}, timeout=30)
+                    probes.append((time.perf_counter() - started) * 1000)
+                except requests.RequestException:
+                    pass
+                done.wait(options['probe_interval'])
+
+        prober = None
+        if options['probe_interval'] > 0:
+            prober = threading.Thread(target=probe, daemon=True)
+            prober.start()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            list(executor.map(login, emails))
+        elapsed = time.perf_counter() - started
+        done.set()
+        if prober:
+            prober.join()
+
+        self._report(results, probes, elapsed)
+        if options['metrics_token']:
+            response = requests.get(base_url + '/api/metrics/',
+                                    headers={'X-Metrics-Token': options['metrics_token']}, timeout=10)
+            self.stdout.write(f'login_hash_pool (one worker): {response.json().get("login_hash_pool")}')
+
+    def _create_users(self, emails, password):
+        existing = set(User.objects.filter(email__in=emails).values_list('email', flat=True))
+        missing = [email for email in emails if email not in existing]
+        if not missing:
+            return
+        # Hash once; hashing per user would make setup take minutes.
+        hashed = make_password(password)
+        users = User.objects.bulk_create(
+            [User(email=email, password=hashed, role='salesperson') for email in missing]
+        )
+        Profile.objects.bulk_create([Profile(user=user, full_name=user.email) for user in users])
+        self.stdout.write(f'Created {len(users)} load test users')
+
+    def _report(self, results, probes, elapsed):
+        outcomes = Counter(outcome for outcome, _ in results)
+        ok = [ms for outcome, ms in results if outcome == 200]
+        self.stdout.write(f'{len(results)} logins in {elapsed:.2f}s ({len(results) / elapsed:.1f}/s)')
+        self.stdout.write('Responses: ' + ', '.join(f'{k}: {v}' for k, v in sorted(outcomes.items(), key=str)))
+        self.stdout.write(self._latency_line('Successful login latency', ok))
+        self.stdout.write(self._latency_line('Probe latency during storm', probes))
+        if outcomes.get(200) == len(results):
+            self.stdout.write(self.style.SUCCESS('All logins succeeded'))
+        else:
+            self.stdout.write(self.style.WARNING(
+                'Some logins were shed or failed; 503s are expected once the hash queue is full'
+            ))
+
+    def _latency_line(self, label, samples):
+        if not samples:
+            return f'{label}: no samples'
+        return (
+            f'{label} (ms): p50 {percentile(samples, 50):.0f}, '
+            f'p95 {percentile(samples, 95):.0f}, p99 {percentile(samples, 99):.0f}, '
+            f'max {max(samples):.0f} (n={len(samples)})'
+        )
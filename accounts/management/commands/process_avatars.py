@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from accounts.avatars import process_avatar
+from accounts.models import Profile
+
+
+class Command(BaseCommand):
+    help = 'Make thumbnails for every pending avatar in this process (no Celery worker needed)'
+
+    def handle(self, *args, **options):
+        profile_ids = list(
+            Profile.objects.filter(avatar_status=Profile.AVATAR_PENDING).values_list('pk', flat=True)
+        )
+        for profile_id in profile_ids:
+            process_avatar(profile_id)
+
+        ready = Profile.objects.filter(pk__in=profile_ids, avatar_status=Profile.AVATAR_READY).count()
+        self.stdout.write(self.style.SUCCESS(f'Processed {len(profile_ids)} pending avatars ({ready} ready)'))
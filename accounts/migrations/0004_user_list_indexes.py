@@ -0,0 +1,27 @@
+# Generated by Django 5.2.1 on 2026-10-19 00:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_alter_user_role'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('branches', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['role', 'is_active', '-id'], name='user_role_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['branch', 'is_active', '-id'], name='user_branch_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['is_active', '-id'], name='user_active_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.1 on 2026-10-19 00:45
+
+import accounts.avatars
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_user_list_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='avatar_status',
+            field=models.CharField(choices=[('none', 'No avatar'), ('pending', 'Processing'), ('ready', 'Ready'), ('failed', 'Failed')], default='none', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='avatar_thumbnails',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AlterField(
+            model_name='profile',
+            name='avatar',
+            field=models.ImageField(blank=True, null=True, storage=accounts.avatars.staging_storage, upload_to='avatars/'),
+        ),
+    ]
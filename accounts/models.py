@@ -2,6 +2,9 @@ from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, BaseU
 from django.db import models
 from django.utils import timezone
 
+from branchpoint_backend.model_mixins import DirtyFieldsMixin
+from .avatars import staging_storage
+
 # Updated Roles
 ROLE_CHOICES = (
     ("superadmin", "Super Admin"),
@@ -28,7 +31,7 @@ class UserManager(BaseUserManager):
         extra_fields.setdefault("is_superuser", True)
         return self.create_user(email, password, **extra_fields)
 
-class User(AbstractBaseUser, PermissionsMixin):
+class User(DirtyFieldsMixin, AbstractBaseUser, PermissionsMixin):
     email = models.EmailField(unique=True)
     # Ensure max_length is sufficient for the longest role name
     role = models.CharField(max_length=20, choices=ROLE_CHOICES, default="staff") # Added default for existing users
@@ -43,14 +46,36 @@ class User(AbstractBaseUser, PermissionsMixin):
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = []
 
+    class Meta:
+        indexes = [
+            # Admin user list filters; the list is ordered by -id
+            models.Index(fields=['role', 'is_active', '-id'], name='user_role_active_idx'),
+            models.Index(fields=['branch', 'is_active', '-id'], name='user_branch_active_idx'),
+            models.Index(fields=['is_active', '-id'], name='user_active_idx'),
+        ]
+
     def __str__(self):
         return f"{self.email} ({self.role})"
 
-class Profile(models.Model):
+class Profile(DirtyFieldsMixin, models.Model):
+    AVATAR_NONE = "none"
+    AVATAR_PENDING = "pending"
+    AVATAR_READY = "ready"
+    AVATAR_FAILED = "failed"
+    AVATAR_STATUS_CHOICES = (
+        (AVATAR_NONE, "No avatar"),
+        (AVATAR_PENDING, "Processing"),
+        (AVATAR_READY, "Ready"),
+        (AVATAR_FAILED, "Failed"),
+    )
+
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="profile")
     full_name = models.CharField(max_length=100)
     phone = models.CharField(max_length=20, blank=True)
-    avatar = models.ImageField(upload_to="avatars/", null=True, blank=True)
+    # Staged original upload, cleared once thumbnails are made (see accounts/avatars.py)
+    avatar = models.ImageField(upload_to="avatars/", storage=staging_storage, null=True, blank=True)
+    avatar_thumbnails = models.JSONField(default=dict, blank=True)
+    avatar_status = models.CharField(max_length=10, choices=AVATAR_STATUS_CHOICES, default=AVATAR_NONE)
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
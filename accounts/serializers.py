@@ -1,13 +1,50 @@
 from rest_framework import serializers
 from django.contrib.auth import authenticate
 from django.contrib.auth.password_validation import validate_password
+from django.db import IntegrityError, transaction
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from .avatars import set_avatar, thumbnail_urls
 from .models import User, Profile
+from .tokens import FilteredRefreshToken
 
 
 class ProfileSerializer(serializers.ModelSerializer):
+    """
+    `avatar` is upload-only; reads return thumbnail URLs (`avatar_url` is
+    the medium size) once the background processing has finished.
+    """
+    avatar = serializers.ImageField(write_only=True, required=False, allow_null=True)
+    avatar_url = serializers.SerializerMethodField()
+    avatar_thumbnails = serializers.SerializerMethodField()
+
     class Meta:
         model = Profile
-        fields = ['full_name', 'phone', 'avatar']
+        fields = ['full_name', 'phone', 'avatar', 'avatar_url', 'avatar_thumbnails', 'avatar_status']
+        read_only_fields = ['avatar_status']
+
+    def get_avatar_thumbnails(self, obj):
+        return thumbnail_urls(obj)
+
+    def get_avatar_url(self, obj):
+        urls = thumbnail_urls(obj)
+        return urls.get('medium') if urls else None
+
+    @staticmethod
+    def apply(profile, data):
+        """Set validated fields on a profile and save it, staging any new avatar"""
+        data = dict(data)
+        has_avatar = 'avatar' in data
+        avatar = data.pop('avatar', None)
+        for attr, value in data.items():
+            setattr(profile, attr, value)
+        if has_avatar:
+            set_avatar(profile, avatar)
+        else:
+            profile.save()
+        return profile
+
+    def update(self, instance, validated_data):
+        return self.apply(instance, validated_data)
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -21,6 +58,26 @@ class UserSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'date_joined']
 
 
+class UserListSerializer(serializers.ModelSerializer):
+    """
+    Compact user representation for the admin list. The nested profile is
+    only included when the view passes `include_profile` in the context.
+    """
+    branch_name = serializers.CharField(source='branch.name', read_only=True, default=None)
+    profile = ProfileSerializer(read_only=True)
+
+    class Meta:
+        model = User
+        fields = ['id', 'email', 'role', 'branch', 'branch_name', 'is_active',
+                  'date_joined', 'profile']
+        read_only_fields = fields
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if not self.context.get('include_profile'):
+            self.fields.pop('profile')
+
+
 class UserCreateSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, validators=[validate_password])
     password_confirm = serializers.CharField(write_only=True)
@@ -29,6 +86,8 @@ class UserCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['email', 'password', 'password_confirm', 'role', 'branch', 'profile']
+        # Uniqueness is checked by the database constraint on insert
+        extra_kwargs = {'email': {'validators': []}}
     
     def validate(self, attrs):
         if attrs['password'] != attrs['password_confirm']:
@@ -38,13 +97,18 @@ class UserCreateSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         profile_data = validated_data.pop('profile')
         validated_data.pop('password_confirm')
-        user = User.objects.create_user(**validated_data)
-
-        # Update the profile created by signal
-        profile = user.profile
-        for attr, value in profile_data.items():
-            setattr(profile, attr, value)
-        profile.save()
+        try:
+            with transaction.atomic():
+                user = User.objects.create_user(**validated_data)
+
+                # Update the profile created by signal
+                ProfileSerializer.apply(user.profile, profile_data)
+        except IntegrityError:
+            # Only a taken email is the client's mistake; let any other
+            # constraint failure surface.
+            if not User.objects.filter(email=User.objects.normalize_email(validated_data['email'])).exists():
+                raise
+            raise serializers.ValidationError({'email': ['user with this email already exists.']})
 
         return user
 
@@ -67,18 +131,17 @@ class UserUpdateSerializer(serializers.ModelSerializer):
 
         # Update profile fields
         if profile_data:
-            profile = instance.profile
-            for attr, value in profile_data.items():
-                setattr(profile, attr, value)
-            profile.save()
+            ProfileSerializer.apply(instance.profile, profile_data)
         
         return instance
 
 
-class LoginSerializer(serializers.Serializer):
+class LoginCredentialsSerializer(serializers.Serializer):
     email = serializers.EmailField()
     password = serializers.CharField()
 
+
+class LoginSerializer(LoginCredentialsSerializer):
     def validate(self, attrs):
         email = attrs.get('email')
         password = attrs.get('password')
@@ -112,3 +175,8 @@ class ChangePasswordSerializer(serializers.Serializer):
         if not user.check_password(value):
             raise serializers.ValidationError('Old password is incorrect')
         return value
+
+
+class FilteredTokenRefreshSerializer(TokenRefreshSerializer):
+    """Token refresh that checks the blacklist through the in-memory JTI filter"""
+    token_class = FilteredRefreshToken
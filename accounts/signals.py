@@ -1,5 +1,8 @@
+from django.db import transaction
 from django.db.models.signals import post_save
 from django.dispatch import receiver
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from .blacklist import jti_blacklist
 from .models import User, Profile
 
 
@@ -13,9 +16,19 @@ def create_user_profile(sender, instance, created, **kwargs):
 
 
 @receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
+def save_user_profile(sender, instance, created, **kwargs):
     """
-    Save the profile when the user is saved
+    Save the profile when the user is saved, if it was loaded and changed
     """
-    if hasattr(instance, 'profile'):
-        instance.profile.save() 
\ No newline at end of file
+    if not created and User.profile.is_cached(instance) and instance.profile.is_dirty:
+        instance.profile.save()
+
+
+@receiver(post_save, sender=BlacklistedToken)
+def publish_blacklisted_token(sender, instance, created, **kwargs):
+    """
+    Add newly blacklisted JTIs to the in-memory filter of every process
+    """
+    if created:
+        jti = instance.token.jti
+        transaction.on_commit(lambda: jti_blacklist.publish(jti))
@@ -0,0 +1,21 @@
+from celery import shared_task
+
+from .avatars import delete_files, mark_failed, process_avatar
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=30, ignore_result=True)
+def process_avatar_upload(self, profile_id):
+    """Make thumbnails for a staged avatar and push them to storage"""
+    try:
+        process_avatar(profile_id)
+    except Exception as exc:
+        if self.request.retries >= self.max_retries:
+            mark_failed(profile_id)
+            raise
+        raise self.retry(exc=exc)
+
+
+@shared_task(ignore_result=True)
+def delete_avatar_files(names):
+    """Delete thumbnails of a removed avatar"""
+    delete_files(names)
@@ -1,3 +1,266 @@
-from django.test import TestCase
+import asyncio
+import threading
+import time
+import uuid
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError
+from django.test import AsyncClient, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from branches.models import Branch
+from .blacklist import BloomFilter, JTIBlacklistFilter, jti_blacklist
+from .login_pool import LoginHashPool
+from .models import User
+from .serializers import UserCreateSerializer
+
+
+def blacklist_jti(user, expires_at=None):
+    """Blacklist a made-up refresh token of `user`; returns its JTI"""
+    jti = uuid.uuid4().hex
+    token = OutstandingToken.objects.create(
+        user=user, jti=jti, token=jti, expires_at=expires_at or timezone.now() + timedelta(days=1),
+    )
+    BlacklistedToken.objects.create(token=token)
+    return jti
+
+
+class BloomFilterTests(SimpleTestCase):
+    def test_no_false_negatives(self):
+        bloom = BloomFilter(capacity=5000, error_rate=0.01)
+        items = [uuid.uuid4().hex for _ in range(5000)]
+        for item in items:
+            bloom.add(item)
+        self.assertTrue(all(item in bloom for item in items))
+        self.assertTrue(bloom.is_full)
+
+    def test_false_positive_rate_near_configured(self):
+        bloom = BloomFilter(capacity=5000, error_rate=0.01)
+        for _ in range(5000):
+            bloom.add(uuid.uuid4().hex)
+        false_positives = sum(uuid.uuid4().hex in bloom for _ in range(10000))
+        self.assertLess(false_positives, 300)
+
+
+class JTIBlacklistFilterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='filter@example.com', password='pass')
+
+    def setUp(self):
+        self.filter = JTIBlacklistFilter()
+        # In sync, without the Redis subscription thread
+        self.filter._subscriber = object()
+        self.filter._in_sync.set()
+
+    def test_blacklisted_jtis_are_never_missed(self):
+        loaded = [blacklist_jti(self.user) for _ in range(50)]
+        self.filter.load()
+        added = [blacklist_jti(self.user) for _ in range(10)]
+        for jti in added:
+            self.filter.add(jti)
+
+        self.assertTrue(all(self.filter.is_blacklisted(jti) for jti in loaded + added))
+        self.assertFalse(self.filter.is_blacklisted(uuid.uuid4().hex))
+
+    def test_load_skips_expired_tokens(self):
+        blacklist_jti(self.user, expires_at=timezone.now() - timedelta(minutes=1))
+        current = blacklist_jti(self.user)
+        self.filter.load()
+        self.assertEqual(self.filter.stats()['entries'], 1)
+        self.assertTrue(self.filter.might_contain(current))
+
+    def test_jti_blacklisted_during_load_is_kept(self):
+        early = blacklist_jti(self.user)
+        late = uuid.uuid4().hex
+
+        def jtis():
+            yield early
+            self.filter.add(late)  # e.g. a logout while the query runs
+
+        with mock.patch('accounts.blacklist.BlacklistedToken.objects.filter') as query:
+            query.return_value.values_list.return_value.iterator.return_value = jtis()
+            self.filter.load()
+        self.assertTrue(self.filter.might_contain(early))
+        self.assertTrue(self.filter.might_contain(late))
+
+    def test_own_publish_counts_once(self):
+        self.filter.load()
+        jti = blacklist_jti(self.user)
+        with mock.patch('accounts.blacklist.get_redis'):
+            self.filter.publish(jti)
+        # The process then hears its own message, possibly twice.
+        self.filter.add(jti)
+        self.filter.add(jti)
+        self.assertEqual(self.filter.stats()['entries'], 1)
+
+    @override_settings(TOKEN_BLACKLIST_FILTER={
+        'ENABLED': True, 'CAPACITY': 3, 'ERROR_RATE': 0.01, 'CHANNEL': 'test',
+    })
+    def test_reloads_when_full_dropping_expired_entries(self):
+        current = blacklist_jti(self.user)
+        self.filter.load()
+        expired = [blacklist_jti(self.user, expires_at=timezone.now() + timedelta(seconds=1)) for _ in range(2)]
+        for jti in expired:
+            self.filter.add(jti)
+        self.assertTrue(self.filter._filter.is_full)
+
+        with mock.patch.object(self.filter, '_reload', side_effect=self.filter.load) as reload:
+            # Loaded less than ten minutes ago: not yet
+            self.filter._reload_if_full()
+            reload.assert_not_called()
+
+            OutstandingToken.objects.filter(jti__in=expired).update(expires_at=timezone.now())
+            self.filter._loaded_at = time.monotonic() - 601
+            self.filter._reload_if_full()
+            reload.assert_called_once()
+
+        self.assertEqual(self.filter.stats()['entries'], 1)
+        self.assertFalse(self.filter._filter.is_full)
+        self.assertTrue(self.filter.is_blacklisted(current))
+
+    def test_out_of_sync_filter_checks_the_database(self):
+        self.filter.load()
+        jti = blacklist_jti(self.user)  # never published to this process
+        self.filter._in_sync.clear()
+        self.assertTrue(self.filter.is_blacklisted(jti))
+        self.assertEqual(self.filter.stats()['db_checks'], 1)
+
+
+@override_settings(ALLOWED_HOSTS=['*'])
+class TokenRefreshBlacklistTests(TestCase):
+    url = '/api/accounts/token/refresh/'
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='refresh@example.com', password='pass')
+        patcher = mock.patch.object(jti_blacklist, '_ensure_started')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(setattr, jti_blacklist, '_filter', None)
+        self.addCleanup(jti_blacklist._in_sync.clear)
+        jti_blacklist.load()
+        jti_blacklist._in_sync.set()
+
+    def test_refresh_rejects_token_blacklisted_after_load(self):
+        token = RefreshToken.for_user(self.user)
+        with mock.patch('accounts.blacklist.get_redis'), self.captureOnCommitCallbacks(execute=True):
+            token.blacklist()
+
+        response = APIClient().post(self.url, {'refresh': str(token)}, format='json')
+        self.assertEqual(response.status_code, 401)
+
+    def test_refresh_accepts_valid_token_without_a_blacklist_query(self):
+        token = RefreshToken.for_user(self.user)
+        hits = jti_blacklist.filter_hits
+        response = APIClient().post(self.url, {'refresh': str(token)}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(jti_blacklist.filter_hits, hits + 1)
+
+
+@override_settings(ALLOWED_HOSTS=['*'])
+class UserCreateTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.branch = Branch.objects.create(name='Registration branch')
+
+    def payload(self, email='new@example.com'):
+        return {
+            'email': email,
+            'password': 'Regist-ration-123',
+            'password_confirm': 'Regist-ration-123',
+            'role': 'staff',
+            'branch': self.branch.pk,
+            'profile': {'full_name': 'New User'},
+        }
+
+    def test_create_queries(self):
+        serializer = UserCreateSerializer(data=self.payload())
+        # Branch lookup, savepoint, user and profile inserts, the user
+        # signal's managed-branch lookup, profile update, release. No
+        # query checks the email first: the unique constraint does.
+        with self.assertNumQueries(7) as ctx:
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+        self.assertFalse([q for q in ctx.captured_queries if 'SELECT' in q['sql'] and '"email"' in q['sql']])
+
+    def test_duplicate_email(self):
+        User.objects.create_user(email='taken@example.com', password='pass')
+        response = APIClient().post('/api/accounts/register/', self.payload('taken@example.com'), format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'email': ['user with this email already exists.']})
+        self.assertEqual(User.objects.filter(email='taken@example.com').count(), 1)
+
+    def test_other_integrity_errors_are_not_reported_as_duplicate_email(self):
+        serializer = UserCreateSerializer(data=self.payload())
+        serializer.is_valid(raise_exception=True)
+        with mock.patch('accounts.serializers.ProfileSerializer.apply', side_effect=IntegrityError('profile')):
+            with self.assertRaisesMessage(IntegrityError, 'profile'):
+                serializer.save()
+        self.assertFalse(User.objects.filter(email='new@example.com').exists())
+
+
+# As in the ASGI workers, without the sync-only WhiteNoise middleware that
+# would run the view on a single thread, one login at a time.
+@override_settings(ALLOWED_HOSTS=['*'], MIDDLEWARE=[m for m in settings.MIDDLEWARE if 'whitenoise' not in m])
+class AsyncLoginTests(TransactionTestCase):
+    # Not TestCase: the pool's threads use their own connections, which
+    # wouldn't see the test's uncommitted user.
+    url = '/api/accounts/login/async/'
+
+    def setUp(self):
+        self.pool = LoginHashPool()
+        patcher = mock.patch('accounts.views.login_pool', self.pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def login(self, email, password):
+        return await AsyncClient().post(
+            self.url, {'email': email, 'password': password}, content_type='application/json'
+        )
+
+    async def test_rejects_bad_credentials(self):
+        await sync_to_async(User.objects.create_user)(email='login@example.com', password='Right-pass-123')
+
+        for email, password in (('login@example.com', 'wrong'), ('nobody@example.com', 'Right-pass-123')):
+            response = await self.login(email, password)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json(), {'non_field_errors': ['Invalid credentials']})
+
+        response = await self.login('login@example.com', 'Right-pass-123')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.json()['tokens']), {'refresh', 'access'})
+        self.assertEqual(self.pool.stats()['completed'], 3)
+
+    @override_settings(LOGIN_HASH_POOL={'WORKERS': 1, 'QUEUE_SIZE': 1, 'QUEUE_TIMEOUT': 10})
+    async def test_sheds_logins_beyond_the_pool(self):
+        release = threading.Event()
+
+        def slow_authenticate(**credentials):
+            release.wait(5)
+            return None
+
+        with mock.patch('accounts.login_pool.authenticate', side_effect=slow_authenticate):
+            admitted = [asyncio.create_task(self.login('login@example.com', 'pass')) for _ in range(2)]
+            for _ in range(500):
+                if self.pool.stats()['running'] + self.pool.stats()['queued'] == 2:
+                    break
+                await asyncio.sleep(0.01)
+            self.assertEqual((self.pool.stats()['running'], self.pool.stats()['queued']), (1, 1))
+
+            shed = await self.login('login@example.com', 'pass')
+            self.assertEqual(shed.status_code, 503)
+            self.assertEqual(shed['Retry-After'], '1')
+
+            release.set()
+            responses = await asyncio.wait_for(asyncio.gather(*admitted), 5)
+
+        self.assertEqual([response.status_code for response in responses], [400, 400])
+        stats = self.pool.stats()
+        self.assertEqual((stats['running'], stats['queued']), (0, 0))
+        self.assertEqual((stats['completed'], stats['rejected']), (2, 1))
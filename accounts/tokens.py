@@ -0,0 +1,19 @@
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from django.utils.translation import gettext_lazy as _
+
+from .blacklist import jti_blacklist
+
+
+class FilteredRefreshToken(RefreshToken):
+    """
+    Refresh token whose blacklist check consults the in-memory JTI filter
+    before querying the blacklist tables.
+    """
+
+    def check_blacklist(self):
+        jti = self.payload[api_settings.JTI_CLAIM]
+
+        if jti_blacklist.is_blacklisted(jti):
+            raise TokenError(_("Token is blacklisted"))
@@ -3,7 +3,7 @@ from rest_framework_simplejwt.views import (
     TokenObtainPairView, TokenRefreshView, TokenVerifyView
 )
 from .views import (
-    RegisterUserView, LoginView, MeView, UserListView, UserDetailView,
+    RegisterUserView, LoginView, async_login, MeView, UserListView, UserDetailView,
     ChangePasswordView, LogoutView, ProfileUpdateView, check_email, user_stats
 )
 
@@ -13,6 +13,7 @@ urlpatterns = [
     # Authentication endpoints
     path('register/', RegisterUserView.as_view(), name='register'),
     path('login/', LoginView.as_view(), name='login'),
+    path('login/async/', async_login, name='login-async'),
     path('logout/', LogoutView.as_view(), name='logout'),
     path('me/', MeView.as_view(), name='me'),
     
@@ -1,17 +1,38 @@
+import json
+
+from asgiref.sync import sync_to_async
 from rest_framework import status, generics, permissions
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import authenticate
+from django.http import JsonResponse
 from django.shortcuts import get_object_or_404
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from .login_pool import login_pool, LoginQueueFull, LoginQueueTimeout
 from .models import User, Profile
+from .pagination import UserCursorPagination
+from .tokens import FilteredRefreshToken
 from .serializers import (
-    UserSerializer, UserCreateSerializer, UserUpdateSerializer,
-    LoginSerializer, ChangePasswordSerializer, ProfileSerializer
+    UserSerializer, UserListSerializer, UserCreateSerializer, UserUpdateSerializer,
+    LoginSerializer, LoginCredentialsSerializer, ChangePasswordSerializer, ProfileSerializer
 )
 
 
+def login_response_data(user):
+    """User details and a fresh token pair, as returned by the login endpoints"""
+    refresh = RefreshToken.for_user(user)
+    return {
+        'user': UserSerializer(user).data,
+        'tokens': {
+            'refresh': str(refresh),
+            'access': str(refresh.access_token),
+        }
+    }
+
+
 class RegisterUserView(generics.CreateAPIView):
     """Register a new user"""
     queryset = User.objects.all()
@@ -22,17 +43,7 @@ class RegisterUserView(generics.CreateAPIView):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         user = serializer.save()
-        
-        # Generate tokens
-        refresh = RefreshToken.for_user(user)
-        
-        return Response({
-            'user': UserSerializer(user).data,
-            'tokens': {
-                'refresh': str(refresh),
-                'access': str(refresh.access_token),
-            }
-        }, status=status.HTTP_201_CREATED)
+        return Response(login_response_data(user), status=status.HTTP_201_CREATED)
 
 
 class LoginView(APIView):
@@ -43,17 +54,47 @@ class LoginView(APIView):
         serializer = LoginSerializer(data=request.data, context={'request': request})
         serializer.is_valid(raise_exception=True)
         user = serializer.validated_data['user']
-        
-        # Generate tokens
-        refresh = RefreshToken.for_user(user)
-        
-        return Response({
-            'user': UserSerializer(user).data,
-            'tokens': {
-                'refresh': str(refresh),
-                'access': str(refresh.access_token),
-            }
-        })
+        return Response(login_response_data(user))
+
+
+@csrf_exempt
+@require_POST
+async def async_login(request):
+    """
+    Login user and return tokens, hashing the password off the event loop.
+
+    Same request and response as LoginView, but meant to be served by the
+    ASGI workers: the password check runs on the bounded login hash pool,
+    and when that pool is saturated the login is shed with a 503.
+    """
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        data = request.POST
+    serializer = LoginCredentialsSerializer(data=data)
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        user = await login_pool.authenticate(
+            request, serializer.validated_data['email'], serializer.validated_data['password']
+        )
+    except (LoginQueueFull, LoginQueueTimeout):
+        response = JsonResponse({
+            'error': True,
+            'message': 'Too many logins in progress, please try again shortly'
+        }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        response['Retry-After'] = '1'
+        return response
+
+    if not user:
+        return JsonResponse({'non_field_errors': ['Invalid credentials']},
+                            status=status.HTTP_400_BAD_REQUEST)
+    if not user.is_active:
+        return JsonResponse({'non_field_errors': ['User account is disabled']},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+    return JsonResponse(await sync_to_async(login_response_data)(user))
 
 
 class MeView(generics.RetrieveUpdateAPIView):
@@ -66,10 +107,50 @@ class MeView(generics.RetrieveUpdateAPIView):
 
 
 class UserListView(generics.ListAPIView):
-    """List all users (admin only)"""
-    queryset = User.objects.all()
-    serializer_class = UserSerializer
+    """
+    List users (admin only).
+
+    Filters: `role`, `branch` (id), `is_active` (true/false).
+    Pass `include=profile` to nest each user's profile.
+    """
+    serializer_class = UserListSerializer
     permission_classes = [permissions.IsAdminUser]
+    pagination_class = UserCursorPagination
+
+    def include_profile(self):
+        return 'profile' in self.request.query_params.get('include', '').split(',')
+
+    def get_queryset(self):
+        queryset = User.objects.select_related('branch')
+        if self.include_profile():
+            queryset = queryset.select_related('profile')
+
+        params = self.request.query_params
+        role = params.get('role')
+        if role:
+            queryset = queryset.filter(role=role)
+
+        branch = params.get('branch')
+        if branch:
+            if branch == 'none':
+                queryset = queryset.filter(branch__isnull=True)
+            elif branch.isdigit():
+                queryset = queryset.filter(branch_id=branch)
+            else:
+                queryset = queryset.none()
+
+        is_active = params.get('is_active', '').lower()
+        if is_active in ('true', '1'):
+            queryset = queryset.filter(is_active=True)
+        elif is_active in ('false', '0'):
+            queryset = queryset.filter(is_active=False)
+
+        return queryset
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['include_profile'] = self.include_profile()
+        return context
 
 
 class UserDetailView(generics.RetrieveUpdateDestroyAPIView):
@@ -102,7 +183,7 @@ class LogoutView(APIView):
         try:
             refresh_token = request.data.get('refresh_token')
             if refresh_token:
-                token = RefreshToken(refresh_token)
+                token = FilteredRefreshToken(refresh_token)
                 token.blacklist()
             return Response({'message': 'Logged out successfully'})
         except Exception:
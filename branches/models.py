@@ -4,8 +4,10 @@ from django.core.exceptions import ValidationError
 from django.db.models import Count, Sum
 from django.utils import timezone
 
+from branchpoint_backend.model_mixins import DirtyFieldsMixin
 
-class Branch(models.Model):
+
+class Branch(DirtyFieldsMixin, models.Model):
     name = models.CharField(max_length=100, unique=True)
     location = models.CharField(max_length=255, blank=True)
     description = models.TextField(blank=True)
@@ -30,10 +32,15 @@ class Branch(models.Model):
 
     def clean(self):
         """Custom validation"""
-        if self.manager and self.manager.role != 'manager':
+        # Only a newly set manager needs checking, which avoids loading
+        # the manager on every save.
+        if not self.manager_id or not self.has_changed('manager'):
+            return
+
+        if self.manager.role != 'manager':
             raise ValidationError('Manager must have role "manager"')
         
-        if self.manager and self.manager.branch != self:
+        if self.manager.branch_id != self.pk:
             raise ValidationError('Manager must be assigned to this branch')
 
     def save(self, *args, **kwargs):
@@ -93,11 +100,12 @@ class Branch(models.Model):
             raise ValidationError('User must have role "manager"')
         
         # Remove user from any other branch management
-        if hasattr(user, 'managed_branch') and user.managed_branch:
-            user.managed_branch.manager = None
-            user.managed_branch.save()
+        previous = getattr(user, 'managed_branch', None)
+        if previous and previous != self:
+            previous.manager = None
+            previous.save()
         
-        # Assign to this branch
+        # Assign to this branch; saves that change nothing are skipped
         self.manager = user
         user.branch = self
         self.save()
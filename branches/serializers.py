@@ -1,9 +1,12 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
 from .models import Branch
 
 User = get_user_model()
 
+DUPLICATE_BRANCH_NAME = 'Branch with this name already exists.'
+
 
 class BranchSerializer(serializers.ModelSerializer):
     """Basic branch serializer for reading"""
@@ -34,12 +37,8 @@ class BranchCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Branch
         fields = ['name', 'location', 'description', 'is_active', 'manager_id']
-    
-    def validate_name(self, value):
-        """Ensure branch name is unique"""
-        if Branch.objects.filter(name=value).exists():
-            raise serializers.ValidationError('Branch with this name already exists.')
-        return value
+        # Uniqueness is checked by the database constraint on save
+        extra_kwargs = {'name': {'validators': []}}
     
     def validate_manager_id(self, value):
         """Validate manager assignment"""
@@ -56,7 +55,13 @@ class BranchCreateSerializer(serializers.ModelSerializer):
     
     def create(self, validated_data):
         manager_id = validated_data.pop('manager_id', None)
-        branch = Branch.objects.create(**validated_data)
+        try:
+            with transaction.atomic():
+                branch = Branch.objects.create(**validated_data)
+        except IntegrityError:
+            if not Branch.objects.filter(name=validated_data['name']).exists():
+                raise
+            raise serializers.ValidationError({'name': [DUPLICATE_BRANCH_NAME]})
         
         if manager_id:
             user = User.objects.get(id=manager_id)
@@ -72,13 +77,8 @@ class BranchUpdateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Branch
         fields = ['name', 'location', 'description', 'is_active', 'manager_id']
-    
-    def validate_name(self, value):
-        """Ensure branch name is unique (excluding current instance)"""
-        instance = self.instance
-        if Branch.objects.filter(name=value).exclude(id=instance.id).exists():
-            raise serializers.ValidationError('Branch with this name already exists.')
-        return value
+        # Uniqueness is checked by the database constraint on save
+        extra_kwargs = {'name': {'validators': []}}
     
     def validate_manager_id(self, value):
         """Validate manager assignment"""
@@ -100,7 +100,13 @@ class BranchUpdateSerializer(serializers.ModelSerializer):
         # Update branch fields
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
-        instance.save()
+        try:
+            with transaction.atomic():
+                instance.save()
+        except IntegrityError:
+            if not Branch.objects.filter(name=instance.name).exclude(pk=instance.pk).exists():
+                raise
+            raise serializers.ValidationError({'name': [DUPLICATE_BRANCH_NAME]})
         
         # Handle manager assignment
         if manager_id is not None:
@@ -34,10 +34,13 @@ def handle_branch_delete(sender, instance, **kwargs):
 
 
 @receiver(post_save, sender=User)
-def handle_user_branch_assignment(sender, instance, **kwargs):
+def handle_user_branch_assignment(sender, instance, created, **kwargs):
     """
     Handle user branch assignment changes
     """
+    if not created and not (instance.has_changed('role') or instance.has_changed('branch')):
+        return
+
     # If user is a manager and has a managed_branch, ensure they're assigned to that branch
     if instance.role == 'manager' and hasattr(instance, 'managed_branch') and instance.managed_branch:
         if instance.branch != instance.managed_branch:
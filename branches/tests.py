@@ -1,3 +1,38 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.db import IntegrityError
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from accounts.models import User
+from .models import Branch
+from .serializers import DUPLICATE_BRANCH_NAME, BranchCreateSerializer
+
+
+@override_settings(ALLOWED_HOSTS=['*'])
+class BranchCreateTests(TestCase):
+    def test_create_queries(self):
+        serializer = BranchCreateSerializer(data={'name': 'Westlands', 'location': 'Nairobi'})
+        # The insert and the search index entry (lookup and insert), with
+        # their savepoints. No query checks the name first: the unique
+        # constraint does.
+        with self.assertNumQueries(9) as ctx:
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+        self.assertFalse([q for q in ctx.captured_queries if 'FROM "branches_branch"' in q['sql']])
+
+    def test_duplicate_name(self):
+        Branch.objects.create(name='Westlands')
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(email='admin@example.com', role='superadmin'))
+        response = client.post('/api/branches/', {'name': 'Westlands'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'name': [DUPLICATE_BRANCH_NAME]})
+        self.assertEqual(Branch.objects.filter(name='Westlands').count(), 1)
+
+    def test_other_integrity_errors_are_not_reported_as_duplicate_name(self):
+        serializer = BranchCreateSerializer(data={'name': 'Westlands'})
+        serializer.is_valid(raise_exception=True)
+        with mock.patch('branches.serializers.Branch.objects.create', side_effect=IntegrityError('other')):
+            with self.assertRaisesMessage(IntegrityError, 'other'):
+                serializer.save()
@@ -4,7 +4,6 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.shortcuts import get_object_or_404
 from django.contrib.auth import get_user_model
-from django.db.models import Q
 from .models import Branch
 from .serializers import (
     BranchSerializer, BranchCreateSerializer, BranchUpdateSerializer,
@@ -12,6 +11,8 @@ from .serializers import (
     AvailableManagerSerializer
 )
 from accounts.permissions import IsSuperAdmin, IsManagerOrSuperAdmin, IsBranchManager
+from search.backends import search_objects
+from search.views import MAX_RESULTS, branch_scope
 
 User = get_user_model()
 
@@ -198,7 +199,7 @@ class AvailableManagersView(generics.ListAPIView):
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def branch_search(request):
-    """Search branches by name or location"""
+    """Search branches by name, location or description, best match first"""
     query = request.query_params.get('q', '')
     
     if not query:
@@ -210,28 +211,21 @@ def branch_search(request):
     user = request.user
     
     if user.role == 'superadmin':
-        branches = Branch.objects.filter(
-            Q(name__icontains=query) | Q(location__icontains=query)
-        )
+        branches = Branch.objects.all()
     elif user.role == 'manager':
         if hasattr(user, 'managed_branch') and user.managed_branch:
-            branches = Branch.objects.filter(
-                Q(id=user.managed_branch.id) &
-                (Q(name__icontains=query) | Q(location__icontains=query))
-            )
+            branches = Branch.objects.filter(id=user.managed_branch.id)
         else:
             branches = Branch.objects.none()
     elif user.role == 'staff':
         if user.branch:
-            branches = Branch.objects.filter(
-                Q(id=user.branch.id) &
-                (Q(name__icontains=query) | Q(location__icontains=query))
-            )
+            branches = Branch.objects.filter(id=user.branch.id)
         else:
             branches = Branch.objects.none()
     else:
         branches = Branch.objects.none()
     
+    branches = search_objects(branches, 'branch', query, branch_scope(user), MAX_RESULTS)
     serializer = BranchSerializer(branches, many=True)
     return Response(serializer.data)
 
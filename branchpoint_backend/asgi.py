@@ -2,6 +2,9 @@
 ASGI config for branchpoint_backend project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Run it with WORKER_TYPE=asgi, e.g.
+``uvicorn branchpoint_backend.asgi:application --workers 4``; the async
+login endpoint is meant to be served from these workers.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -14,3 +17,9 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'branchpoint_backend.settings')
 
 application = get_asgi_application()
+
+# Build the refresh token blacklist filter now rather than on the first
+# refresh request.
+from accounts.blacklist import jti_blacklist
+
+jti_blacklist.start()
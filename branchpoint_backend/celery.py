@@ -0,0 +1,17 @@
+"""
+Celery application for background work.
+
+Start a worker with `celery -A branchpoint_backend worker -l info` (and set
+WORKER_TYPE=celery so it gets the smaller database pool). Tasks live in
+each app's tasks.py and are discovered automatically.
+"""
+
+import os
+
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'branchpoint_backend.settings')
+
+app = Celery('branchpoint_backend')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
@@ -0,0 +1,123 @@
+"""
+Process-level runtime metrics.
+
+Apps register a callable returning a JSON-serialisable dict under a name;
+`GET /api/metrics/` returns every registered section. Numbers are per
+process (the worker that served the request), so scrape each worker or
+aggregate on the collector side.
+"""
+
+import hmac
+import logging
+import threading
+from collections import deque
+
+from django.conf import settings
+from django.db import connections
+from rest_framework import permissions
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
+from rest_framework.response import Response
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+logger = logging.getLogger(__name__)
+
+_collectors = {}
+
+
+def register_metrics(name, collector):
+    """Expose `collector()` under `name` on the metrics endpoint"""
+    _collectors[name] = collector
+
+
+def collect_metrics():
+    data = {'worker_type': settings.WORKER_TYPE}
+    for name, collector in _collectors.items():
+        try:
+            data[name] = collector()
+        except Exception:
+            logger.exception('Metrics collector %s failed', name)
+            data[name] = None
+    return data
+
+
+def percentile(samples, percent):
+    if not samples:
+        return 0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class LatencyStats:
+    """Rolling window of latency samples in milliseconds"""
+
+    def __init__(self, size=1000):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, ms):
+        with self._lock:
+            self._samples.append(ms)
+
+    def summary(self):
+        with self._lock:
+            samples = list(self._samples)
+        return {
+            'avg': round(sum(samples) / len(samples), 2) if samples else 0,
+            'p50': round(percentile(samples, 50), 2),
+            'p95': round(percentile(samples, 95), 2),
+            'max': round(max(samples), 2) if samples else 0,
+        }
+
+
+def database_pool_stats():
+    """Connection pool usage for every pooled database alias"""
+    stats = {}
+    for alias in connections:
+        pool = getattr(connections[alias], 'pool', None)
+        if pool is None:
+            continue
+        raw = pool.get_stats()
+        stats[alias] = {
+            'min_size': raw.get('pool_min'),
+            'max_size': raw.get('pool_max'),
+            'size': raw.get('pool_size', 0),
+            'available': raw.get('pool_available', 0),
+            'in_use': raw.get('pool_size', 0) - raw.get('pool_available', 0),
+            'waiting': raw.get('requests_waiting', 0),
+            'requests': raw.get('requests_num', 0),
+            'requests_queued': raw.get('requests_queued', 0),
+            'wait_ms_total': raw.get('requests_wait_ms', 0),
+            'wait_ms_avg': (
+                raw.get('requests_wait_ms', 0) / raw['requests_queued']
+                if raw.get('requests_queued') else 0
+            ),
+            'timeouts': raw.get('requests_errors', 0),
+            'connections_opened': raw.get('connections_num', 0),
+            'connection_errors': raw.get('connections_errors', 0),
+        }
+    return stats
+
+
+register_metrics('database_pools', database_pool_stats)
+
+
+class IsAdminOrMetricsToken(permissions.BasePermission):
+    """
+    Allow staff users, or a scraper presenting `METRICS_TOKEN` in the
+    `X-Metrics-Token` header.
+    """
+    def has_permission(self, request, view):
+        token = settings.METRICS_TOKEN
+        presented = request.headers.get('X-Metrics-Token', '')
+        if token and hmac.compare_digest(presented, token):
+            return True
+        return bool(request.user and request.user.is_staff)
+
+
+@api_view(['GET'])
+@authentication_classes([JWTAuthentication])
+@permission_classes([IsAdminOrMetricsToken])
+def metrics(request):
+    """Get runtime metrics for this worker process"""
+    return Response(collect_metrics())
@@ -0,0 +1,107 @@
+import hashlib
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from .routers import allow_replica_reads, finish_request, replica_aliases, start_request
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+PIN_COOKIE = 'bp_primary_pin'
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Let read-only requests use the read replicas, with read-your-writes.
+
+    A client that has just written is pinned to the primary for
+    `DATABASE_REPLICA_PIN_SECONDS` so it doesn't read stale data from a
+    lagging replica. The pin is kept both in a cookie and in the cache under
+    the client's Authorization header, because JWT clients don't always send
+    cookies. Views that must never read from a replica can set
+    `use_primary_db = True` (or use the `primary_db` decorator).
+
+    Works in both sync and async stacks, so async views under ASGI don't
+    get pushed onto a thread.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = bool(replica_aliases())
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.enabled:
+            return self.get_response(request)
+
+        tokens = start_request()
+        try:
+            response = self.get_response(request)
+        finally:
+            wrote = finish_request(tokens)
+
+        if (wrote or request.method not in SAFE_METHODS) and response.status_code < 400:
+            self._pin(request, response)
+        return response
+
+    async def __acall__(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+
+        tokens = start_request()
+        try:
+            response = await self.get_response(request)
+        finally:
+            wrote = finish_request(tokens)
+
+        if (wrote or request.method not in SAFE_METHODS) and response.status_code < 400:
+            await sync_to_async(self._pin)(request, response)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if (
+            self.enabled
+            and request.method in SAFE_METHODS
+            and not self._wants_primary(view_func)
+            and not self._is_pinned(request)
+        ):
+            allow_replica_reads()
+        return None
+
+    def _wants_primary(self, view_func):
+        view_class = getattr(view_func, 'cls', None) or getattr(view_func, 'view_class', None)
+        return (
+            getattr(view_func, 'use_primary_db', False)
+            or getattr(view_class, 'use_primary_db', False)
+        )
+
+    def _pin_key(self, request):
+        auth = request.META.get('HTTP_AUTHORIZATION')
+        if not auth:
+            return None
+        return 'db-pin:' + hashlib.sha256(auth.encode()).hexdigest()[:32]
+
+    def _is_pinned(self, request):
+        if request.COOKIES.get(PIN_COOKIE):
+            return True
+        key = self._pin_key(request)
+        return bool(key and cache.get(key))
+
+    def _pin(self, request, response):
+        window = settings.DATABASE_REPLICA_PIN_SECONDS
+        response.set_cookie(PIN_COOKIE, '1', max_age=window, httponly=True, samesite='Lax')
+        key = self._pin_key(request)
+        if key:
+            cache.set(key, True, timeout=window)
+
+
+def primary_db(view):
+    """Mark a view as needing the primary database even for GET requests"""
+    view.use_primary_db = True
+    return view
@@ -0,0 +1,89 @@
+"""
+Shared model mixins.
+"""
+
+
+class DirtyFieldsMixin:
+    """
+    Track which fields changed since the instance was loaded or last saved.
+
+    A plain `save()` on an existing row only writes the changed fields
+    (plus any `auto_now` fields) and does nothing at all when nothing
+    changed, so no-op saves don't hit the database or fire signals.
+    `has_changed()` and `get_dirty_fields()` stay accurate until `save()`
+    returns, so `clean()` and `post_save` receivers can use them to skip
+    work. Passing `update_fields` explicitly bypasses the tracking.
+
+    Values are compared with `==` against the loaded values, so in-place
+    changes to mutable values (e.g. a dict in a JSONField) aren't seen.
+    """
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._snapshot()
+        return instance
+
+    def _snapshot(self, attnames=None):
+        loaded = self.__dict__.setdefault('_loaded_values', {})
+        if attnames is None:
+            loaded.clear()
+            attnames = [f.attname for f in self._meta.concrete_fields]
+        for attname in attnames:
+            if attname in self.__dict__:
+                loaded[attname] = self.__dict__[attname]
+
+    def get_dirty_fields(self):
+        """Return {field name: loaded value} for every changed field"""
+        loaded = self.__dict__.get('_loaded_values', {})
+        dirty = {}
+        for field in self._meta.concrete_fields:
+            if field.attname not in self.__dict__:
+                # Deferred and never loaded, so it can't have changed
+                continue
+            if self._state.adding or field.attname not in loaded:
+                dirty[field.name] = None
+            elif self.__dict__[field.attname] != loaded[field.attname]:
+                dirty[field.name] = loaded[field.attname]
+        return dirty
+
+    def has_changed(self, field_name):
+        """Whether `field_name` changed; always True for unsaved instances"""
+        if self._state.adding:
+            return True
+        return field_name in self.get_dirty_fields()
+
+    @property
+    def is_dirty(self):
+        return self._state.adding or bool(self.get_dirty_fields())
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if (
+            not args
+            and update_fields is None
+            and not self._state.adding
+            and not kwargs.get('force_insert')
+        ):
+            dirty = set(self.get_dirty_fields())
+            if not dirty:
+                return
+            if self._meta.pk.name not in dirty:
+                dirty.update(
+                    f.name for f in self._meta.concrete_fields if getattr(f, 'auto_now', False)
+                )
+                kwargs['update_fields'] = dirty
+
+        super().save(*args, **kwargs)
+
+        if update_fields is None:
+            self._snapshot()
+        else:
+            self._snapshot([self._meta.get_field(name).attname for name in update_fields])
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        if fields is None:
+            self._snapshot()
+        else:
+            self._snapshot([self._meta.get_field(name).attname for name in fields])
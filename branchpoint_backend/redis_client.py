@@ -0,0 +1,29 @@
+"""
+Shared Redis connection for the project.
+
+Used for cross-worker state (pub/sub notifications, locks, counters) that
+doesn't belong in the database.
+"""
+
+import threading
+
+import redis
+from django.conf import settings
+
+_client = None
+_lock = threading.Lock()
+
+
+def get_redis():
+    """Return the process-wide Redis client, creating it on first use"""
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = redis.Redis.from_url(
+                    settings.REDIS_URL,
+                    socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT,
+                    socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+                    health_check_interval=30,
+                )
+    return _client
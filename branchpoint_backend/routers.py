@@ -0,0 +1,68 @@
+"""
+Database router that sends reads to replicas when it is safe to do so.
+
+Reads only go to a replica while `ReplicaRoutingMiddleware` has marked the
+current request as replica-safe (a GET/HEAD/OPTIONS request from a client
+that hasn't written recently). Everything else - writes, management
+commands, Celery tasks, and any read after the request has written -
+uses the primary.
+"""
+
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+
+PRIMARY_DB = 'default'
+
+_use_replica = ContextVar('use_replica', default=False)
+_has_written = ContextVar('has_written', default=False)
+
+
+def replica_aliases():
+    return settings.DATABASE_REPLICAS
+
+
+def start_request():
+    """Reset routing state at the start of a request; reads use the primary"""
+    return _use_replica.set(False), _has_written.set(False)
+
+
+def allow_replica_reads():
+    """Route reads in the current request to a replica"""
+    _use_replica.set(True)
+
+
+def finish_request(tokens):
+    """Restore routing state and report whether the request wrote anything"""
+    wrote = _has_written.get()
+    use_replica_token, has_written_token = tokens
+    _use_replica.reset(use_replica_token)
+    _has_written.reset(has_written_token)
+    return wrote
+
+
+class PrimaryReplicaRouter:
+    """Writes go to the primary, replica-safe reads to a random replica"""
+
+    def db_for_read(self, model, **hints):
+        if _use_replica.get():
+            replicas = replica_aliases()
+            if replicas:
+                return random.choice(replicas)
+        return PRIMARY_DB
+
+    def db_for_write(self, model, **hints):
+        # Anything read after this point in the request must see the write.
+        _use_replica.set(False)
+        _has_written.set(True)
+        return PRIMARY_DB
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas normally get their schema through replication, but
+        # allowing migrations lets a local SQLite "replica" be created with
+        # `migrate --database=replica_1`.
+        return True
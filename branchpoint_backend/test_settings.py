@@ -0,0 +1,30 @@
+"""
+Settings for `manage.py test`, which picks them up by default (see
+manage.py). The database still comes from the environment; Redis isn't
+needed, tests that exercise it use fakeredis.
+"""
+
+import copy
+import tempfile
+from pathlib import Path
+
+from .settings import *  # noqa: F401,F403
+from .settings import DATABASES
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    # A file rather than Django's shared in-memory database, so that
+    # connections really close and the replica below is a connection of
+    # its own, as they are with PostgreSQL.
+    DATABASES['default'].setdefault('TEST', {})['NAME'] = str(
+        Path(tempfile.gettempdir()) / 'branchpoint_test.sqlite3'
+    )
+
+# A replica mirroring the test database, for the router's tests. Reads only
+# go to it where a test adds it to DATABASE_REPLICAS.
+DATABASES['replica'] = {**copy.deepcopy(DATABASES['default']), 'TEST': {'MIRROR': 'default'}}
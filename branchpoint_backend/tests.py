@@ -0,0 +1,140 @@
+from types import SimpleNamespace
+from unittest import mock, skipUnless
+
+from django.core.cache import cache
+from django.db import connection
+from django.http import JsonResponse
+from django.test import TestCase, override_settings
+from django.urls import path
+from django.utils.crypto import get_random_string
+
+from rest_framework.test import APIClient
+
+from accounts.models import User
+from branches.models import Branch
+from .metrics import database_pool_stats
+from .middleware import PIN_COOKIE
+
+
+def read_view(request):
+    return JsonResponse({'db': User.objects.all().db})
+
+
+def write_view(request):
+    Branch.objects.create(name=f'Router test {get_random_string(8)}')
+    return JsonResponse({'db': User.objects.all().db})
+
+
+urlpatterns = [
+    path('read/', read_view),
+    path('write/', write_view),
+]
+
+
+@override_settings(ROOT_URLCONF=__name__, ALLOWED_HOSTS=['*'], DATABASE_REPLICAS=['replica'])
+class PrimaryReplicaRouterTests(TestCase):
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        # Pins from other tests live in the cache
+        cache.clear()
+
+    def test_get_reads_from_replica(self):
+        response = self.client.get('/read/')
+        self.assertEqual(response.json()['db'], 'replica')
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def test_non_get_uses_primary(self):
+        for method in (self.client.post, self.client.put, self.client.patch, self.client.delete):
+            with self.subTest(method=method.__name__):
+                self.assertEqual(method('/read/').json()['db'], 'default')
+
+    def test_reads_after_a_write_in_the_same_request_use_primary(self):
+        self.assertEqual(self.client.get('/write/').json()['db'], 'default')
+
+    def test_write_pins_client_to_primary(self):
+        response = self.client.post('/write/')
+        self.assertEqual(response.json()['db'], 'default')
+        self.assertIn(PIN_COOKIE, response.cookies)
+        # The client sends the pin cookie back
+        self.assertEqual(self.client.get('/read/').json()['db'], 'default')
+
+    def test_write_pins_token_clients_without_cookies(self):
+        auth = {'HTTP_AUTHORIZATION': 'Bearer router-test-token'}
+        self.client.post('/write/', **auth)
+        self.client.cookies.clear()
+        self.assertEqual(self.client.get('/read/', **auth).json()['db'], 'default')
+        self.assertEqual(self.client.get('/read/').json()['db'], 'replica')
+
+
+@skipUnless(getattr(connection, 'pool', None) is not None, 'needs a pooled PostgreSQL database')
+class DatabasePoolTests(TestCase):
+    def test_pool_checks_connections_before_handing_them_out(self):
+        from psycopg_pool import ConnectionPool
+
+        self.assertIs(connection.pool._check, ConnectionPool.check_connection)
+
+    def test_dropped_connection_is_replaced(self):
+        with connection.pool.connection() as conn:
+            pid = conn.info.backend_pid
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_terminate_backend(%s)', [pid])
+        # Every connection the pool hands out now must work.
+        for _ in range(connection.pool.max_size):
+            with connection.pool.connection() as conn:
+                self.assertEqual(conn.execute('SELECT 1').fetchone(), (1,))
+
+
+class DatabasePoolStatsTests(TestCase):
+    def test_reports_pooled_aliases_only(self):
+        pool = mock.Mock()
+        pool.get_stats.return_value = {
+            'pool_min': 2, 'pool_max': 4, 'pool_size': 3, 'pool_available': 1,
+            'requests_waiting': 2, 'requests_num': 40, 'requests_queued': 4,
+            'requests_wait_ms': 100, 'requests_errors': 1, 'connections_num': 5,
+        }
+        fake_connections = {'default': SimpleNamespace(pool=pool), 'replica': SimpleNamespace()}
+        with mock.patch('branchpoint_backend.metrics.connections', fake_connections):
+            stats = database_pool_stats()
+
+        self.assertEqual(list(stats), ['default'])
+        self.assertEqual(stats['default'], {
+            'min_size': 2, 'max_size': 4, 'size': 3, 'available': 1, 'in_use': 2,
+            'waiting': 2, 'requests': 40, 'requests_queued': 4, 'wait_ms_total': 100,
+            'wait_ms_avg': 25, 'timeouts': 1, 'connections_opened': 5, 'connection_errors': 0,
+        })
+
+    def test_no_wait_average_before_any_request_queued(self):
+        pool = mock.Mock()
+        pool.get_stats.return_value = {'pool_size': 2, 'pool_available': 2}
+        with mock.patch('branchpoint_backend.metrics.connections', {'default': SimpleNamespace(pool=pool)}):
+            self.assertEqual(database_pool_stats()['default']['wait_ms_avg'], 0)
+
+
+@override_settings(ALLOWED_HOSTS=['*'], METRICS_TOKEN='scrape-me')
+class MetricsPermissionTests(TestCase):
+    url = '/api/metrics/'
+
+    def setUp(self):
+        patcher = mock.patch('branchpoint_backend.metrics.collect_metrics', return_value={})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_anonymous_is_refused(self):
+        self.assertEqual(APIClient().get(self.url).status_code, 401)
+
+    def test_metrics_token(self):
+        self.assertEqual(APIClient().get(self.url, HTTP_X_METRICS_TOKEN='scrape-me').status_code, 200)
+        self.assertEqual(APIClient().get(self.url, HTTP_X_METRICS_TOKEN='wrong').status_code, 401)
+
+    @override_settings(METRICS_TOKEN='')
+    def test_empty_token_setting_accepts_no_token(self):
+        self.assertEqual(APIClient().get(self.url, HTTP_X_METRICS_TOKEN='').status_code, 401)
+
+    def test_staff_only(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(email='staff@example.com', is_staff=True))
+        self.assertEqual(client.get(self.url).status_code, 200)
+
+        client.force_authenticate(User.objects.create_user(email='user@example.com'))
+        self.assertEqual(client.get(self.url).status_code, 403)
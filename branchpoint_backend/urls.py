@@ -14,11 +14,14 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
+from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path, include
 from rest_framework import permissions
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
+from .metrics import metrics
 
 
 schema_view = get_schema_view(
@@ -43,5 +46,10 @@ urlpatterns = [
     path('api/sales/', include(('sales.urls', 'sales'))),
     path('api/payments/', include(('payments.urls', 'payments'))),
     path('api/salesaccounts/', include(('salesaccounts.urls', 'salesaccounts'))),
+    path('api/search/', include(('search.urls', 'search'))),
+    path('api/metrics/', metrics, name='metrics'),
 
 ]
+
+# Local avatar thumbnails (THUMBNAIL_STORAGE=local) in development
+urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'branchpoint_backend.settings')
 
 application = get_wsgi_application()
+
+# Build the refresh token blacklist filter now rather than on the first
+# refresh request.
+from accounts.blacklist import jti_blacklist
+
+jti_blacklist.start()
@@ -6,6 +6,9 @@ import sys
 
 def main():
     """Run administrative tasks."""
+    # Tests run without Redis and with a mirrored read replica.
+    if sys.argv[1:2] == ['test']:
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'branchpoint_backend.test_settings')
     os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'branchpoint_backend.settings')
     try:
         from django.core.management import execute_from_command_line
@@ -1,3 +1,74 @@
 from django.contrib import admin
+from django.utils import timezone
 
-# Register your models here.
+from .models import (
+    C2BTransaction, DailySettlement, MatchException, MpesaCallback, MpesaRequest, MpesaResponse, PaymentMatch,
+)
+
+
+@admin.register(MpesaRequest)
+class MpesaRequestAdmin(admin.ModelAdmin):
+    list_display = ('id', 'phone_number', 'amount', 'account_reference', 'status', 'timestamp', 'is_recent')
+    list_filter = ('status',)
+    search_fields = ('phone_number', 'account_reference')
+    date_hierarchy = 'timestamp'
+
+
+@admin.register(MpesaResponse)
+class MpesaResponseAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'checkout_request_id', 'response_code', 'is_successful', 'timestamp')
+    # __str__ shows the request's phone number
+    list_select_related = ('request',)
+    raw_id_fields = ('request',)
+    search_fields = ('checkout_request_id', 'merchant_request_id')
+
+
+@admin.register(MpesaCallback)
+class MpesaCallbackAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'mpesa_receipt_number', 'amount', 'phone_number', 'is_successful', 'timestamp')
+    list_filter = ('result_code',)
+    list_select_related = ('response',)
+    raw_id_fields = ('response',)
+    search_fields = ('mpesa_receipt_number',)
+
+
+@admin.register(PaymentMatch)
+class PaymentMatchAdmin(admin.ModelAdmin):
+    list_display = ('callback', 'sale', 'customer_payment', 'rule', 'matched_at')
+    list_filter = ('rule',)
+    list_select_related = ('callback__response',)
+    raw_id_fields = ('callback', 'sale', 'customer_payment')
+    date_hierarchy = 'matched_at'
+
+
+@admin.register(MatchException)
+class MatchExceptionAdmin(admin.ModelAdmin):
+    list_display = ('callback', 'reason', 'candidates', 'created_at', 'resolved_at', 'resolved_by')
+    list_filter = ('reason', ('resolved_at', admin.EmptyFieldListFilter))
+    list_select_related = ('callback__response', 'resolved_by')
+    raw_id_fields = ('callback',)
+    readonly_fields = ('created_at', 'resolved_at', 'resolved_by')
+    actions = ['mark_resolved']
+
+    @admin.action(description='Mark selected exceptions as resolved')
+    def mark_resolved(self, request, queryset):
+        resolved = queryset.filter(resolved_at__isnull=True).update(
+            resolved_at=timezone.now(), resolved_by=request.user,
+        )
+        self.message_user(request, f'{resolved} exception(s) marked as resolved.')
+
+
+@admin.register(C2BTransaction)
+class C2BTransactionAdmin(admin.ModelAdmin):
+    list_display = ('trans_id', 'trans_time', 'amount', 'bill_ref_number', 'msisdn', 'first_name', 'short_code')
+    list_filter = ('short_code', 'trans_type')
+    search_fields = ('trans_id', 'bill_ref_number')
+    date_hierarchy = 'trans_time'
+
+
+@admin.register(DailySettlement)
+class DailySettlementAdmin(admin.ModelAdmin):
+    list_display = ('date', 'short_code', 'successful_count', 'successful_amount', 'failed_count',
+                    'failed_amount', 'c2b_count', 'c2b_amount', 'updated_at')
+    list_filter = ('short_code',)
+    date_hierarchy = 'date'
@@ -4,3 +4,16 @@ from django.apps import AppConfig
 class PaymentsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'payments'
+
+    def ready(self):
+        from branchpoint_backend.metrics import register_metrics
+        from . import c2b
+        from .breaker import mpesa_breaker
+        from .client import mpesa_client
+        from .status_stream import status_notifier
+        from .tokens import mpesa_tokens
+        register_metrics('mpesa_token', mpesa_tokens.stats)
+        register_metrics('mpesa_client', mpesa_client.stats)
+        register_metrics('mpesa_breaker', mpesa_breaker.stats)
+        register_metrics('mpesa_status_stream', status_notifier.stats)
+        register_metrics('mpesa_c2b', c2b.stats)
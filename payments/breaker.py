@@ -0,0 +1,223 @@
+"""
+Circuit breaker for the Daraja API.
+
+When Daraja degrades, every call waits out its timeouts and retries, and
+the workers making them pile up behind it. The breaker keeps a rolling
+count of Daraja calls, failures (connection errors, timeouts, 429, 5xx) and
+slow calls in Redis, shared by every worker in time buckets. Once enough
+calls in the window failed or were slow it opens, and calls fail at once
+with `MpesaUnavailable` instead of reaching Daraja.
+
+After OPEN_SECONDS the breaker is half-open: one worker at a time gets to
+make a real call as a probe. HALF_OPEN_SUCCESSES good probes in a row close
+it; a failed probe opens it again for twice as long, up to OPEN_MAX.
+
+Each process caches the state for STATE_TTL seconds, so checking an open
+breaker costs no Redis round trip. If Redis is unreachable the breaker
+stays out of the way and every call goes through.
+"""
+
+import logging
+import threading
+import time
+
+from django.conf import settings
+from redis.exceptions import RedisError
+
+from branchpoint_backend.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    def __init__(self, name):
+        self.prefix = f'circuit:{name}'
+        self._cached = None  # (monotonic time read, state dict)
+        self._local = threading.local()
+        self._last_redis_warning = 0
+        self.rejected = 0
+        self.opened = 0
+
+    @property
+    def config(self):
+        return settings.MPESA_BREAKER
+
+    def allow(self):
+        """
+        True if a call may go to Daraja now. In the half-open state this
+        hands out the single probe, so call `record()` after every call it
+        allowed.
+        """
+        if not self.config['ENABLED']:
+            return True
+        state = self._state()
+        if state['state'] == CLOSED:
+            return True
+        if state['state'] == OPEN and time.time() < state['open_until']:
+            return self._reject()
+        if getattr(self._local, 'probing', False):
+            return True
+        try:
+            acquired = get_redis().set(f'{self.prefix}:probe', 1, nx=True, ex=self.config['PROBE_TIMEOUT'])
+        except RedisError:
+            self._redis_failed()
+            return True
+        if not acquired:
+            return self._reject()
+        self._local.probing = True
+        return True
+
+    def is_open(self):
+        """True while calls are being refused, without taking the probe"""
+        if not self.config['ENABLED']:
+            return False
+        state = self._state()
+        return state['state'] == OPEN and time.time() < state['open_until']
+
+    def retry_after(self):
+        """Seconds until the breaker lets a probe through"""
+        state = self._state()
+        return max(0.0, state['open_until'] - time.time()) if state['state'] == OPEN else 0.0
+
+    def record(self, success, elapsed_ms):
+        """Count the outcome of a call that `allow()` let through"""
+        if not self.config['ENABLED']:
+            return
+        slow = elapsed_ms >= self.config['SLOW_CALL'] * 1000
+        try:
+            if getattr(self._local, 'probing', False):
+                self._local.probing = False
+                self._record_probe(success, slow)
+            else:
+                self._record_call(success, slow)
+        except RedisError:
+            self._redis_failed()
+
+    def _record_call(self, success, slow):
+        redis = get_redis()
+        bucket_key = self._bucket_key(self._bucket())
+        pipe = redis.pipeline()
+        pipe.hincrby(bucket_key, 'calls', 1)
+        if not success:
+            pipe.hincrby(bucket_key, 'failures', 1)
+        if slow:
+            pipe.hincrby(bucket_key, 'slow', 1)
+        pipe.expire(bucket_key, self.config['WINDOW'] + self.config['BUCKET'])
+        pipe.execute()
+        if success and not slow:
+            return
+
+        window = self._window()
+        if window['calls'] < self.config['MIN_CALLS']:
+            return
+        if (window['failures'] / window['calls'] >= self.config['FAILURE_RATE']
+                or window['slow'] / window['calls'] >= self.config['SLOW_RATE']):
+            if redis.hget(f'{self.prefix}:state', 'state') is None:
+                self._open(0, window)
+
+    def _record_probe(self, success, slow):
+        redis = get_redis()
+        redis.delete(f'{self.prefix}:probe')
+        state_key = f'{self.prefix}:state'
+        if redis.hget(state_key, 'state') is None:
+            # Another worker's probes closed it meanwhile.
+            self._record_call(success, slow)
+            return
+        if not success or slow:
+            opens = int(redis.hget(state_key, 'opens') or 0)
+            self._open(opens, self._window())
+            return
+        successes = redis.hincrby(state_key, 'probe_successes', 1)
+        if successes >= self.config['HALF_OPEN_SUCCESSES']:
+            # Start the window afresh so the outage's failures don't reopen it.
+            redis.delete(state_key, *[self._bucket_key(b) for b in self._buckets()])
+            self._cached = None
+            logger.warning('Daraja circuit breaker closed after %d good probes', successes)
+
+    def _open(self, opens, window):
+        seconds = min(self.config['OPEN_MAX'], self.config['OPEN_SECONDS'] * 2 ** opens)
+        open_until = time.time() + seconds
+        get_redis().hset(f'{self.prefix}:state', mapping={
+            'state': OPEN, 'open_until': open_until, 'opens': opens + 1, 'probe_successes': 0,
+        })
+        self._cached = (time.monotonic(), {'state': OPEN, 'open_until': open_until, 'opens': opens + 1})
+        self.opened += 1
+        logger.error('Daraja circuit breaker opened for %ds (%s)', seconds, window)
+
+    def _state(self):
+        cached = self._cached
+        if cached is not None and time.monotonic() - cached[0] < self.config['STATE_TTL']:
+            return cached[1]
+        try:
+            raw = get_redis().hgetall(f'{self.prefix}:state')
+        except RedisError:
+            self._redis_failed()
+            raw = {}
+        if raw.get(b'state'):
+            state = {
+                'state': raw[b'state'].decode(),
+                'open_until': float(raw[b'open_until']),
+                'opens': int(raw.get(b'opens', 0)),
+            }
+        else:
+            state = {'state': CLOSED, 'open_until': 0.0, 'opens': 0}
+        self._cached = (time.monotonic(), state)
+        return state
+
+    def _reject(self):
+        self.rejected += 1
+        return False
+
+    def _bucket(self):
+        return int(time.time() // self.config['BUCKET'])
+
+    def _buckets(self):
+        current = self._bucket()
+        return range(current - self.config['WINDOW'] // self.config['BUCKET'] + 1, current + 1)
+
+    def _bucket_key(self, bucket):
+        return f'{self.prefix}:calls:{bucket}'
+
+    def _window(self):
+        pipe = get_redis().pipeline()
+        for bucket in self._buckets():
+            pipe.hgetall(self._bucket_key(bucket))
+        totals = {'calls': 0, 'failures': 0, 'slow': 0}
+        for counts in pipe.execute():
+            for field in totals:
+                totals[field] += int(counts.get(field.encode(), 0))
+        return totals
+
+    def _redis_failed(self):
+        now = time.monotonic()
+        if now - self._last_redis_warning > 60:
+            self._last_redis_warning = now
+            logger.warning('Redis unavailable for the Daraja circuit breaker; letting calls through',
+                           exc_info=True)
+
+    def stats(self):
+        self._cached = None
+        state = self._state()
+        if state['state'] == OPEN and time.time() >= state['open_until']:
+            state = dict(state, state=HALF_OPEN)
+        try:
+            window = self._window()
+        except RedisError:
+            window = None
+        return {
+            'enabled': self.config['ENABLED'],
+            'state': state['state'],
+            'retry_after': round(self.retry_after(), 1),
+            'consecutive_opens': state['opens'],
+            'window': window,
+            # This process only
+            'rejected': self.rejected,
+            'opened': self.opened,
+        }
+
+
+mpesa_breaker = CircuitBreaker('mpesa')
@@ -0,0 +1,211 @@
+"""
+C2B (paybill) payments.
+
+Customers who pay the paybill directly, rather than through an STK push,
+reach us through two URLs registered with Safaricom (`register_urls()`):
+
+- validation, which may reject a payment before it completes, and
+- confirmation, sent once it has. Month-end brings hundreds a second, and
+  Safaricom redelivers any it thinks we missed.
+
+The confirmation endpoint only appends the raw body to a Redis list and
+acknowledges. `drain_buffer()` (run by the `drain_c2b_confirmations` task,
+scheduled at most once per DRAIN_DELAY) writes the list to
+`C2BTransaction` in batches with one `bulk_create` each. Redeliveries hit
+the unique receipt number and are dropped. The list is trimmed only after
+its batch is committed, so a worker that dies mid-batch leaves it to be
+written again, harmlessly. New receipts are added to the daily settlement
+rollup (payments/settlements.py) in the same transaction. If Redis is down, confirmations are written
+straight away instead.
+"""
+
+import json
+import logging
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.urls import reverse
+from django.utils import timezone
+from redis.exceptions import RedisError
+
+from branchpoint_backend.redis_client import get_redis
+from . import settlements
+from .client import mpesa_client
+
+logger = logging.getLogger(__name__)
+
+BUFFER_KEY = 'mpesa:c2b:buffer'
+DRAIN_SCHEDULED_KEY = 'mpesa:c2b:drain-scheduled'
+DRAIN_LOCK_KEY = 'mpesa:c2b:drain-lock'
+
+# Result codes Safaricom accepts from the validation URL
+ACCEPTED = '0'
+INVALID_AMOUNT = 'C2B00013'
+OTHER_ERROR = 'C2B00016'
+
+
+class ConfirmationParseError(ValueError):
+    pass
+
+
+def register_urls(base_url=None):
+    """Tell Daraja where to send validations and confirmations"""
+    base_url = (base_url or settings.MPESA_CALLBACK_URL).rstrip('/')
+    return mpesa_client.c2b_register_urls(
+        short_code=settings.MPESA_C2B['SHORTCODE'],
+        confirmation_url=base_url + reverse('payments:c2b-confirmation'),
+        validation_url=base_url + reverse('payments:c2b-validation'),
+        response_type=settings.MPESA_C2B['RESPONSE_TYPE'],
+    )
+
+
+def validate(payload):
+    """(result code, description) to answer a validation request with"""
+    try:
+        amount = Decimal(str(payload['TransAmount']))
+    except (KeyError, TypeError, InvalidOperation):
+        return OTHER_ERROR, 'Rejected'
+    if not amount.is_finite() or amount < settings.MPESA_C2B['MIN_AMOUNT']:
+        return INVALID_AMOUNT, 'Rejected'
+    return ACCEPTED, 'Accepted'
+
+
+def parse_confirmation(body):
+    """Pull the fields of `C2BTransaction` out of a raw confirmation body"""
+    try:
+        data = json.loads(body)
+        trans_id = str(data['TransID']).strip()
+        trans_time = timezone.make_aware(datetime.strptime(str(data['TransTime']), '%Y%m%d%H%M%S'))
+        amount = Decimal(str(data['TransAmount']))
+    except (ValueError, KeyError, TypeError, InvalidOperation) as e:
+        raise ConfirmationParseError(f'Malformed C2B confirmation: {e!r}')
+    if not trans_id:
+        raise ConfirmationParseError('C2B confirmation without a TransID')
+
+    balance = None
+    if data.get('OrgAccountBalance') not in (None, ''):
+        try:
+            balance = Decimal(str(data['OrgAccountBalance']))
+        except InvalidOperation:
+            pass
+
+    return {
+        'trans_id': trans_id[:20],
+        'trans_type': str(data.get('TransactionType') or '')[:20],
+        'trans_time': trans_time,
+        'amount': amount,
+        'short_code': str(data.get('BusinessShortCode') or '')[:10],
+        'bill_ref_number': str(data.get('BillRefNumber') or '').strip()[:50],
+        'msisdn': str(data.get('MSISDN') or '')[:64],
+        'first_name': str(data.get('FirstName') or '')[:50],
+        'org_account_balance': balance,
+    }
+
+
+def buffer_confirmation(raw_body):
+    """Keep a delivered confirmation for the next drain"""
+    body = raw_body.decode('utf-8', errors='replace') if isinstance(raw_body, bytes) else raw_body
+    try:
+        get_redis().rpush(BUFFER_KEY, body)
+    except RedisError:
+        logger.warning('Redis unavailable for the C2B buffer; saving the confirmation directly', exc_info=True)
+        save_confirmations([body])
+        return
+    schedule_drain()
+
+
+def schedule_drain():
+    """Queue one drain for a burst of confirmations rather than one each"""
+    from .tasks import drain_c2b_confirmations
+
+    delay = settings.MPESA_C2B['DRAIN_DELAY']
+    try:
+        if not get_redis().set(DRAIN_SCHEDULED_KEY, 1, nx=True, ex=max(1, delay)):
+            return
+    except RedisError:
+        pass
+    try:
+        drain_c2b_confirmations.apply_async(countdown=delay)
+    except Exception:
+        # The beat schedule drains the buffer anyway.
+        logger.warning('Could not queue the C2B buffer drain', exc_info=True)
+
+
+def drain_buffer(batch_size=None, max_batches=None):
+    """Write buffered confirmations to the database; returns how many were read"""
+    batch_size = batch_size or settings.MPESA_C2B['BATCH_SIZE']
+    redis = get_redis()
+    # Trimming after a batch is only safe with one drain at a time.
+    try:
+        if not redis.set(DRAIN_LOCK_KEY, 1, nx=True, ex=settings.MPESA_C2B['LOCK_TIMEOUT']):
+            return 0
+    except RedisError:
+        # Confirmations are being saved directly meanwhile.
+        logger.warning('Redis unavailable; cannot drain the C2B buffer', exc_info=True)
+        return 0
+    handled = 0
+    batches = 0
+    try:
+        while max_batches is None or batches < max_batches:
+            bodies = redis.lrange(BUFFER_KEY, 0, batch_size - 1)
+            if not bodies:
+                break
+            save_confirmations([body.decode('utf-8', errors='replace') for body in bodies])
+            redis.ltrim(BUFFER_KEY, len(bodies), -1)
+            handled += len(bodies)
+            batches += 1
+    finally:
+        redis.delete(DRAIN_LOCK_KEY)
+    return handled
+
+
+def save_confirmations(bodies):
+    """Insert confirmations, skipping receipts we already have; returns how many were valid"""
+    from .models import C2BTransaction
+
+    transactions = {}
+    for body in bodies:
+        try:
+            fields = parse_confirmation(body)
+        except ConfirmationParseError as e:
+            logger.error('%s; body: %.500s', e, body)
+            continue
+        transactions.setdefault(fields['trans_id'], C2BTransaction(**fields))
+
+    with transaction.atomic():
+        # Only receipts new to us count towards the daily rollup.
+        seen = set(
+            C2BTransaction.objects.filter(trans_id__in=list(transactions)).values_list('trans_id', flat=True)
+        )
+        new = [c2b for trans_id, c2b in transactions.items() if trans_id not in seen]
+        try:
+            with transaction.atomic():
+                C2BTransaction.objects.bulk_create(new)
+        except IntegrityError:
+            # Another save got some of them in first: while Redis is down,
+            # concurrent requests save their confirmations directly. Insert
+            # one at a time to count only the ones we actually added.
+            new = [c2b for c2b in new if _insert(c2b)]
+        settlements.add_c2b_transactions(new)
+    if new:
+        logger.info('Saved %d C2B confirmations (%d redelivered)', len(new), len(transactions) - len(new))
+    return len(transactions)
+
+
+def _insert(c2b):
+    try:
+        with transaction.atomic():
+            c2b.save(force_insert=True)
+    except IntegrityError:
+        return False
+    return True
+
+
+def stats():
+    try:
+        buffered = get_redis().llen(BUFFER_KEY)
+    except RedisError:
+        buffered = None
+    return {'buffered': buffered}
@@ -0,0 +1,240 @@
+"""
+STK callback ingestion.
+
+Safaricom posts the result of every STK push to our callback URL, in
+bursts, and redelivers when we answer slowly. The endpoint therefore does
+as little as possible: `ingest()` stores the raw body in
+`MpesaCallbackInbox` and the view acknowledges straight away. The inbox is
+unique on CheckoutRequestID, so a redelivery costs one index probe and is
+dropped.
+
+`process_inbox()` (run by the `process_callback_inbox` Celery task) drains
+unprocessed entries in batches: it parses them and hands them to
+`apply_outcomes()`, which creates the `MpesaCallback` rows and moves the
+matching requests from PENDING to SUCCESS or FAILED. The stale-request
+reconciler (payments/reconcile.py) applies its results the same way. Every
+step is idempotent, so a batch that is processed twice changes nothing the
+second time.
+"""
+
+import json
+import logging
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from redis.exceptions import RedisError
+
+from branchpoint_backend.redis_client import get_redis
+from . import settlements
+from .status_stream import status_notifier
+
+logger = logging.getLogger(__name__)
+
+DRAIN_SCHEDULED_KEY = 'mpesa:callback-inbox:drain-scheduled'
+
+
+class CallbackParseError(ValueError):
+    pass
+
+
+def checkout_request_id(payload):
+    try:
+        return payload['Body']['stkCallback'].get('CheckoutRequestID') or None
+    except (KeyError, TypeError, AttributeError):
+        return None
+
+
+def ingest(raw_body):
+    """Store a delivered callback in the inbox and schedule a drain"""
+    from .models import MpesaCallbackInbox
+
+    try:
+        checkout_id = checkout_request_id(json.loads(raw_body))
+    except ValueError:
+        checkout_id = None  # Kept anyway; processing records the error.
+
+    body = raw_body.decode('utf-8', errors='replace') if isinstance(raw_body, bytes) else raw_body
+    # A redelivery hits the unique CheckoutRequestID and is dropped.
+    MpesaCallbackInbox.objects.bulk_create(
+        [MpesaCallbackInbox(checkout_request_id=checkout_id, body=body)],
+        ignore_conflicts=True,
+    )
+    schedule_drain()
+
+
+def schedule_drain():
+    """Queue one drain for a burst of callbacks rather than one per callback"""
+    from .tasks import process_callback_inbox
+
+    delay = settings.MPESA_CALLBACK_INBOX['DRAIN_DELAY']
+    try:
+        if not get_redis().set(DRAIN_SCHEDULED_KEY, 1, nx=True, ex=max(1, delay)):
+            return
+    except RedisError:
+        pass
+    try:
+        process_callback_inbox.apply_async(countdown=delay)
+    except Exception:
+        # The beat schedule drains the inbox anyway.
+        logger.warning('Could not queue the callback inbox drain', exc_info=True)
+
+
+def parse_stk_callback(body):
+    """Pull the fields of `MpesaCallback` out of a raw callback body"""
+    try:
+        callback = json.loads(body)['Body']['stkCallback']
+        result_code = str(callback['ResultCode'])
+    except (ValueError, KeyError, TypeError) as e:
+        raise CallbackParseError(f'Malformed STK callback: {e!r}')
+
+    metadata = callback.get('CallbackMetadata') or {}
+    items = {item.get('Name'): item.get('Value') for item in metadata.get('Item', []) if isinstance(item, dict)}
+
+    transaction_date = None
+    if items.get('TransactionDate'):
+        try:
+            transaction_date = timezone.make_aware(
+                datetime.strptime(str(items['TransactionDate']), '%Y%m%d%H%M%S')
+            )
+        except ValueError:
+            pass
+    amount = None
+    if items.get('Amount') is not None:
+        try:
+            amount = Decimal(str(items['Amount']))
+        except InvalidOperation:
+            pass
+
+    return {
+        'result_code': result_code,
+        'result_description': (callback.get('ResultDesc') or '')[:255],
+        'mpesa_receipt_number': items.get('MpesaReceiptNumber'),
+        'transaction_date': transaction_date,
+        'phone_number': str(items['PhoneNumber']) if items.get('PhoneNumber') else None,
+        'amount': amount,
+        'callback_metadata': callback.get('CallbackMetadata'),
+    }
+
+
+def process_inbox(batch_size=None, max_batches=None):
+    """Drain unprocessed inbox entries; returns how many were handled"""
+    from .models import MpesaCallbackInbox
+
+    batch_size = batch_size or settings.MPESA_CALLBACK_INBOX['BATCH_SIZE']
+    handled = 0
+    batches = 0
+    last_id = 0
+    while max_batches is None or batches < max_batches:
+        with transaction.atomic():
+            entries = list(
+                MpesaCallbackInbox.objects.select_for_update(skip_locked=True)
+                .filter(processed_at__isnull=True, id__gt=last_id)
+                .order_by('id')[:batch_size]
+            )
+            if not entries:
+                break
+            _process_batch(entries)
+        last_id = entries[-1].id
+        handled += len(entries)
+        batches += 1
+    return handled
+
+
+def _process_batch(entries):
+    from .models import MpesaCallbackInbox, MpesaResponse
+
+    now = timezone.now()
+    max_attempts = settings.MPESA_CALLBACK_INBOX['MAX_ATTEMPTS']
+    responses = {
+        response.checkout_request_id: response
+        for response in MpesaResponse.objects.filter(
+            checkout_request_id__in=[e.checkout_request_id for e in entries if e.checkout_request_id]
+        ).only('id', 'request_id', 'checkout_request_id')
+    }
+
+    outcomes = []
+    done, retry = [], []
+    for entry in entries:
+        entry.attempts += 1
+        try:
+            fields = parse_stk_callback(entry.body)
+        except CallbackParseError as e:
+            entry.error = str(e)[:255]
+            done.append(entry)
+            continue
+
+        response = responses.get(entry.checkout_request_id)
+        if response is None:
+            # The callback can beat the worker that saves our response.
+            if entry.attempts >= max_attempts:
+                entry.error = 'No STK push response with this CheckoutRequestID'
+                done.append(entry)
+            else:
+                retry.append(entry)
+            continue
+
+        outcomes.append((response.id, response.request_id, fields))
+        entry.error = ''
+        done.append(entry)
+
+    apply_outcomes(outcomes, authoritative=True)
+
+    for entry in done:
+        entry.processed_at = now
+    MpesaCallbackInbox.objects.bulk_update(done + retry, ['processed_at', 'attempts', 'error'])
+    if done:
+        logger.info('Processed %d STK callbacks (%d awaiting their response)', len(done), len(retry))
+
+
+def apply_outcomes(outcomes, authoritative):
+    """
+    Record STK results, given as (response id, request id, `MpesaCallback`
+    fields) tuples, and move their requests out of QUEUED/PENDING. Safe to
+    repeat: there is one `MpesaCallback` per response and a final status is
+    never overwritten.
+
+    Each request is added to the daily settlement rollup when it first
+    leaves QUEUED/PENDING.
+
+    Results from Safaricom's callback are `authoritative` and replace what
+    the reconciler inferred from an STK query (which has no receipt
+    number); the reconciler's results never replace a callback's.
+    """
+    from .models import MpesaCallback, MpesaRequest
+
+    if not outcomes:
+        return
+    callbacks = [MpesaCallback(response_id=response_id, **fields) for response_id, _, fields in outcomes]
+    if authoritative:
+        MpesaCallback.objects.bulk_create(
+            callbacks, update_conflicts=True, unique_fields=['response'],
+            update_fields=list(outcomes[0][2]),
+        )
+    else:
+        MpesaCallback.objects.bulk_create(callbacks, ignore_conflicts=True)
+
+    succeeded = {request_id for _, request_id, fields in outcomes if fields['result_code'] == '0'}
+    failed = {request_id for _, request_id, fields in outcomes if fields['result_code'] != '0'}
+    waiting = [MpesaRequest.QUEUED, MpesaRequest.PENDING]
+    # Lock the requests this batch settles, so each is added to the daily
+    # rollup only once however many results arrive for it.
+    settling = dict(
+        MpesaRequest.objects.select_for_update()
+        .filter(id__in=succeeded | failed, status__in=waiting)
+        .values_list('id', 'amount')
+    )
+    now = timezone.now()
+    settled = []
+    for _, request_id, fields in outcomes:
+        amount = settling.pop(request_id, None)
+        if amount is not None:
+            settled.append((request_id in succeeded, amount, fields['transaction_date'] or now))
+    settlements.add_stk_results(settled)
+    if succeeded:
+        MpesaRequest.objects.filter(id__in=succeeded, status__in=waiting).update(status=MpesaRequest.SUCCESS)
+    if failed:
+        MpesaRequest.objects.filter(id__in=failed, status__in=waiting).update(status=MpesaRequest.FAILED)
+    status_notifier.publish_on_commit(succeeded | failed)
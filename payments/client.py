@@ -0,0 +1,271 @@
+"""
+HTTP client for Safaricom's Daraja API.
+
+One `requests.Session` per process keeps TLS connections to Daraja alive
+(bounded by MPESA_HTTP['POOL_SIZE']), every call has connect and read
+timeouts, and failed calls are retried with jittered exponential backoff -
+but only when a retry can't charge a customer twice:
+
+- Calls that don't change anything on Daraja (OAuth, STK query) are
+  retried on connection errors, timeouts, 429 and 5xx.
+- STK push is only retried when Daraja certainly didn't act on it: the
+  connection was never established, or it answered 429 (rate limited). A
+  read timeout or 5xx after the push was sent is raised, not retried.
+
+A 401 on an authenticated call drops the cached token and retries once.
+Every attempt goes through the circuit breaker (payments/breaker.py), so
+while Daraja is failing calls raise `MpesaUnavailable` at once.
+"""
+
+import base64
+import logging
+import random
+import threading
+import time
+
+import requests
+from django.conf import settings
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+
+from branchpoint_backend.metrics import LatencyStats
+from .breaker import mpesa_breaker
+from .exceptions import MpesaAuthError, MpesaError, MpesaUnavailable
+from .tokens import mpesa_tokens
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+def stk_timestamp():
+    """Daraja timestamps are in Nairobi local time"""
+    return timezone.localtime().strftime('%Y%m%d%H%M%S')
+
+
+def stk_password(timestamp):
+    data_to_encode = settings.MPESA_SHORTCODE + settings.MPESA_PASSKEY + timestamp
+    return base64.b64encode(data_to_encode.encode()).decode('utf-8')
+
+
+class OperationStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.rejected = 0
+        self.latency_ms = LatencyStats()
+
+    def as_dict(self):
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'retries': self.retries,
+            'rejected': self.rejected,
+            'latency_ms': self.latency_ms.summary(),
+        }
+
+
+class MpesaClient:
+    def __init__(self, tokens=None, breaker=None):
+        self.tokens = tokens or mpesa_tokens
+        self.breaker = breaker or mpesa_breaker
+        self._session = None
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    @property
+    def config(self):
+        return settings.MPESA_HTTP
+
+    @property
+    def session(self):
+        # Created lazily so forked workers (Celery prefork) don't share sockets.
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(
+                        pool_connections=4,
+                        pool_maxsize=self.config['POOL_SIZE'],
+                        pool_block=True,
+                        max_retries=0,
+                    )
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    self._session = session
+        return self._session
+
+    def fetch_access_token(self):
+        """Ask Daraja for a new access token; returns (token, expires_in)"""
+        try:
+            data = self._request(
+                'oauth', 'GET', settings.MPESA_AUTH_URL,
+                idempotent=True, authenticated=False,
+                auth=(settings.MPESA_CONSUMER_KEY, settings.MPESA_CONSUMER_SECRET),
+            )
+        except MpesaUnavailable:
+            raise
+        except MpesaError as e:
+            raise MpesaAuthError(f'Token request failed: {e}', e.status_code, e.response_data)
+
+        token = data.get('access_token')
+        if not token:
+            raise MpesaAuthError('Access token not found in response', response_data=data)
+        return token, int(data.get('expires_in', 3599))
+
+    def stk_push(self, phone_number, amount, account_reference, transaction_desc, callback_url):
+        """Send an STK push and return Daraja's response"""
+        timestamp = stk_timestamp()
+        payload = {
+            "BusinessShortCode": settings.MPESA_SHORTCODE,
+            "Password": stk_password(timestamp),
+            "Timestamp": timestamp,
+            "TransactionType": "CustomerPayBillOnline",
+            "Amount": float(amount),
+            "PartyA": phone_number,
+            "PartyB": settings.MPESA_SHORTCODE,
+            "PhoneNumber": phone_number,
+            "CallBackURL": callback_url,
+            "AccountReference": account_reference,
+            "TransactionDesc": transaction_desc
+        }
+        return self._request('stk_push', 'POST', settings.MPESA_STK_PUSH_URL, json=payload, idempotent=False)
+
+    def stk_query(self, checkout_request_id, max_retries=None):
+        """
+        Ask Daraja for the result of an STK push. `max_retries` overrides
+        MPESA_HTTP['MAX_RETRIES'] for callers with their own backoff.
+        """
+        timestamp = stk_timestamp()
+        payload = {
+            "BusinessShortCode": settings.MPESA_SHORTCODE,
+            "Password": stk_password(timestamp),
+            "Timestamp": timestamp,
+            "CheckoutRequestID": checkout_request_id,
+        }
+        return self._request('stk_query', 'POST', settings.MPESA_STK_QUERY_URL, json=payload,
+                             idempotent=True, max_retries=max_retries)
+
+    def c2b_register_urls(self, short_code, confirmation_url, validation_url, response_type):
+        """Register the paybill's C2B confirmation and validation URLs"""
+        payload = {
+            "ShortCode": short_code,
+            "ResponseType": response_type,
+            "ConfirmationURL": confirmation_url,
+            "ValidationURL": validation_url,
+        }
+        return self._request('c2b_register', 'POST', settings.MPESA_C2B_REGISTER_URL, json=payload,
+                             idempotent=True)
+
+    def _request(self, operation, method, url, idempotent, authenticated=True, max_retries=None, **kwargs):
+        stats = self._stats.setdefault(operation, OperationStats())
+        timeout = (self.config['CONNECT_TIMEOUT'], self.config['READ_TIMEOUT'])
+        if max_retries is None:
+            max_retries = self.config['MAX_RETRIES']
+        reauthenticated = False
+        attempt = 0
+
+        while True:
+            if authenticated:
+                kwargs['headers'] = {'Authorization': f'Bearer {self.tokens.get_token()}'}
+            if not self.breaker.allow():
+                stats.rejected += 1
+                raise MpesaUnavailable(f'{operation}: Daraja is failing, not calling it for '
+                                       f'{self.breaker.retry_after():.0f}s')
+
+            stats.calls += 1
+            started = time.monotonic()
+            response = error = None
+            try:
+                response = self.session.request(method, url, timeout=timeout, **kwargs)
+            except requests.RequestException as e:
+                error = e
+            elapsed_ms = (time.monotonic() - started) * 1000
+            stats.latency_ms.add(elapsed_ms)
+            self.breaker.record(not _daraja_failing(response, error), elapsed_ms)
+            logger.info('Daraja %s %s in %.0fms', operation,
+                        response.status_code if response is not None else type(error).__name__, elapsed_ms)
+
+            if response is not None and response.status_code == 401 and authenticated and not reauthenticated:
+                # The token was revoked or expired early; get a new one once.
+                self.tokens.invalidate()
+                reauthenticated = True
+                continue
+
+            if response is not None and response.ok:
+                try:
+                    return response.json()
+                except ValueError:
+                    stats.errors += 1
+                    raise MpesaError(f'{operation}: invalid JSON from Daraja', response.status_code)
+
+            if attempt < max_retries and self._should_retry(response, error, idempotent):
+                attempt += 1
+                stats.retries += 1
+                time.sleep(self._backoff(attempt, response))
+                continue
+
+            stats.errors += 1
+            if error is not None:
+                raise MpesaError(f'{operation} request failed: {error}') from error
+            try:
+                data = response.json()
+            except ValueError:
+                data = {'body': response.text[:500]}
+            raise MpesaError(
+                f"{operation} failed with HTTP {response.status_code}: "
+                f"{data.get('errorMessage') or data.get('body') or data}",
+                response.status_code, data,
+            )
+
+    def _should_retry(self, response, error, idempotent):
+        if error is not None:
+            if isinstance(error, requests.ConnectTimeout):
+                return True
+            if isinstance(error, requests.ConnectionError):
+                # Connection refused/reset before a response; for a push
+                # we can't tell whether the body reached Daraja unless the
+                # connection was never made.
+                return idempotent or _never_connected(error)
+            return idempotent and isinstance(error, requests.Timeout)
+        if response.status_code == 429:
+            return True
+        return idempotent and response.status_code in RETRYABLE_STATUS
+
+    def _backoff(self, attempt, response):
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), self.config['BACKOFF_MAX'])
+        # Full jitter keeps workers that failed together from retrying together.
+        ceiling = min(self.config['BACKOFF_MAX'], self.config['BACKOFF_BASE'] * 2 ** (attempt - 1))
+        return random.uniform(0, ceiling)
+
+    def stats(self):
+        return {operation: stats.as_dict() for operation, stats in self._stats.items()}
+
+
+def _daraja_failing(response, error):
+    """True if an attempt's outcome says Daraja is down, not that it refused us"""
+    if error is not None:
+        return True
+    if response.status_code == 500:
+        # Daraja reports some answers, such as "still processing", as a 500
+        # with an errorCode; only a bare 500 is an outage.
+        try:
+            data = response.json()
+        except ValueError:
+            return True
+        return not (isinstance(data, dict) and data.get('errorCode'))
+    return response.status_code in RETRYABLE_STATUS
+
+
+def _never_connected(error):
+    """True if the error happened while opening the connection"""
+    from urllib3.exceptions import NewConnectionError, NameResolutionError
+    reason = error.args[0] if error.args else None
+    reason = getattr(reason, 'reason', reason)
+    return isinstance(reason, (NewConnectionError, NameResolutionError))
+
+
+mpesa_client = MpesaClient()
@@ -0,0 +1,15 @@
+class MpesaError(Exception):
+    """A Daraja call failed"""
+
+    def __init__(self, message, status_code=None, response_data=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.response_data = response_data
+
+
+class MpesaAuthError(MpesaError):
+    """Daraja didn't give us an access token"""
+
+
+class MpesaUnavailable(MpesaError):
+    """The circuit breaker is open; Daraja wasn't called"""
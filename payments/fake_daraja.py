@@ -0,0 +1,311 @@
+"""
+Local stand-in for Safaricom's Daraja API, for development and load tests.
+
+Run it with `python manage.py fake_daraja` and point the MPESA_EXPRESS_*
+endpoint settings at it. It only implements what the payments app calls
+and answers the way the sandbox does, including posting each push's result
+to its CallBackURL once the "customer" has answered.
+"""
+
+import base64
+import heapq
+import itertools
+import json
+import random
+import secrets
+import string
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+import requests
+
+from branchpoint_backend.metrics import LatencyStats
+
+
+class FakeDaraja:
+    """Behaviour knobs and counters shared by the request handlers"""
+
+    def __init__(self, token_ttl=3599, latency=0.0, latency_jitter=0.0, error_rate=0.0, result_delay=0.0,
+                 decline_rate=0.0, callbacks=True, callback_loss_rate=0.0, callback_duplicates=0,
+                 callback_burst=0.0, callback_concurrency=8):
+        self.token_ttl = token_ttl
+        # Every response waits latency plus up to latency_jitter seconds
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        # Share of STK requests answered with 503 (spike arrest), to
+        # exercise client retries
+        self.error_rate = error_rate
+        # Seconds the "customer" takes to answer a push, and the share of
+        # pushes they cancel (ResultCode 1032) instead of paying
+        self.result_delay = result_delay
+        self.decline_rate = decline_rate
+        # Callback delivery: the share of results never delivered (for the
+        # reconciler), how many times each is redelivered, and, if
+        # callback_burst is set, holding results back and posting them
+        # together every callback_burst seconds
+        self.callbacks = callbacks
+        self.callback_loss_rate = callback_loss_rate
+        self.callback_duplicates = callback_duplicates
+        self.callback_burst = callback_burst
+        self.callback_latency = LatencyStats(size=100000)
+        self.lock = threading.Lock()
+        self.counts = {}
+        self.tokens = {}
+        self.pushes = {}
+        self.c2b_urls = {}  # shortcode -> registered C2B URLs
+        self._due = []  # heap of (due time, sequence, url, body)
+        self._sequence = itertools.count()
+        self._wakeup = threading.Condition(self.lock)
+        self._closed = False
+        self._senders = ThreadPoolExecutor(max_workers=callback_concurrency, thread_name_prefix='fake-daraja-callback')
+        self._session = requests.Session()
+        self._session.mount('http://', requests.adapters.HTTPAdapter(pool_maxsize=callback_concurrency))
+        self._dispatcher = threading.Thread(target=self._dispatch, name='fake-daraja-dispatch', daemon=True)
+        self._dispatcher.start()
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counts[name] = self.counts.get(name, 0) + n
+
+    def delay(self):
+        if self.latency or self.latency_jitter:
+            time.sleep(self.latency + random.uniform(0, self.latency_jitter))
+
+    def issue_token(self):
+        token = secrets.token_urlsafe(24)
+        with self.lock:
+            self.tokens[token] = time.time() + self.token_ttl
+        return token
+
+    def record_push(self, payload):
+        checkout_id = f'ws_CO_{time.strftime("%d%m%Y%H%M%S")}{secrets.randbelow(10 ** 9):09d}'
+        merchant_id = f'{secrets.randbelow(10 ** 5):05d}-{secrets.randbelow(10 ** 8):08d}-1'
+        if random.random() < self.decline_rate:
+            result = ('1032', 'Request cancelled by user')
+        else:
+            result = ('0', 'The service request is processed successfully.')
+        result_at = time.time() + self.result_delay
+        with self.lock:
+            self.pushes[checkout_id] = {
+                'merchant_id': merchant_id, 'payload': payload,
+                'result_at': result_at, 'result': result,
+            }
+        if self.callbacks and payload.get('CallBackURL'):
+            if random.random() < self.callback_loss_rate:
+                self.count('callbacks_lost')
+            else:
+                body = json.dumps(self.callback_body(merchant_id, checkout_id, payload, result))
+                for _ in range(1 + self.callback_duplicates):
+                    self.schedule_callback(result_at, payload['CallBackURL'], body)
+        return merchant_id, checkout_id
+
+    def callback_body(self, merchant_id, checkout_id, payload, result):
+        result_code, result_desc = result
+        callback = {
+            'MerchantRequestID': merchant_id,
+            'CheckoutRequestID': checkout_id,
+            'ResultCode': int(result_code),
+            'ResultDesc': result_desc,
+        }
+        if result_code == '0':
+            receipt = ''.join(random.choices(string.ascii_uppercase + string.digits, k=10))
+            callback['CallbackMetadata'] = {'Item': [
+                {'Name': 'Amount', 'Value': payload.get('Amount')},
+                {'Name': 'MpesaReceiptNumber', 'Value': receipt},
+                {'Name': 'TransactionDate', 'Value': int(time.strftime('%Y%m%d%H%M%S'))},
+                {'Name': 'PhoneNumber', 'Value': payload.get('PhoneNumber')},
+            ]}
+        return {'Body': {'stkCallback': callback}}
+
+    def schedule_callback(self, due, url, body):
+        if self.callback_burst:
+            # Round up to the next burst so results go out together.
+            due = (int(due // self.callback_burst) + 1) * self.callback_burst
+        with self._wakeup:
+            heapq.heappush(self._due, (due, next(self._sequence), url, body))
+            self._wakeup.notify()
+
+    def _dispatch(self):
+        while True:
+            with self._wakeup:
+                while not self._closed and (not self._due or self._due[0][0] > time.time()):
+                    self._wakeup.wait(self._due[0][0] - time.time() if self._due else None)
+                if self._closed:
+                    return
+                now = time.time()
+                ready = []
+                while self._due and self._due[0][0] <= now:
+                    ready.append(heapq.heappop(self._due))
+            for _, _, url, body in ready:
+                self._senders.submit(self._send_callback, url, body)
+
+    def _send_callback(self, url, body):
+        started = time.perf_counter()
+        try:
+            response = self._session.post(url, data=body, headers={'Content-Type': 'application/json'}, timeout=30)
+        except requests.RequestException:
+            self.count('callback_errors')
+            return
+        self.callback_latency.add((time.perf_counter() - started) * 1000)
+        self.count('callbacks_delivered' if response.ok else 'callback_errors')
+
+    def pending_callbacks(self):
+        with self.lock:
+            return len(self._due)
+
+    def stats(self):
+        with self.lock:
+            counts = dict(self.counts)
+            counts['callbacks_waiting'] = len(self._due)
+        counts['callback_latency_ms'] = self.callback_latency.summary()
+        return counts
+
+    def close(self):
+        with self._wakeup:
+            self._closed = True
+            self._wakeup.notify()
+        self._senders.shutdown(wait=False, cancel_futures=True)
+
+    def token_valid(self, header):
+        if not header.startswith('Bearer '):
+            return False
+        with self.lock:
+            expires_at = self.tokens.get(header[len('Bearer '):])
+        return bool(expires_at and time.time() < expires_at)
+
+
+class FakeDarajaHandler(BaseHTTPRequestHandler):
+    server_version = 'FakeDaraja/1.0'
+    protocol_version = 'HTTP/1.1'
+
+    @property
+    def daraja(self):
+        return self.server.daraja
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def send_json(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            return json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            return None
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == '/_stats':
+            return self.send_json(200, self.daraja.stats())
+        self.daraja.delay()
+        if path == '/oauth/v1/generate':
+            return self.oauth()
+        self.send_json(404, {'errorMessage': 'Not found'})
+
+    def do_POST(self):
+        self.daraja.delay()
+        # Read the body before any early answer so keep-alive stays in sync.
+        payload = self.read_json()
+        path = urlsplit(self.path).path
+        handlers = {
+            '/mpesa/stkpush/v1/processrequest': self.stk_push,
+            '/mpesa/stkpushquery/v1/query': self.stk_query,
+            '/mpesa/c2b/v1/registerurl': self.c2b_register_url,
+            '/mpesa/c2b/v2/registerurl': self.c2b_register_url,
+        }
+        handler = handlers.get(path)
+        if handler is None:
+            return self.send_json(404, {'errorMessage': 'Not found'})
+        if not self.daraja.token_valid(self.headers.get('Authorization', '')):
+            self.daraja.count('unauthorized')
+            return self.send_json(401, {'errorCode': '404.001.03', 'errorMessage': 'Invalid Access Token'})
+        if random.random() < self.daraja.error_rate:
+            self.daraja.count('injected_errors')
+            return self.send_json(503, {'errorMessage': 'Service Unavailable'})
+        if payload is None:
+            return self.send_json(400, {'errorCode': '400.002.02', 'errorMessage': 'Bad Request - Invalid Body'})
+        handler(payload)
+
+    def stk_push(self, payload):
+        self.daraja.count('stk_push')
+        merchant_id, checkout_id = self.daraja.record_push(payload)
+        self.send_json(200, {
+            'MerchantRequestID': merchant_id,
+            'CheckoutRequestID': checkout_id,
+            'ResponseCode': '0',
+            'ResponseDescription': 'Success. Request accepted for processing',
+            'CustomerMessage': 'Success. Request accepted for processing',
+        })
+
+    def stk_query(self, payload):
+        self.daraja.count('stk_query')
+        checkout_id = payload.get('CheckoutRequestID')
+        with self.daraja.lock:
+            push = self.daraja.pushes.get(checkout_id)
+        if push is None:
+            return self.send_json(400, {'errorCode': '400.002.02', 'errorMessage': 'Bad Request - Invalid CheckoutRequestID'})
+        if time.time() < push['result_at']:
+            return self.send_json(500, {'errorCode': '500.001.1001', 'errorMessage': 'The transaction is being processed'})
+        result_code, result_desc = push['result']
+        self.send_json(200, {
+            'ResponseCode': '0',
+            'ResponseDescription': 'The service request has been accepted successsfully',
+            'MerchantRequestID': push['merchant_id'],
+            'CheckoutRequestID': checkout_id,
+            'ResultCode': result_code,
+            'ResultDesc': result_desc,
+        })
+
+    def c2b_register_url(self, payload):
+        self.daraja.count('c2b_register_url')
+        short_code = str(payload.get('ShortCode') or '')
+        urls = {key: payload.get(key) for key in ('ConfirmationURL', 'ValidationURL', 'ResponseType')}
+        if not short_code or not all(urls.values()):
+            return self.send_json(400, {'errorCode': '400.002.02', 'errorMessage': 'Bad Request - Invalid Body'})
+        with self.daraja.lock:
+            self.daraja.c2b_urls[short_code] = urls
+        self.send_json(200, {
+            'OriginatorCoversationID': secrets.token_hex(8),
+            'ResponseCode': '0',
+            'ResponseDescription': 'Success',
+        })
+
+    def oauth(self):
+        self.daraja.count('oauth')
+        auth = self.headers.get('Authorization', '')
+        try:
+            key, _, secret = base64.b64decode(auth.split(' ', 1)[1]).decode().partition(':')
+        except (IndexError, ValueError):
+            key = secret = ''
+        if not auth.startswith('Basic ') or not key or not secret:
+            return self.send_json(400, {'errorCode': '400.008.01', 'errorMessage': 'Invalid Authentication passed'})
+        self.send_json(200, {
+            'access_token': self.daraja.issue_token(),
+            'expires_in': str(self.daraja.token_ttl),
+        })
+
+
+class FakeDarajaServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def server_close(self):
+        super().server_close()
+        self.daraja.close()
+
+
+def make_server(host='127.0.0.1', port=8089, verbose=False, **options):
+    server = FakeDarajaServer((host, port), FakeDarajaHandler)
+    server.daraja = FakeDaraja(**options)
+    server.verbose = verbose
+    return server
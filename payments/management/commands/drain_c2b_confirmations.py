@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from payments.c2b import drain_buffer
+
+
+class Command(BaseCommand):
+    help = 'Save every buffered C2B confirmation in this process (no Celery worker needed)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help='Confirmations per insert')
+
+    def handle(self, *args, **options):
+        handled = drain_buffer(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Drained {handled} buffered confirmations'))
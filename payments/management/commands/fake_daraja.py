@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand
+
+from payments.fake_daraja import make_server
+
+
+class Command(BaseCommand):
+    help = 'Run a local stand-in for the Daraja API (point MPESA_EXPRESS_* at it)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8089)
+        parser.add_argument('--token-ttl', type=int, default=3599,
+                            help='Lifetime of issued access tokens in seconds')
+        parser.add_argument('--latency-ms', type=int, default=0, help='Delay added to every response')
+        parser.add_argument('--latency-jitter-ms', type=int, default=0,
+                            help='Random extra delay of up to this much on every response')
+        parser.add_argument('--error-rate', type=float, default=0.0,
+                            help='Share of STK push/query requests answered with 503')
+        parser.add_argument('--result-delay', type=float, default=0.0,
+                            help='Seconds before a push has a result: its callback is posted then, and '
+                                 'STK queries until then say "being processed"')
+        parser.add_argument('--decline-rate', type=float, default=0.0,
+                            help='Share of pushes the customer cancels (ResultCode 1032)')
+        parser.add_argument('--no-callbacks', action='store_true',
+                            help="Don't post results to the pushes' CallBackURL")
+        parser.add_argument('--callback-loss-rate', type=float, default=0.0,
+                            help='Share of results never posted back (for the reconciler)')
+        parser.add_argument('--callback-duplicates', type=int, default=0,
+                            help='Extra deliveries of every callback, as when Safaricom redelivers')
+        parser.add_argument('--callback-burst', type=float, default=0.0,
+                            help='Hold callbacks back and post them together every this many seconds')
+        parser.add_argument('--callback-concurrency', type=int, default=8,
+                            help='Callbacks posted at the same time')
+        parser.add_argument('--verbose', action='store_true', help='Log every request')
+
+    def handle(self, *args, **options):
+        server = make_server(
+            options['host'], options['port'], verbose=options['verbose'],
+            token_ttl=options['token_ttl'], latency=options['latency_ms'] / 1000,
+            latency_jitter=options['latency_jitter_ms'] / 1000,
+            error_rate=options['error_rate'], result_delay=options['result_delay'],
+            decline_rate=options['decline_rate'], callbacks=not options['no_callbacks'],
+            callback_loss_rate=options['callback_loss_rate'],
+            callback_duplicates=options['callback_duplicates'],
+            callback_burst=options['callback_burst'],
+            callback_concurrency=options['callback_concurrency'],
+        )
+        base = f"http://{options['host']}:{options['port']}"
+        self.stdout.write(self.style.SUCCESS(f'Fake Daraja listening on {base}'))
+        self.stdout.write(f'  MPESA_EXPRESS_AUTH_ENDPOINT={base}/oauth/v1/generate?grant_type=client_credentials')
+        self.stdout.write(f'  MPESA_API_BASE={base}')
+        self.stdout.write(f'  Request counts and callback latency: {base}/_stats')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from payments.matching import match_callbacks, retry_exceptions
+
+
+class Command(BaseCommand):
+    help = (
+        'Match successful M-Pesa payments to sales and customer payments, in this '
+        'process (no Celery worker needed)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help='Payments per batch')
+        parser.add_argument('--batches', type=int, default=None, help='Stop after this many batches')
+        parser.add_argument('--retry', action='store_true',
+                            help='First send open unmatched/ambiguous exceptions back to be matched again')
+
+    def handle(self, *args, **options):
+        if options['retry']:
+            reopened = retry_exceptions()
+            self.stdout.write(f'Reopened {reopened} exception(s)')
+
+        started = time.monotonic()
+        counts = match_callbacks(batch_size=options['batch_size'], max_batches=options['batches'])
+        elapsed = time.monotonic() - started
+
+        summary = ', '.join(f'{k}: {v}' for k, v in sorted(counts.items())) or 'nothing to match'
+        self.stdout.write(self.style.SUCCESS(
+            f'Matched {sum(counts.values())} payment(s) in {elapsed:.2f}s - {summary}'
+        ))
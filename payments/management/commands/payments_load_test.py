@@ -0,0 +1,304 @@
+import random
+import secrets
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import requests
+from celery.contrib.testing.worker import start_worker
+from celery.signals import task_postrun, task_prerun
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.core.wsgi import get_wsgi_application
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test.utils import override_settings
+from django.urls import Resolver404, resolve, reverse
+
+from branchpoint_backend.celery import app as celery_app
+from branchpoint_backend.metrics import percentile
+from payments.fake_daraja import make_server
+from payments.models import MpesaCallbackInbox, MpesaRequest, MpesaResponse
+
+ACCOUNT_REFERENCE = 'LOADTEST'
+TRANSACTION_STATEMENTS = ('BEGIN', 'SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')
+
+
+class QueryCounter:
+    """Counts the statements every database connection runs, by stage"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = Counter()
+        self.local = threading.local()
+
+    def __call__(self, execute, sql, params, many, context):
+        # Leave out transaction bookkeeping; not every backend sends it.
+        if not sql.lstrip().upper().startswith(TRANSACTION_STATEMENTS):
+            stage = getattr(self.local, 'stage', None) or 'other'
+            with self.lock:
+                self.counts[stage] += 1
+        return execute(sql, params, many, context)
+
+    @contextmanager
+    def stage(self, name):
+        previous = getattr(self.local, 'stage', None)
+        self.local.stage = name
+        try:
+            yield
+        finally:
+            self.local.stage = previous
+
+    def install(self, connection, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Load-test the payments pipeline in one process: concurrent STK push '
+        'requests go through the web app, a Celery worker and a local fake '
+        'Daraja that posts callbacks back. Reports throughput, latency and '
+        'database queries per payment'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--payments', type=int, default=500, help='Number of STK pushes to send')
+        parser.add_argument('--concurrency', type=int, default=20, help='Simultaneous POS clients')
+        parser.add_argument('--worker-concurrency', type=int, default=4, help='Celery worker threads')
+        parser.add_argument('--timeout', type=float, default=120,
+                            help='Seconds to wait for every payment to reach a final status')
+        parser.add_argument('--latency-ms', type=int, default=50, help="Fake Daraja's response time")
+        parser.add_argument('--latency-jitter-ms', type=int, default=50, help='Random extra response time')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Share of STK requests answered with 503')
+        parser.add_argument('--result-delay', type=float, default=1.0, help='Seconds the customer takes to answer')
+        parser.add_argument('--decline-rate', type=float, default=0.05, help='Share of pushes the customer cancels')
+        parser.add_argument('--callback-loss-rate', type=float, default=0.0, help='Share of callbacks never sent')
+        parser.add_argument('--callback-duplicates', type=int, default=0, help='Redeliveries of every callback')
+        parser.add_argument('--callback-burst', type=float, default=0.0,
+                            help='Post callbacks together every this many seconds')
+        parser.add_argument('--cleanup', action='store_true', help='Delete the load test payments and exit')
+
+    def handle(self, *args, **options):
+        if options['cleanup']:
+            self._cleanup()
+            return
+        if settings.MPESA_ENVIRONMENT == 'production':
+            raise CommandError('Refusing to load-test with MPESA_ENVIRONMENT=production')
+
+        counter = QueryCounter()
+        connection_created.connect(counter.install)
+        for connection in connections.all(initialized_only=True):
+            counter.install(connection)
+
+        def task_started(task=None, **kwargs):
+            counter.local.stage = 'task ' + task.name.rsplit('.', 1)[-1]
+
+        def task_finished(**kwargs):
+            counter.local.stage = None
+
+        task_prerun.connect(task_started, weak=False)
+        task_postrun.connect(task_finished, weak=False)
+
+        timings = defaultdict(list)
+        web = self._start_web_server(counter, timings)
+        daraja = make_server(
+            '127.0.0.1', 0, latency=options['latency_ms'] / 1000,
+            latency_jitter=options['latency_jitter_ms'] / 1000, error_rate=options['error_rate'],
+            result_delay=options['result_delay'], decline_rate=options['decline_rate'],
+            callback_loss_rate=options['callback_loss_rate'],
+            callback_duplicates=options['callback_duplicates'], callback_burst=options['callback_burst'],
+        )
+        threading.Thread(target=daraja.serve_forever, daemon=True).start()
+        web_url = 'http://127.0.0.1:%d' % web.server_address[1]
+        daraja_url = 'http://127.0.0.1:%d' % daraja.server_address[1]
+
+        # The worker runs in this process on an in-memory broker, so every
+        # query a payment causes is counted here.
+        celery_app.conf.update(
+            CELERY_BROKER_URL='memory://', CELERY_BROKER_TRANSPORT_OPTIONS={'polling_interval': 0.01},
+            CELERY_WORKER_PREFETCH_MULTIPLIER=0,
+            CELERY_TASK_ALWAYS_EAGER=False,
+        )
+        overrides = override_settings(
+            MPESA_AUTH_URL=daraja_url + '/oauth/v1/generate?grant_type=client_credentials',
+            MPESA_STK_PUSH_URL=daraja_url + '/mpesa/stkpush/v1/processrequest',
+            MPESA_STK_QUERY_URL=daraja_url + '/mpesa/stkpushquery/v1/query',
+            MPESA_CALLBACK_URL=web_url,
+        )
+        tag = f'{ACCOUNT_REFERENCE}-{secrets.token_hex(3)}'
+        try:
+            with overrides, start_worker(celery_app, pool='threads', concurrency=options['worker_concurrency'],
+                                         perform_ping_check=False, loglevel='WARNING'):
+                stop_beat = self._start_beat()
+                try:
+                    results = self._run(web_url, tag, options, counter)
+                finally:
+                    stop_beat.set()
+        finally:
+            web.shutdown()
+            web.server_close()
+            daraja.shutdown()
+            daraja_stats = daraja.daraja.stats()
+            daraja.server_close()
+            connection_created.disconnect(counter.install)
+            task_prerun.disconnect(task_started)
+            task_postrun.disconnect(task_finished)
+
+        self._report(results, timings, counter, daraja_stats)
+
+    def _start_web_server(self, counter, timings):
+        app = get_wsgi_application()
+
+        def counted_app(environ, start_response):
+            try:
+                stage = resolve(environ['PATH_INFO']).url_name
+            except Resolver404:
+                stage = None
+            started = time.perf_counter()
+            with counter.stage(stage):
+                response = app(environ, start_response)
+            timings[stage].append((time.perf_counter() - started) * 1000)
+            return response
+
+        server = ThreadedWSGIServer(('127.0.0.1', 0), QuietRequestHandler)
+        server.set_app(counted_app)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    def _start_beat(self):
+        """Send the payments' periodic tasks on their Beat schedule"""
+        stop = threading.Event()
+        entries = [
+            (entry['task'], float(entry['schedule']))
+            for entry in settings.CELERY_BEAT_SCHEDULE.values()
+            if entry['task'].startswith('payments.')
+        ]
+
+        def beat():
+            due = {task: time.monotonic() + interval for task, interval in entries}
+            while not stop.wait(0.5):
+                for task, interval in entries:
+                    if time.monotonic() >= due[task]:
+                        celery_app.tasks[task].delay()
+                        due[task] += interval
+
+        threading.Thread(target=beat, daemon=True).start()
+        return stop
+
+    def _run(self, web_url, tag, options, counter):
+        local = threading.local()
+        submitted = {}  # request id -> submit time
+        push_latency = []
+        errors = Counter()
+        lock = threading.Lock()
+
+        def push(i):
+            if not hasattr(local, 'session'):
+                local.session = requests.Session()
+            started = time.perf_counter()
+            try:
+                response = local.session.post(web_url + reverse('payments:stk push'), json={
+                    'phone_number': f'2547{random.randrange(10 ** 8):08d}',
+                    'amount': random.randint(1, 5000),
+                    'account_reference': tag,
+                    'transaction_desc': 'Load test',
+                }, timeout=60)
+            except requests.RequestException as exc:
+                errors[type(exc).__name__] += 1
+                return
+            elapsed = (time.perf_counter() - started) * 1000
+            if response.status_code != 202:
+                errors[response.status_code] += 1
+                return
+            with lock:
+                push_latency.append(elapsed)
+                submitted[response.json()['id']] = started
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            list(executor.map(push, range(options['payments'])))
+        submit_elapsed = time.perf_counter() - started
+
+        # Watch for final statuses; these reads aren't part of any payment.
+        finished = {}
+        deadline = started + options['timeout']
+        with counter.stage('load test monitor'):
+            while len(finished) < len(submitted) and time.perf_counter() < deadline:
+                now = time.perf_counter()
+                for request_id, status in (
+                    MpesaRequest.objects.filter(account_reference=tag)
+                    .exclude(status__in=[MpesaRequest.QUEUED, MpesaRequest.PENDING])
+                    .exclude(id__in=finished).values_list('id', 'status')
+                ):
+                    finished[request_id] = (status, (now - submitted[request_id]) * 1000)
+                time.sleep(0.1)
+        finish_elapsed = time.perf_counter() - started
+
+        return {
+            'submitted': len(submitted),
+            'errors': errors,
+            'submit_elapsed': submit_elapsed,
+            'finish_elapsed': finish_elapsed,
+            'push_latency': push_latency,
+            'finished': finished,
+        }
+
+    def _cleanup(self):
+        load_test_requests = MpesaRequest.objects.filter(account_reference__startswith=ACCOUNT_REFERENCE)
+        checkout_ids = list(
+            MpesaResponse.objects.filter(request__in=load_test_requests, checkout_request_id__isnull=False)
+            .values_list('checkout_request_id', flat=True)
+        )
+        MpesaCallbackInbox.objects.filter(checkout_request_id__in=checkout_ids).delete()
+        deleted, _ = load_test_requests.delete()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} load test objects'))
+
+    def _report(self, results, timings, counter, daraja_stats):
+        submitted = results['submitted']
+        finished = results['finished']
+        self.stdout.write(
+            f'{submitted} pushes accepted in {results["submit_elapsed"]:.2f}s '
+            f'({submitted / results["submit_elapsed"]:.1f}/s); {len(finished)} final after '
+            f'{results["finish_elapsed"]:.2f}s ({len(finished) / results["finish_elapsed"]:.1f}/s)'
+        )
+        outcomes = Counter(status for status, _ in finished.values())
+        outcomes['still waiting'] = submitted - len(finished)
+        outcomes.update({f'rejected ({k})': v for k, v in results['errors'].items()})
+        self.stdout.write('Outcomes: ' + ', '.join(f'{k}: {v}' for k, v in sorted(outcomes.items()) if v))
+        self.stdout.write(self._latency_line('STK push request', results['push_latency']))
+        self.stdout.write(self._latency_line('Callback request (server side)', timings.get('mpesa-callback', [])))
+        self.stdout.write(self._latency_line('Push to final status', [ms for _, ms in finished.values()]))
+
+        counts = dict(counter.counts)
+        counts.pop('load test monitor', None)
+        if submitted:
+            total = sum(counts.values())
+            self.stdout.write(f'Database queries per payment: {total / submitted:.1f}')
+            for stage, n in sorted(counts.items(), key=lambda item: -item[1]):
+                self.stdout.write(f'  {stage:<40}{n / submitted:>8.2f}')
+        self.stdout.write('Fake Daraja: ' + ', '.join(f'{k}: {v}' for k, v in sorted(daraja_stats.items())))
+
+        if submitted and len(finished) == submitted and not results['errors']:
+            self.stdout.write(self.style.SUCCESS('Every payment reached a final status'))
+        else:
+            self.stdout.write(self.style.WARNING(
+                'Some payments were rejected or are still waiting; lost callbacks wait for the reconciler'
+            ))
+
+    def _latency_line(self, label, samples):
+        if not samples:
+            return f'{label}: no samples'
+        return (
+            f'{label} (ms): p50 {percentile(samples, 50):.0f}, '
+            f'p95 {percentile(samples, 95):.0f}, p99 {percentile(samples, 99):.0f}, '
+            f'max {max(samples):.0f} (n={len(samples)})'
+        )
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from payments.callbacks import process_inbox
+from payments.models import MpesaCallbackInbox
+
+
+class Command(BaseCommand):
+    help = 'Apply every STK callback waiting in the inbox in this process (no Celery worker needed)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help='Entries per transaction')
+
+    def handle(self, *args, **options):
+        handled = process_inbox(batch_size=options['batch_size'])
+        waiting = MpesaCallbackInbox.objects.filter(processed_at__isnull=True).count()
+        self.stdout.write(self.style.SUCCESS(
+            f'Handled {handled} inbox entries ({waiting} still waiting for their STK response)'
+        ))
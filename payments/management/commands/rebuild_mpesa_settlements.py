@@ -0,0 +1,24 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from payments.settlements import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Recompute the daily M-Pesa settlement rollup from the payment tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=date.fromisoformat, default=None,
+                            help='First day, YYYY-MM-DD (default: --days before --end)')
+        parser.add_argument('--end', type=date.fromisoformat, default=None, help='Last day (default: today)')
+        parser.add_argument('--days', type=int, default=31, help='Days to rebuild when --start is not given')
+
+    def handle(self, *args, **options):
+        end = options['end'] or timezone.localdate()
+        start = options['start'] or end - timedelta(days=options['days'] - 1)
+        if start > end:
+            raise CommandError('--start must not be after --end')
+        rows = rebuild(start, end)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {start} to {end}: {rows} day/shortcode rows'))
@@ -0,0 +1,36 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from payments.models import MpesaRequest
+from payments.reconcile import reconcile_stale_requests
+
+
+class Command(BaseCommand):
+    help = (
+        'Ask Daraja about PENDING STK pushes whose callback has not come, in this '
+        'process (no Celery worker needed)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=None, help='Requests per batch')
+        parser.add_argument('--batches', type=int, default=1, help='Batches to run (0 runs until none are due)')
+        parser.add_argument('--due-now', action='store_true',
+                            help='Check every PENDING request now instead of waiting for its backoff')
+
+    def handle(self, *args, **options):
+        if options['due_now']:
+            MpesaRequest.objects.filter(status=MpesaRequest.PENDING).update(next_reconcile_at=timezone.now())
+
+        totals = Counter()
+        batches = 0
+        while not options['batches'] or batches < options['batches']:
+            counts = reconcile_stale_requests(limit=options['limit'])
+            if not counts:
+                break
+            totals.update(counts)
+            batches += 1
+
+        summary = ', '.join(f'{k}: {v}' for k, v in sorted(totals.items())) or 'nothing due'
+        self.stdout.write(self.style.SUCCESS(f'Reconciled {batches} batch(es) - {summary}'))
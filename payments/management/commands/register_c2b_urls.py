@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from payments.c2b import register_urls
+from payments.exceptions import MpesaError
+
+
+class Command(BaseCommand):
+    help = "Register this server's C2B validation and confirmation URLs with Daraja"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default=None,
+                            help='Public base URL of this server (default: MPESA_CALLBACK_URL)')
+
+    def handle(self, *args, **options):
+        try:
+            data = register_urls(options['base_url'])
+        except MpesaError as e:
+            raise CommandError(f'Registration failed: {e} {e.response_data or ""}')
+        self.stdout.write(self.style.SUCCESS(f'Registered: {data}'))
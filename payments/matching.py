@@ -0,0 +1,232 @@
+"""
+Matching M-Pesa payments to the sales and customer payments they paid for.
+
+`match_callbacks()` (run by the `match_mpesa_payments` Beat task) takes
+successful `MpesaCallback`s it hasn't dealt with, in batches, and for each:
+
+1. If the push's account reference names a sale (`SALE-<id>`) or a
+   customer payment (`PAY-<id>`) and the amounts agree, links them.
+2. Otherwise looks for an unmatched M-Pesa sale, or customer payment, of
+   the same amount by a customer with the same phone number, made within
+   TIME_WINDOW of the payment. Exactly one candidate is a match.
+
+Anything else goes to the exceptions queue (`MatchException`) for finance,
+with the candidates found. Each batch costs a fixed handful of queries
+whatever its size: candidates are read with one indexed range scan per
+table and joined to the payments through dictionaries keyed on (amount,
+phone) and on id, never by comparing every pair.
+"""
+
+import logging
+import re
+from collections import Counter, defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from redis.exceptions import RedisError
+
+from branchpoint_backend.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+LOCK_KEY = 'mpesa:matching:lock'
+
+
+def normalize_phone(value):
+    """Last nine digits of a Kenyan number, so 07.., 2547.. and +2547.. agree"""
+    digits = re.sub(r'\D', '', str(value or ''))
+    return digits[-9:] if len(digits) >= 9 else None
+
+
+def parse_reference(reference):
+    """('sale' | 'customer_payment', id) named by an account reference, or None"""
+    config = settings.MPESA_MATCHING
+    reference = (reference or '').strip().upper()
+    for kind, prefix in (('sale', config['SALE_REFERENCE_PREFIX']),
+                         ('customer_payment', config['PAYMENT_REFERENCE_PREFIX'])):
+        if reference.startswith(prefix) and reference[len(prefix):].isdigit():
+            return kind, int(reference[len(prefix):])
+    return None
+
+
+def match_callbacks(batch_size=None, max_batches=None):
+    """Match unreconciled M-Pesa payments; returns a Counter of outcomes"""
+    config = settings.MPESA_MATCHING
+    counts = Counter()
+    # Concurrent runs could give one sale to two payments; run one at a time.
+    try:
+        if not get_redis().set(LOCK_KEY, 1, nx=True, ex=config['LOCK_TIMEOUT']):
+            logger.info('M-Pesa payment matching is already running')
+            return counts
+        locked = True
+    except RedisError:
+        locked = False
+
+    try:
+        batches = 0
+        last_id = 0
+        while max_batches is None or batches < max_batches:
+            batch_counts, last_id = _match_next_batch(batch_size or config['BATCH_SIZE'], last_id)
+            if not batch_counts:
+                break
+            counts.update(batch_counts)
+            batches += 1
+    finally:
+        if locked:
+            try:
+                get_redis().delete(LOCK_KEY)
+            except RedisError:
+                pass
+    if counts:
+        logger.info('Matched M-Pesa payments: %s', dict(counts))
+    return counts
+
+
+def _match_next_batch(batch_size, last_id):
+    from .models import MpesaCallback
+
+    with transaction.atomic():
+        rows = list(
+            MpesaCallback.objects.select_for_update(skip_locked=True, of=('self',))
+            .filter(reconciled_at__isnull=True, result_code='0', id__gt=last_id)
+            .order_by('id')
+            .values('id', 'amount', 'phone_number', 'transaction_date', 'timestamp',
+                    'response__request__account_reference', 'response__request__amount',
+                    'response__request__phone_number')[:batch_size]
+        )
+        if not rows:
+            return None, last_id
+        try:
+            with transaction.atomic():
+                counts = _match_batch(rows)
+        except IntegrityError:
+            # A sale was matched by hand meanwhile; try again next run.
+            logger.warning('M-Pesa payment matching conflicted with another match; skipping batch',
+                           exc_info=True)
+            counts = Counter(conflicts=len(rows))
+    return counts, rows[-1]['id']
+
+
+def _payments(rows):
+    """Normalise a batch's rows: stk_query results have no amount or phone"""
+    for row in rows:
+        yield {
+            'id': row['id'],
+            'amount': row['amount'] if row['amount'] is not None else row['response__request__amount'],
+            'phone': normalize_phone(row['phone_number'] or row['response__request__phone_number']),
+            'at': row['transaction_date'] or row['timestamp'],
+            'reference': parse_reference(row['response__request__account_reference']),
+        }
+
+
+def _match_batch(rows):
+    from sales.models import Payment, Sale
+    from .models import MatchException, MpesaCallback, PaymentMatch
+
+    payments = list(_payments(rows))
+    matches = []
+    exceptions = []
+    used = set()  # (kind, id) matched in this batch
+    counts = Counter()
+
+    def match(payment, kind, target_id, rule):
+        used.add((kind, target_id))
+        matches.append(PaymentMatch(callback_id=payment['id'], rule=rule, **{f'{kind}_id': target_id}))
+        counts[f'matched_{rule}'] += 1
+
+    def exception(payment, reason, candidates=()):
+        exceptions.append(MatchException(
+            callback_id=payment['id'], reason=reason,
+            candidates=[{kind: target_id} for kind, target_id in candidates],
+        ))
+        counts[reason] += 1
+
+    # 1. Account references, looked up by primary key
+    referenced = defaultdict(set)
+    for payment in payments:
+        if payment['reference']:
+            referenced[payment['reference'][0]].add(payment['reference'][1])
+    targets = {}
+    for kind, model, amount_field in (('sale', Sale, 'total_amount'), ('customer_payment', Payment, 'amount')):
+        if referenced[kind]:
+            for target_id, amount, matched in (
+                model.objects.filter(id__in=referenced[kind])
+                .values_list('id', amount_field, 'mpesa_match__id')
+            ):
+                targets[(kind, target_id)] = (amount, matched is not None)
+
+    unreferenced = []
+    for payment in payments:
+        target = targets.get(payment['reference'])
+        if target is None:
+            # No reference, or it names nothing; try amount and phone.
+            unreferenced.append(payment)
+            continue
+        amount, already_matched = target
+        if already_matched or payment['reference'] in used:
+            exception(payment, MatchException.ALREADY_MATCHED, [payment['reference']])
+        elif amount != payment['amount']:
+            exception(payment, MatchException.AMOUNT_MISMATCH, [payment['reference']])
+        else:
+            match(payment, *payment['reference'], PaymentMatch.REFERENCE)
+
+    # 2. Amount, phone and time window: one range scan per table, then a
+    # hash join on (amount, phone)
+    window = timedelta(seconds=settings.MPESA_MATCHING['TIME_WINDOW'])
+    candidates = defaultdict(list)
+    matchable = [p for p in unreferenced if p['amount'] is not None and p['phone'] and p['at']]
+    if matchable:
+        start = min(p['at'] for p in matchable) - window
+        end = max(p['at'] for p in matchable) + window
+        amounts = {p['amount'] for p in matchable}
+        scans = (
+            ('sale', Sale.objects.filter(payment_method='mpesa', created_at__range=(start, end),
+                                         total_amount__in=amounts, mpesa_match__isnull=True)
+             .values_list('id', 'total_amount', 'customer__phone_number', 'created_at')),
+            ('customer_payment', Payment.objects.filter(received_at__range=(start, end), amount__in=amounts,
+                                                        mpesa_match__isnull=True)
+             .values_list('id', 'amount', 'customer__phone_number', 'received_at')),
+        )
+        for kind, queryset in scans:
+            for target_id, amount, phone, at in queryset:
+                phone = normalize_phone(phone)
+                if phone and (kind, target_id) not in used:
+                    candidates[(Decimal(amount), phone)].append((kind, target_id, at))
+
+    for payment in unreferenced:
+        found = [
+            (kind, target_id) for kind, target_id, at in candidates.get((payment['amount'], payment['phone']), ())
+            if payment['at'] and abs(at - payment['at']) <= window and (kind, target_id) not in used
+        ]
+        if len(found) == 1:
+            match(payment, *found[0], PaymentMatch.AMOUNT_PHONE)
+        elif found:
+            exception(payment, MatchException.AMBIGUOUS, found)
+        else:
+            exception(payment, MatchException.UNMATCHED)
+
+    PaymentMatch.objects.bulk_create(matches)
+    MatchException.objects.bulk_create(exceptions)
+    MpesaCallback.objects.filter(id__in=[p['id'] for p in payments]).update(reconciled_at=timezone.now())
+    return counts
+
+
+def retry_exceptions(reasons=None):
+    """
+    Send open exceptions back to the matcher, e.g. once late sales have
+    been recorded. Returns how many were reopened.
+    """
+    from .models import MatchException, MpesaCallback
+
+    reasons = reasons or [MatchException.UNMATCHED, MatchException.AMBIGUOUS]
+    with transaction.atomic():
+        callback_ids = list(
+            MatchException.objects.filter(resolved_at__isnull=True, reason__in=reasons)
+            .values_list('callback_id', flat=True)
+        )
+        MatchException.objects.filter(callback_id__in=callback_ids).delete()
+        MpesaCallback.objects.filter(id__in=callback_ids).update(reconciled_at=None)
+    return len(callback_ids)
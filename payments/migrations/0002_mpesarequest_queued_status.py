@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-19 00:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='mpesarequest',
+            name='status',
+            field=models.CharField(choices=[('QUEUED', 'Queued'), ('PENDING', 'Pending'), ('SUCCESS', 'Success'), ('FAILED', 'Failed')], default='PENDING', max_length=20),
+        ),
+    ]
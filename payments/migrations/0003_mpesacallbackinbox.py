@@ -0,0 +1,31 @@
+# Generated by Django 5.2.1 on 2026-10-19 00:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0002_mpesarequest_queued_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MpesaCallbackInbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('checkout_request_id', models.CharField(blank=True, max_length=255, null=True, unique=True)),
+                ('body', models.TextField()),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('error', models.CharField(blank=True, max_length=255)),
+            ],
+            options={
+                'verbose_name': 'M-Pesa Callback Inbox Entry',
+                'verbose_name_plural': 'M-Pesa Callback Inbox',
+                'ordering': ['id'],
+                'indexes': [models.Index(condition=models.Q(('processed_at__isnull', True)), fields=['id'], name='mpesa_inbox_unprocessed_idx')],
+            },
+        ),
+    ]
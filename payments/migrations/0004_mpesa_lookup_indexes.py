@@ -0,0 +1,60 @@
+# Generated by Django 5.2.1 on 2026-10-19 00:58
+
+from django.db import migrations, models
+from django.db.models import Count, Exists, OuterRef
+
+
+def dedupe_response_ids(apps, schema_editor):
+    """
+    Make Daraja's IDs unique before the unique indexes go on. Blank IDs become
+    NULL. Of responses sharing an ID, the one with a callback (else the
+    oldest) keeps it and the others get a `dup-<pk>:` prefix, so nothing is
+    deleted and the original value can still be read.
+    """
+    MpesaResponse = apps.get_model('payments', 'MpesaResponse')
+    MpesaCallback = apps.get_model('payments', 'MpesaCallback')
+
+    for field in ('checkout_request_id', 'merchant_request_id'):
+        MpesaResponse.objects.filter(**{field: ''}).update(**{field: None})
+        duplicated = list(
+            MpesaResponse.objects.filter(**{f'{field}__isnull': False})
+            .values(field).annotate(n=Count('id')).filter(n__gt=1).values_list(field, flat=True)
+        )
+        for value in duplicated:
+            rows = list(
+                MpesaResponse.objects.filter(**{field: value})
+                .annotate(has_callback=Exists(MpesaCallback.objects.filter(response=OuterRef('pk'))))
+                .order_by('-has_callback', 'id')
+            )
+            for row in rows[1:]:
+                setattr(row, field, f'dup-{row.pk}:{value}'[:255])
+                row.save(update_fields=[field])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0003_mpesacallbackinbox'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_response_ids, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='mpesaresponse',
+            name='checkout_request_id',
+            field=models.CharField(blank=True, max_length=255, null=True, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='mpesaresponse',
+            name='merchant_request_id',
+            field=models.CharField(blank=True, max_length=255, null=True, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name='mpesarequest',
+            index=models.Index(fields=['-timestamp'], name='mpesa_request_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mpesarequest',
+            index=models.Index(fields=['status', '-timestamp'], name='mpesa_request_status_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.1 on 2026-10-19 01:00
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def schedule_pending(apps, schema_editor):
+    """Let the reconciler check requests that were already PENDING"""
+    MpesaRequest = apps.get_model('payments', 'MpesaRequest')
+    MpesaRequest.objects.filter(status='PENDING').update(next_reconcile_at=timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0004_mpesa_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mpesarequest',
+            name='next_reconcile_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='mpesarequest',
+            name='reconcile_attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.RunPython(schedule_pending, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='mpesarequest',
+            index=models.Index(condition=models.Q(('status', 'PENDING')), fields=['next_reconcile_at'], name='mpesa_request_reconcile_idx'),
+        ),
+    ]
@@ -0,0 +1,88 @@
+# Generated by Django 5.2.1 on 2026-10-19 01:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0005_mpesarequest_reconcile'),
+        ('sales', '0002_sale_payment_time_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MatchException',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reason', models.CharField(choices=[('unmatched', 'No matching sale or payment'), ('ambiguous', 'Several possible matches'), ('amount_mismatch', 'Referenced sale or payment has a different amount'), ('already_matched', 'Referenced sale or payment is already paid')], max_length=20)),
+                ('candidates', models.JSONField(blank=True, default=list)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('resolved_at', models.DateTimeField(blank=True, null=True)),
+                ('note', models.CharField(blank=True, max_length=255)),
+            ],
+            options={
+                'verbose_name': 'M-Pesa Match Exception',
+                'verbose_name_plural': 'M-Pesa Match Exceptions',
+                'ordering': ['created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='PaymentMatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rule', models.CharField(choices=[('reference', 'Account reference'), ('amount_phone', 'Amount, phone and time'), ('manual', 'Manual')], max_length=20)),
+                ('matched_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'M-Pesa Payment Match',
+                'verbose_name_plural': 'M-Pesa Payment Matches',
+                'ordering': ['-matched_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='mpesacallback',
+            name='reconciled_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='mpesacallback',
+            index=models.Index(condition=models.Q(('reconciled_at__isnull', True), ('result_code', '0')), fields=['id'], name='mpesa_callback_unmatched_idx'),
+        ),
+        migrations.AddField(
+            model_name='matchexception',
+            name='callback',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='match_exception', to='payments.mpesacallback'),
+        ),
+        migrations.AddField(
+            model_name='matchexception',
+            name='resolved_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='paymentmatch',
+            name='callback',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='match', to='payments.mpesacallback'),
+        ),
+        migrations.AddField(
+            model_name='paymentmatch',
+            name='customer_payment',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='mpesa_match', to='sales.payment'),
+        ),
+        migrations.AddField(
+            model_name='paymentmatch',
+            name='sale',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='mpesa_match', to='sales.sale'),
+        ),
+        migrations.AddIndex(
+            model_name='matchexception',
+            index=models.Index(condition=models.Q(('resolved_at__isnull', True)), fields=['created_at'], name='mpesa_match_exc_open_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='paymentmatch',
+            constraint=models.CheckConstraint(condition=models.Q(models.Q(('customer_payment__isnull', True), ('sale__isnull', False)), models.Q(('customer_payment__isnull', False), ('sale__isnull', True)), _connector='OR'), name='payment_match_one_target'),
+        ),
+    ]
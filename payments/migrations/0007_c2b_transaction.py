@@ -0,0 +1,35 @@
+# Generated by Django 5.2.1 on 2026-10-19 01:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0006_payment_matching'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='C2BTransaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('trans_id', models.CharField(help_text='M-Pesa receipt number', max_length=20, unique=True)),
+                ('trans_type', models.CharField(blank=True, max_length=20)),
+                ('trans_time', models.DateTimeField()),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('short_code', models.CharField(max_length=10)),
+                ('bill_ref_number', models.CharField(blank=True, help_text='Account number the customer entered', max_length=50)),
+                ('msisdn', models.CharField(blank=True, max_length=64)),
+                ('first_name', models.CharField(blank=True, max_length=50)),
+                ('org_account_balance', models.DecimalField(blank=True, decimal_places=2, max_digits=14, null=True)),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'M-Pesa C2B Transaction',
+                'verbose_name_plural': 'M-Pesa C2B Transactions',
+                'ordering': ['-trans_time'],
+                'indexes': [models.Index(fields=['-trans_time'], name='mpesa_c2b_time_idx'), models.Index(fields=['bill_ref_number'], name='mpesa_c2b_bill_ref_idx')],
+            },
+        ),
+    ]
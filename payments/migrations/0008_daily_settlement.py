@@ -0,0 +1,34 @@
+# Generated by Django 5.2.1 on 2026-10-19 01:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0007_c2b_transaction'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySettlement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('short_code', models.CharField(max_length=10)),
+                ('successful_count', models.PositiveIntegerField(default=0)),
+                ('successful_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('failed_count', models.PositiveIntegerField(default=0)),
+                ('failed_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('c2b_count', models.PositiveIntegerField(default=0)),
+                ('c2b_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'M-Pesa Daily Settlement',
+                'verbose_name_plural': 'M-Pesa Daily Settlements',
+                'ordering': ['-date', 'short_code'],
+                'constraints': [models.UniqueConstraint(fields=('date', 'short_code'), name='mpesa_settlement_day_unique')],
+            },
+        ),
+    ]
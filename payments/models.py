@@ -1,18 +1,35 @@
 # payments/models.py
 
+from django.conf import settings
 from django.db import models
 from django.utils import timezone
 
 
 class MpesaRequest(models.Model):
+    QUEUED = 'QUEUED'
+    PENDING = 'PENDING'
+    SUCCESS = 'SUCCESS'
+    FAILED = 'FAILED'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (PENDING, 'Pending'),
+        (SUCCESS, 'Success'),
+        (FAILED, 'Failed'),
+    ]
+
     phone_number = models.CharField(max_length=15, help_text="Phone number in format 2547XXXXXXXX")
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     account_reference = models.CharField(max_length=50)
     transaction_desc = models.CharField(max_length=255)
-    # Added status field to MpesaRequest for easier tracking
-    status = models.CharField(max_length=20, default='PENDING',
-                              choices=[('PENDING', 'Pending'), ('SUCCESS', 'Success'), ('FAILED', 'Failed')])
+    # QUEUED until a worker sends the push, PENDING while waiting for the
+    # customer, then SUCCESS or FAILED
+    status = models.CharField(max_length=20, default=PENDING, choices=STATUS_CHOICES)
     timestamp = models.DateTimeField(auto_now_add=True)
+    # When the reconciler should next ask Daraja about this request if it
+    # is still PENDING (see payments/reconcile.py); NULL once the
+    # reconciler is done with it.
+    next_reconcile_at = models.DateTimeField(blank=True, null=True)
+    reconcile_attempts = models.PositiveSmallIntegerField(default=0)
 
     def __str__(self):
         return f"{self.phone_number} - {self.amount} - {self.status} @ {self.timestamp.strftime('%Y-%m-%d %H:%M:%S')}"
@@ -29,12 +46,20 @@ class MpesaRequest(models.Model):
         ordering = ['-timestamp']
         verbose_name = "M-Pesa Request"
         verbose_name_plural = "M-Pesa Requests"
+        indexes = [
+            models.Index(fields=['-timestamp'], name='mpesa_request_time_idx'),
+            models.Index(fields=['status', '-timestamp'], name='mpesa_request_status_idx'),
+            models.Index(fields=['next_reconcile_at'], condition=models.Q(status='PENDING'),
+                         name='mpesa_request_reconcile_idx'),
+        ]
 
 
 class MpesaResponse(models.Model):
     request = models.ForeignKey(MpesaRequest, on_delete=models.CASCADE, related_name='responses')
-    merchant_request_id = models.CharField(max_length=255, blank=True, null=True)
-    checkout_request_id = models.CharField(max_length=255, blank=True, null=True)
+    # Daraja's IDs for the push, unique per push. Rejected pushes have none;
+    # store NULL rather than '' so they don't collide.
+    merchant_request_id = models.CharField(max_length=255, unique=True, blank=True, null=True)
+    checkout_request_id = models.CharField(max_length=255, unique=True, blank=True, null=True)
     response_code = models.CharField(max_length=10, blank=True, null=True)
     response_description = models.CharField(max_length=255, blank=True, null=True)
     customer_message = models.CharField(max_length=255, blank=True, null=True)
@@ -67,11 +92,13 @@ class MpesaCallback(models.Model):
     amount = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
     callback_metadata = models.JSONField(blank=True, null=True, help_text="Raw callback metadata from Safaricom")
     timestamp = models.DateTimeField(auto_now_add=True)
+    # When the matcher dealt with this payment (matched it to a sale or
+    # queued an exception); see payments/matching.py
+    reconciled_at = models.DateTimeField(blank=True, null=True)
 
     def __str__(self):
-        # Ensure that self.response.request exists before accessing
-        request_info = f"request ID {self.response.request.id}" if hasattr(self.response, 'request') else "unknown request"
-        return f"Callback for {request_info} - Result: {self.result_code}"
+        # request_id only; loading the request would cost a query per row in admin lists
+        return f"Callback for request ID {self.response.request_id} - Result: {self.result_code}"
 
     def is_successful(self):
         return self.result_code == "0"
@@ -81,4 +108,176 @@ class MpesaCallback(models.Model):
     class Meta:
         ordering = ['-timestamp']
         verbose_name = "M-Pesa Callback"
-        verbose_name_plural = "M-Pesa Callbacks"
\ No newline at end of file
+        verbose_name_plural = "M-Pesa Callbacks"
+        indexes = [
+            # The matcher only scans successful payments it hasn't seen.
+            models.Index(fields=['id'], condition=models.Q(reconciled_at__isnull=True, result_code='0'),
+                         name='mpesa_callback_unmatched_idx'),
+        ]
+
+class MpesaCallbackInbox(models.Model):
+    """
+    Raw STK callbacks as Safaricom delivered them, stored before any
+    parsing so the endpoint can acknowledge at once. Workers drain
+    unprocessed rows in batches (see payments/callbacks.py). The body is
+    never changed after insert; only the processing fields are.
+    """
+    checkout_request_id = models.CharField(max_length=255, unique=True, blank=True, null=True)
+    body = models.TextField()
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(blank=True, null=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.CharField(max_length=255, blank=True)
+
+    def __str__(self):
+        return f"Callback {self.checkout_request_id or self.pk} @ {self.received_at:%Y-%m-%d %H:%M:%S}"
+
+    class Meta:
+        ordering = ['id']
+        verbose_name = "M-Pesa Callback Inbox Entry"
+        verbose_name_plural = "M-Pesa Callback Inbox"
+        indexes = [
+            # Only the backlog is scanned, so keep the index to that.
+            models.Index(fields=['id'], condition=models.Q(processed_at__isnull=True),
+                         name='mpesa_inbox_unprocessed_idx'),
+        ]
+
+
+class C2BTransaction(models.Model):
+    """
+    A payment a customer made straight to the paybill, as confirmed by
+    Safaricom's C2B confirmation (see payments/c2b.py). Only the fields we
+    use are kept; the receipt number is unique, so redeliveries are
+    dropped on insert.
+    """
+    trans_id = models.CharField(max_length=20, unique=True, help_text="M-Pesa receipt number")
+    trans_type = models.CharField(max_length=20, blank=True)
+    trans_time = models.DateTimeField()
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    short_code = models.CharField(max_length=10)
+    bill_ref_number = models.CharField(max_length=50, blank=True, help_text="Account number the customer entered")
+    # Safaricom masks or hashes the payer's number on newer APIs.
+    msisdn = models.CharField(max_length=64, blank=True)
+    first_name = models.CharField(max_length=50, blank=True)
+    org_account_balance = models.DecimalField(max_digits=14, decimal_places=2, blank=True, null=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.trans_id} - {self.amount} to {self.short_code} @ {self.trans_time:%Y-%m-%d %H:%M:%S}"
+
+    class Meta:
+        ordering = ['-trans_time']
+        verbose_name = "M-Pesa C2B Transaction"
+        verbose_name_plural = "M-Pesa C2B Transactions"
+        indexes = [
+            models.Index(fields=['-trans_time'], name='mpesa_c2b_time_idx'),
+            models.Index(fields=['bill_ref_number'], name='mpesa_c2b_bill_ref_idx'),
+        ]
+
+
+class PaymentMatch(models.Model):
+    """
+    A successful M-Pesa payment linked to the sale or customer payment it
+    paid for (see payments/matching.py). Each side is matched at most once.
+    """
+    REFERENCE = 'reference'
+    AMOUNT_PHONE = 'amount_phone'
+    MANUAL = 'manual'
+    RULE_CHOICES = [
+        (REFERENCE, 'Account reference'),
+        (AMOUNT_PHONE, 'Amount, phone and time'),
+        (MANUAL, 'Manual'),
+    ]
+
+    callback = models.OneToOneField(MpesaCallback, on_delete=models.CASCADE, related_name='match')
+    sale = models.OneToOneField('sales.Sale', on_delete=models.CASCADE, blank=True, null=True,
+                                related_name='mpesa_match')
+    customer_payment = models.OneToOneField('sales.Payment', on_delete=models.CASCADE, blank=True, null=True,
+                                            related_name='mpesa_match')
+    rule = models.CharField(max_length=20, choices=RULE_CHOICES)
+    matched_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        target = f"sale #{self.sale_id}" if self.sale_id else f"payment #{self.customer_payment_id}"
+        return f"Callback #{self.callback_id} -> {target} ({self.get_rule_display()})"
+
+    class Meta:
+        ordering = ['-matched_at']
+        verbose_name = "M-Pesa Payment Match"
+        verbose_name_plural = "M-Pesa Payment Matches"
+        constraints = [
+            models.CheckConstraint(
+                condition=models.Q(sale__isnull=False, customer_payment__isnull=True)
+                | models.Q(sale__isnull=True, customer_payment__isnull=False),
+                name='payment_match_one_target',
+            ),
+        ]
+
+
+class MatchException(models.Model):
+    """
+    A successful M-Pesa payment the matcher couldn't link on its own,
+    waiting for finance. `candidates` lists the sales/customer payments it
+    could have been, as {"sale": id} or {"customer_payment": id}.
+    """
+    UNMATCHED = 'unmatched'
+    AMBIGUOUS = 'ambiguous'
+    AMOUNT_MISMATCH = 'amount_mismatch'
+    ALREADY_MATCHED = 'already_matched'
+    REASON_CHOICES = [
+        (UNMATCHED, 'No matching sale or payment'),
+        (AMBIGUOUS, 'Several possible matches'),
+        (AMOUNT_MISMATCH, 'Referenced sale or payment has a different amount'),
+        (ALREADY_MATCHED, 'Referenced sale or payment is already paid'),
+    ]
+
+    callback = models.OneToOneField(MpesaCallback, on_delete=models.CASCADE, related_name='match_exception')
+    reason = models.CharField(max_length=20, choices=REASON_CHOICES)
+    candidates = models.JSONField(default=list, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    resolved_at = models.DateTimeField(blank=True, null=True)
+    resolved_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, blank=True, null=True,
+                                    related_name='+')
+    note = models.CharField(max_length=255, blank=True)
+
+    def __str__(self):
+        return f"Callback #{self.callback_id}: {self.get_reason_display()}"
+
+    class Meta:
+        ordering = ['created_at']
+        verbose_name = "M-Pesa Match Exception"
+        verbose_name_plural = "M-Pesa Match Exceptions"
+        indexes = [
+            models.Index(fields=['created_at'], condition=models.Q(resolved_at__isnull=True),
+                         name='mpesa_match_exc_open_idx'),
+        ]
+
+
+class DailySettlement(models.Model):
+    """
+    Per day and shortcode totals of M-Pesa payments, kept up to date as
+    results arrive (see payments/settlements.py), so reports never scan
+    the payment tables. Days are local dates.
+    """
+    date = models.DateField()
+    short_code = models.CharField(max_length=10)
+    # STK pushes, by the result the request settled on
+    successful_count = models.PositiveIntegerField(default=0)
+    successful_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    failed_count = models.PositiveIntegerField(default=0)
+    failed_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    # Payments made straight to the paybill
+    c2b_count = models.PositiveIntegerField(default=0)
+    c2b_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.short_code} on {self.date}: {self.successful_count + self.c2b_count} payments"
+
+    class Meta:
+        ordering = ['-date', 'short_code']
+        verbose_name = "M-Pesa Daily Settlement"
+        verbose_name_plural = "M-Pesa Daily Settlements"
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'short_code'], name='mpesa_settlement_day_unique'),
+        ]
@@ -0,0 +1,171 @@
+"""
+Reconciler for STK pushes whose callback never came.
+
+Callbacks get lost, and a request left PENDING invites the cashier to push
+again and charge the customer twice. `submit_push()` sets
+`next_reconcile_at` STALE_AFTER seconds ahead; the `reconcile_stale_requests`
+Beat task picks requests still PENDING past that time (one partial-index
+range scan), asks Daraja's STK query API about them a few at a time, and
+feeds final results to `apply_outcomes()` - the same idempotent path the
+callback worker uses, so a callback that turns up later is still recorded.
+
+Requests Daraja is still processing are tried again with exponential
+backoff. Taking a batch pushes its `next_reconcile_at` forward first, which
+doubles as a lease: overlapping runs don't query the same requests. After
+MAX_ATTEMPTS a request is left PENDING for a person to check, rather than
+guessed at.
+"""
+
+import logging
+import random
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, DateTimeField, F, Value, When
+from django.utils import timezone
+
+from .breaker import mpesa_breaker
+from .callbacks import apply_outcomes
+from .client import mpesa_client
+from .exceptions import MpesaError, MpesaUnavailable
+
+logger = logging.getLogger(__name__)
+
+# Daraja's answers meaning "no result yet": an HTTP 500 with this error
+# code, or a result code of 4999.
+PROCESSING_ERROR_CODE = '500.001.1001'
+PROCESSING_RESULT_CODE = '4999'
+
+
+def backoff(attempts):
+    """Seconds to wait before the next query, with jitter"""
+    config = settings.MPESA_RECONCILE
+    delay = min(config['BACKOFF_MAX'], config['BACKOFF_BASE'] * 2 ** max(0, attempts - 1))
+    return random.uniform(delay / 2, delay)
+
+
+def claim_due(limit):
+    """
+    Take up to `limit` due requests and push their next check out by
+    their backoff. Returns {request id: attempts including this one}.
+    """
+    from .models import MpesaRequest
+
+    now = timezone.now()
+    with transaction.atomic():
+        due = list(
+            MpesaRequest.objects.select_for_update(skip_locked=True)
+            .filter(status=MpesaRequest.PENDING, next_reconcile_at__lte=now)
+            .order_by('next_reconcile_at')
+            .values_list('id', 'reconcile_attempts')[:limit]
+        )
+        if not due:
+            return {}
+        claimed = {request_id: attempts + 1 for request_id, attempts in due}
+        MpesaRequest.objects.filter(id__in=claimed).update(
+            reconcile_attempts=F('reconcile_attempts') + 1,
+            next_reconcile_at=Case(
+                *[When(id=i, then=Value(now + timedelta(seconds=backoff(n)))) for i, n in claimed.items()],
+                output_field=DateTimeField(),
+            ),
+        )
+    return claimed
+
+
+def query_result(checkout_request_id):
+    """
+    Ask Daraja about one push. Returns the `MpesaCallback` fields for a
+    final result, or None while Daraja is still processing it.
+    """
+    try:
+        # No client retries; the backoff above spaces out our attempts.
+        data = mpesa_client.stk_query(checkout_request_id, max_retries=0)
+    except MpesaError as e:
+        if e.response_data and e.response_data.get('errorCode') == PROCESSING_ERROR_CODE:
+            return None
+        raise
+
+    result_code = data.get('ResultCode')
+    if result_code is None or str(result_code) == PROCESSING_RESULT_CODE:
+        return None
+    return {
+        'result_code': str(result_code),
+        'result_description': (data.get('ResultDesc') or '')[:255],
+        'mpesa_receipt_number': None,
+        'transaction_date': None,
+        'phone_number': None,
+        'amount': None,
+        'callback_metadata': {'source': 'stk_query', 'response': data},
+    }
+
+
+def reconcile_stale_requests(limit=None):
+    """Check one batch of due PENDING requests; returns a Counter of outcomes"""
+    from .models import MpesaRequest, MpesaResponse
+
+    config = settings.MPESA_RECONCILE
+    counts = Counter()
+    if mpesa_breaker.is_open():
+        logger.info('Daraja circuit breaker is open; not reconciling for now')
+        return counts
+    claimed = claim_due(limit or config['BATCH_SIZE'])
+    if not claimed:
+        return counts
+
+    # Latest response with a CheckoutRequestID for each request
+    responses = {}
+    for response_id, request_id, checkout_id in (
+        MpesaResponse.objects.filter(request_id__in=claimed, checkout_request_id__isnull=False)
+        .order_by('id').values_list('id', 'request_id', 'checkout_request_id')
+    ):
+        responses[request_id] = (response_id, checkout_id)
+
+    def check(request_id):
+        if request_id not in responses:
+            # The push worker died before saving Daraja's answer; there is
+            # nothing to ask about.
+            return request_id, 'unknown', None
+        try:
+            fields = query_result(responses[request_id][1])
+        except MpesaUnavailable:
+            return request_id, 'unavailable', None
+        except MpesaError as e:
+            logger.warning('STK query for request %s failed: %s', request_id, e)
+            return request_id, 'error', None
+        return request_id, ('resolved' if fields else 'processing'), fields
+
+    with ThreadPoolExecutor(max_workers=config['CONCURRENCY'], thread_name_prefix='mpesa-reconcile') as executor:
+        results = list(executor.map(check, claimed))
+
+    outcomes = []
+    give_up = []
+    refused = []
+    for request_id, outcome, fields in results:
+        counts[outcome] += 1
+        if fields is not None:
+            outcomes.append((responses[request_id][0], request_id, fields))
+        elif outcome == 'unavailable':
+            refused.append(request_id)
+        elif claimed[request_id] >= config['MAX_ATTEMPTS']:
+            give_up.append(request_id)
+
+    with transaction.atomic():
+        apply_outcomes(outcomes, authoritative=False)
+        finished = [request_id for _, request_id, _ in outcomes] + give_up
+        MpesaRequest.objects.filter(id__in=finished).update(next_reconcile_at=None)
+        if refused:
+            # The breaker opened mid-batch; Daraja wasn't asked, so these
+            # checks don't count as attempts.
+            MpesaRequest.objects.filter(id__in=refused).update(
+                reconcile_attempts=F('reconcile_attempts') - 1,
+                next_reconcile_at=timezone.now() + timedelta(seconds=mpesa_breaker.retry_after()),
+            )
+
+    if give_up:
+        counts['gave_up'] = len(give_up)
+        logger.error('Gave up reconciling M-Pesa requests %s; they stay PENDING for manual review', give_up)
+    logger.info('Reconciled stale M-Pesa requests: %s', dict(counts))
+    return counts
@@ -1,7 +1,7 @@
 # payments/serializers.py
 
 from rest_framework import serializers
-from .models import MpesaRequest, MpesaResponse, MpesaCallback
+from .models import DailySettlement, MpesaRequest, MpesaResponse, MpesaCallback
 
 
 class MpesaCallbackSerializer(serializers.ModelSerializer):
@@ -95,4 +95,20 @@ class MpesaRequestDetailSerializer(serializers.ModelSerializer):
     def to_representation(self, instance):
         rep = super().to_representation(instance)
         rep['amount'] = str(instance.amount)
-        return rep
\ No newline at end of file
+        return rep
+
+
+class DailySettlementSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DailySettlement
+        fields = [
+            'date',
+            'short_code',
+            'successful_count',
+            'successful_amount',
+            'failed_count',
+            'failed_amount',
+            'c2b_count',
+            'c2b_amount',
+            'updated_at',
+        ]
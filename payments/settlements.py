@@ -0,0 +1,106 @@
+"""
+Daily M-Pesa settlement rollups.
+
+`DailySettlement` holds, per local day and shortcode, the count and amount
+of successful and failed STK pushes and of paybill (C2B) payments. It is
+updated in the same transaction as the payments themselves:
+`apply_outcomes()` adds each request once, when it first reaches SUCCESS or
+FAILED, and `save_confirmations()` adds each new C2B receipt. Reports read
+only this table.
+
+`rebuild()` recomputes a range of days from the payment tables, for
+backfills or after payments were corrected by hand.
+"""
+
+from collections import Counter, defaultdict
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+
+def add(totals):
+    """
+    Add {(date, short_code): {field: amount}} to the rollup. Call inside
+    the transaction that records the payments.
+    """
+    from .models import DailySettlement
+
+    if not totals:
+        return
+    DailySettlement.objects.bulk_create(
+        [DailySettlement(date=day, short_code=short_code) for day, short_code in totals],
+        ignore_conflicts=True,
+    )
+    now = timezone.now()
+    # Always in the same order, so concurrent batches can't deadlock.
+    for (day, short_code), deltas in sorted(totals.items()):
+        DailySettlement.objects.filter(date=day, short_code=short_code).update(
+            updated_at=now, **{field: F(field) + value for field, value in deltas.items()}
+        )
+
+
+def add_stk_results(results):
+    """Add STK pushes given as (succeeded, amount, settled at) tuples"""
+    totals = defaultdict(Counter)
+    for succeeded, amount, settled_at in results:
+        prefix = 'successful' if succeeded else 'failed'
+        row = totals[(timezone.localdate(settled_at), settings.MPESA_SHORTCODE)]
+        row[f'{prefix}_count'] += 1
+        row[f'{prefix}_amount'] += amount
+    add(totals)
+
+
+def add_c2b_transactions(transactions):
+    """Add newly saved `C2BTransaction`s"""
+    totals = defaultdict(Counter)
+    for c2b in transactions:
+        row = totals[(timezone.localdate(c2b.trans_time), c2b.short_code)]
+        row['c2b_count'] += 1
+        row['c2b_amount'] += c2b.amount
+    add(totals)
+
+
+def rebuild(start, end):
+    """
+    Recompute the rollup for the days from `start` to `end`, inclusive.
+    Results being applied while it runs may be missed; for days still
+    taking payments, run it again once they have settled.
+    """
+    from .models import C2BTransaction, DailySettlement, MpesaCallback, MpesaRequest
+
+    since = timezone.make_aware(datetime.combine(start, time.min))
+    until = timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min))
+    totals = defaultdict(Counter)
+    stk = (
+        MpesaCallback.objects
+        .filter(response__request__status__in=[MpesaRequest.SUCCESS, MpesaRequest.FAILED])
+        .annotate(settled_at=Coalesce('transaction_date', 'timestamp'))
+        .filter(settled_at__gte=since, settled_at__lt=until)
+        .values(day=TruncDate('settled_at'), status=F('response__request__status'))
+        .annotate(count=Count('id'), amount=Sum('response__request__amount'))
+    )
+    c2b = (
+        C2BTransaction.objects.filter(trans_time__gte=since, trans_time__lt=until)
+        .values('short_code', day=TruncDate('trans_time'))
+        .annotate(count=Count('id'), amount=Sum('amount'))
+    )
+
+    with transaction.atomic():
+        for row in stk:
+            prefix = 'successful' if row['status'] == MpesaRequest.SUCCESS else 'failed'
+            totals[(row['day'], settings.MPESA_SHORTCODE)].update({
+                f'{prefix}_count': row['count'], f'{prefix}_amount': row['amount'],
+            })
+        for row in c2b:
+            totals[(row['day'], row['short_code'])].update({'c2b_count': row['count'], 'c2b_amount': row['amount']})
+
+        DailySettlement.objects.filter(date__range=(start, end)).delete()
+        DailySettlement.objects.bulk_create([
+            DailySettlement(date=day, short_code=short_code, **fields)
+            for (day, short_code), fields in totals.items()
+        ])
+    return len(totals)
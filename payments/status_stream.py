@@ -0,0 +1,242 @@
+"""
+Push-style payment status for the POS.
+
+After an STK push the POS wants to know the moment the customer pays. The
+status endpoint can long-poll (`?wait=`) and `/events/` streams
+Server-Sent Events; both are async views meant for the ASGI workers.
+
+Whatever changes a request's status (the push worker, the callback worker,
+the reconciler) calls `status_notifier.publish()` after commit, which
+sends the request id over a Redis pub/sub channel. Each process keeps one
+subscription on a background thread and wakes the waiters for that id.
+A waiter only holds an `asyncio.Event` while it waits - no thread and no
+database connection - and reads the status once per wake-up. While the
+subscription is down waiters fall back to re-reading every
+FALLBACK_POLL seconds.
+"""
+
+import asyncio
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import OuterRef, Subquery
+from redis.exceptions import RedisError
+
+from branchpoint_backend.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+
+def waiting_statuses():
+    from .models import MpesaRequest
+    return (MpesaRequest.QUEUED, MpesaRequest.PENDING)
+
+
+def read_status(pk):
+    """{'id', 'status', 'checkout_request_id'} of a request, or None"""
+    from .models import MpesaRequest, MpesaResponse
+
+    try:
+        return (
+            MpesaRequest.objects.filter(pk=pk)
+            .annotate(checkout_request_id=Subquery(
+                MpesaResponse.objects.filter(request=OuterRef('pk'))
+                .order_by('-timestamp').values('checkout_request_id')[:1]
+            ))
+            .values('id', 'status', 'checkout_request_id')
+            .first()
+        )
+    finally:
+        # Waiters read between long waits; give the connection back to the
+        # pool rather than holding it for the whole wait.
+        if not connection.in_atomic_block:
+            connection.close()
+
+
+aread_status = sync_to_async(read_status)
+
+
+class StatusNotifier:
+    """Wakes async waiters when a payment request's status changes"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._waiters = {}  # request id -> {(loop, asyncio.Event)}
+        self._subscriber = None
+        self._in_sync = threading.Event()
+        self.published = 0
+        self.delivered = 0
+
+    @property
+    def config(self):
+        return settings.MPESA_STATUS_STREAM
+
+    @property
+    def in_sync(self):
+        return self._in_sync.is_set()
+
+    def publish(self, request_ids):
+        """Tell every process these requests changed; call after commit"""
+        ids = ','.join(str(i) for i in request_ids)
+        if not ids:
+            return
+        try:
+            get_redis().publish(self.config['CHANNEL'], ids)
+            self.published += 1
+        except RedisError:
+            # Waiters still see the change on their next re-read.
+            logger.warning('Could not publish payment status change for %s', ids, exc_info=True)
+
+    def publish_on_commit(self, request_ids):
+        request_ids = list(request_ids)
+        if request_ids:
+            transaction.on_commit(lambda: self.publish(request_ids))
+
+    @contextmanager
+    def watch(self, request_id):
+        """Register the running event loop's interest in a request"""
+        self._ensure_started()
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self._lock:
+            self._waiters.setdefault(int(request_id), set()).add(waiter)
+        try:
+            yield waiter[1]
+        finally:
+            with self._lock:
+                waiters = self._waiters.get(int(request_id))
+                if waiters is not None:
+                    waiters.discard(waiter)
+                    if not waiters:
+                        del self._waiters[int(request_id)]
+
+    async def wait(self, event, timeout):
+        """Wait for a notification; True if one came"""
+        if not self.in_sync:
+            timeout = min(timeout, self.config['FALLBACK_POLL'])
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        event.clear()
+        return True
+
+    def _ensure_started(self):
+        if self._subscriber is None:
+            with self._lock:
+                if self._subscriber is None:
+                    self._subscriber = threading.Thread(
+                        target=self._listen, name='payment-status-sync', daemon=True
+                    )
+                    self._subscriber.start()
+
+    def _notify(self, request_id):
+        with self._lock:
+            waiters = list(self._waiters.get(request_id, ()))
+        for loop, event in waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+                self.delivered += 1
+            except RuntimeError:
+                pass  # That request's loop has already closed.
+
+    def _listen(self):
+        channel = self.config['CHANNEL']
+        retry_delay = 1
+        while True:
+            pubsub = None
+            try:
+                pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(channel)
+                self._in_sync.set()
+                retry_delay = 1
+                while True:
+                    message = pubsub.get_message(timeout=1.0)
+                    if message and message['type'] == 'message':
+                        for request_id in message['data'].decode().split(','):
+                            self._notify(int(request_id))
+            except Exception:
+                logger.warning('Payment status subscription lost; waiters fall back to polling', exc_info=True)
+            finally:
+                self._in_sync.clear()
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except RedisError:
+                        pass
+            time.sleep(retry_delay)
+            retry_delay = min(retry_delay * 2, 30)
+
+    def stats(self):
+        with self._lock:
+            waiting = sum(len(w) for w in self._waiters.values())
+        return {
+            'in_sync': self.in_sync,
+            'waiters': waiting,
+            'published': self.published,
+            'delivered': self.delivered,
+        }
+
+
+status_notifier = StatusNotifier()
+
+
+async def wait_for_change(pk, since, timeout):
+    """
+    Return the request's status once it differs from `since`, or after
+    `timeout` seconds. Without `since`, waits for the next change of a
+    request that is still QUEUED/PENDING.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    # Subscribe before reading so a change in between isn't missed.
+    with status_notifier.watch(pk) as event:
+        row = await aread_status(pk)
+        if row is None:
+            return None
+        if since is None:
+            if row['status'] not in waiting_statuses():
+                return row
+            since = row['status']
+        while row is not None and row['status'] == since:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            notified = await status_notifier.wait(event, remaining)
+            if notified or not status_notifier.in_sync:
+                row = await aread_status(pk)
+    return row
+
+
+def sse_event(name, data):
+    return f'event: {name}\ndata: {json.dumps(data)}\n\n'
+
+
+async def status_events(pk):
+    """SSE stream of a request's status until it is final or STREAM_MAX passes"""
+    config = status_notifier.config
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + config['STREAM_MAX']
+    with status_notifier.watch(pk) as event:
+        row = await aread_status(pk)
+        yield sse_event('status', row)
+        while row['status'] in waiting_statuses():
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            notified = await status_notifier.wait(event, min(remaining, config['KEEPALIVE']))
+            if notified or not status_notifier.in_sync:
+                current = await aread_status(pk)
+                if current is None:
+                    break
+                if current != row:
+                    row = current
+                    yield sse_event('status', row)
+                    continue
+            yield ': keepalive\n\n'
+    yield sse_event('end', {'id': row['id'], 'status': row['status']})
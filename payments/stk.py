@@ -0,0 +1,141 @@
+"""
+STK push submission.
+
+The API view only records an `MpesaRequest` with status QUEUED and returns
+202; `payments.tasks.submit_stk_push` then sends the push to Daraja from a
+Celery worker and records Daraja's answer as an `MpesaResponse`. Clients
+wait on the status endpoint until the request leaves QUEUED/PENDING.
+"""
+
+import logging
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.urls import reverse
+from django.utils import timezone
+
+from .breaker import mpesa_breaker
+from .client import mpesa_client
+from .exceptions import MpesaError, MpesaUnavailable
+from .status_stream import status_notifier
+
+logger = logging.getLogger(__name__)
+
+
+def callback_url():
+    """Public URL of `payments.views.mpesa_callback`"""
+    return settings.MPESA_CALLBACK_URL.rstrip('/') + reverse('payments:mpesa-callback')
+
+
+def queue_push(mpesa_request):
+    """Send the push from a worker once the request is committed"""
+    from .tasks import submit_stk_push
+
+    def enqueue():
+        try:
+            submit_stk_push.delay(mpesa_request.pk)
+        except Exception:
+            # The request stays QUEUED and can be resubmitted.
+            logger.exception('Could not queue STK push for request %s', mpesa_request.pk)
+
+    transaction.on_commit(enqueue)
+
+
+def defer_push(mpesa_request):
+    """
+    Put a push the circuit breaker refused back in the queue until Daraja
+    recovers. False if deferring is off or the request is too old to be
+    worth pushing to the customer any more.
+    """
+    from .models import MpesaRequest
+    from .tasks import submit_stk_push
+
+    config = settings.MPESA_BREAKER
+    age = (timezone.now() - mpesa_request.timestamp).total_seconds()
+    if not config['DEFER'] or age >= config['DEFER_MAX_AGE']:
+        return False
+
+    MpesaRequest.objects.filter(pk=mpesa_request.pk, status=MpesaRequest.PENDING).update(
+        status=MpesaRequest.QUEUED, next_reconcile_at=None,
+    )
+    status_notifier.publish_on_commit([mpesa_request.pk])
+    # Spread the deferred pushes out; only one probe gets through at a time.
+    countdown = max(1.0, mpesa_breaker.retry_after()) + random.uniform(0, config['BUCKET'])
+    try:
+        submit_stk_push.apply_async((mpesa_request.pk,), countdown=countdown)
+    except Exception:
+        logger.exception('Could not requeue STK push for request %s', mpesa_request.pk)
+    return True
+
+
+def submit_push(request_id):
+    """
+    Send the STK push for a queued request. Safe to run more than once:
+    only the run that moves the request from QUEUED to PENDING calls
+    Daraja, so a redelivered task can't push to the customer twice.
+    """
+    from .models import MpesaRequest, MpesaResponse
+
+    claimed = MpesaRequest.objects.filter(pk=request_id, status=MpesaRequest.QUEUED).update(
+        status=MpesaRequest.PENDING,
+        # If no callback comes by then, the reconciler asks Daraja.
+        next_reconcile_at=timezone.now() + timedelta(seconds=settings.MPESA_RECONCILE['STALE_AFTER']),
+    )
+    if not claimed:
+        return
+    status_notifier.publish_on_commit([request_id])
+    mpesa_request = MpesaRequest.objects.get(pk=request_id)
+
+    try:
+        data = mpesa_client.stk_push(
+            phone_number=mpesa_request.phone_number,
+            amount=mpesa_request.amount,
+            account_reference=mpesa_request.account_reference,
+            transaction_desc=mpesa_request.transaction_desc,
+            callback_url=callback_url(),
+        )
+    except MpesaUnavailable as e:
+        # Daraja wasn't called, so the push can safely be sent later.
+        if defer_push(mpesa_request):
+            return
+        logger.warning('STK push for request %s refused: %s', request_id, e)
+        MpesaRequest.objects.filter(pk=request_id).update(status=MpesaRequest.FAILED)
+        status_notifier.publish_on_commit([request_id])
+        return
+    except MpesaError as e:
+        logger.warning('STK push for request %s failed: %s', request_id, e)
+        with transaction.atomic():
+            if e.response_data and e.response_data.get('errorCode'):
+                # Daraja rejected it; keep its reason with the request.
+                MpesaResponse.objects.create(
+                    request=mpesa_request,
+                    response_code=str(e.response_data['errorCode'])[:10],
+                    response_description=(e.response_data.get('errorMessage') or '')[:255],
+                )
+            MpesaRequest.objects.filter(pk=request_id).update(status=MpesaRequest.FAILED)
+            status_notifier.publish_on_commit([request_id])
+        return
+
+    try:
+        with transaction.atomic():
+            MpesaResponse.objects.create(
+                request=mpesa_request,
+                merchant_request_id=data.get('MerchantRequestID') or None,
+                checkout_request_id=data.get('CheckoutRequestID') or None,
+                response_code=data.get('ResponseCode', ''),
+                response_description=data.get('ResponseDescription', ''),
+                customer_message=data.get('CustomerMessage', ''),
+            )
+            if data.get('ResponseCode') != '0':
+                MpesaRequest.objects.filter(pk=request_id).update(status=MpesaRequest.FAILED)
+                status_notifier.publish_on_commit([request_id])
+    except IntegrityError:
+        # Daraja's IDs are unique per push. If another response already
+        # holds them, a callback couldn't tell the two apart, so refuse this
+        # one now rather than guess when the callback comes.
+        logger.error('STK push for request %s returned CheckoutRequestID %s, which is already in use',
+                     request_id, data.get('CheckoutRequestID'))
+        MpesaRequest.objects.filter(pk=request_id).update(status=MpesaRequest.FAILED)
+        status_notifier.publish_on_commit([request_id])
@@ -0,0 +1,39 @@
+from celery import shared_task
+
+from .c2b import drain_buffer
+from .callbacks import process_inbox
+from .matching import match_callbacks
+from .reconcile import reconcile_stale_requests as reconcile
+from .stk import submit_push
+
+
+@shared_task(ignore_result=True)
+def submit_stk_push(request_id):
+    """Send a queued STK push to Daraja and record its response"""
+    # No task-level retries: the client already retries whatever is safe
+    # to retry, and a push must never be sent twice.
+    submit_push(request_id)
+
+
+@shared_task(ignore_result=True)
+def process_callback_inbox():
+    """Apply STK callbacks waiting in the inbox"""
+    process_inbox()
+
+
+@shared_task(ignore_result=True)
+def drain_c2b_confirmations():
+    """Write buffered C2B confirmations to the database"""
+    drain_buffer()
+
+
+@shared_task(ignore_result=True)
+def reconcile_stale_requests():
+    """Ask Daraja about PENDING requests whose callback hasn't come"""
+    reconcile()
+
+
+@shared_task(ignore_result=True)
+def match_mpesa_payments():
+    """Match new M-Pesa payments to sales and customer payments"""
+    match_callbacks()
@@ -1,3 +1,523 @@
-from django.test import TestCase
+import asyncio
+import json
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import fakeredis
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection
+from django.forms.models import model_to_dict
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from redis.exceptions import ConnectionError as RedisConnectionError
+from rest_framework.test import APIClient
+
+from .callbacks import apply_outcomes, process_inbox
+from accounts.models import User
+from sales.models import Customer, Payment, Sale
+from . import settlements
+from .c2b import BUFFER_KEY, buffer_confirmation, drain_buffer, save_confirmations
+from .exceptions import MpesaError
+from .matching import match_callbacks, normalize_phone
+from .models import (
+    C2BTransaction, DailySettlement, MatchException, MpesaCallback, MpesaCallbackInbox, MpesaRequest,
+    MpesaResponse, PaymentMatch,
+)
+from .reconcile import PROCESSING_ERROR_CODE, reconcile_stale_requests
+from .status_stream import status_notifier, wait_for_change
+from .tokens import TOKEN_KEY, MpesaTokenManager
+
+
+def make_request(**fields):
+    fields = {
+        'phone_number': '254712345678', 'amount': 100, 'account_reference': 'SALE-1',
+        'transaction_desc': 'Payment', **fields,
+    }
+    return MpesaRequest.objects.create(**fields)
+
+
+def make_push(checkout_id, **fields):
+    """A PENDING request Daraja accepted, due for reconciling"""
+    request = make_request(next_reconcile_at=timezone.now() - timedelta(seconds=1), **fields)
+    response = MpesaResponse.objects.create(
+        request=request, merchant_request_id=f'merchant-{checkout_id}', checkout_request_id=checkout_id,
+        response_code='0',
+    )
+    return request, response
+
+
+def stk_query_result(result_code, result_desc):
+    return {
+        'ResponseCode': '0', 'ResponseDescription': 'The service request has been accepted successsfully',
+        'ResultCode': result_code, 'ResultDesc': result_desc,
+    }
+
+
+class StatusWaiterConnectionTests(TransactionTestCase):
+    # Not TestCase: its transaction would keep the connection open anyway.
+
+    async def test_waiters_hold_no_connection_while_waiting(self):
+        request = await sync_to_async(make_request)()
+        stream = {**settings.MPESA_STATUS_STREAM, 'FALLBACK_POLL': 0.05}
+        # No pub/sub subscription: waiters re-read every FALLBACK_POLL.
+        with self.settings(MPESA_STATUS_STREAM=stream), mock.patch.object(status_notifier, '_ensure_started'):
+            waiters = [asyncio.create_task(wait_for_change(request.pk, None, 5)) for _ in range(5)]
+            for _ in range(4):
+                await asyncio.sleep(0.07)
+                self.assertIsNone(await sync_to_async(lambda: connection.connection)())
+
+            await MpesaRequest.objects.filter(pk=request.pk).aupdate(status=MpesaRequest.SUCCESS)
+            rows = await asyncio.wait_for(asyncio.gather(*waiters), 2)
+
+        self.assertEqual({row['status'] for row in rows}, {MpesaRequest.SUCCESS})
+        self.assertIsNone(await sync_to_async(lambda: connection.connection)())
+
+
+class ReconcileTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch('payments.reconcile.mpesa_breaker.is_open', return_value=False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def reconcile(self, *results):
+        """Run the reconciler with Daraja's STK query answering `results`"""
+        with mock.patch('payments.reconcile.mpesa_client.stk_query', side_effect=results) as stk_query:
+            counts = reconcile_stale_requests()
+        self.assertEqual(stk_query.call_count, len(results))
+        return counts
+
+    def test_success(self):
+        request, response = make_push('ws_CO_1')
+        counts = self.reconcile(stk_query_result('0', 'The service request is processed successfully.'))
+
+        self.assertEqual(counts['resolved'], 1)
+        request.refresh_from_db()
+        self.assertEqual(request.status, MpesaRequest.SUCCESS)
+        self.assertIsNone(request.next_reconcile_at)
+        callback = MpesaCallback.objects.get(response=response)
+        self.assertEqual(callback.result_code, '0')
+        self.assertIsNone(callback.mpesa_receipt_number)
+        self.assertEqual(callback.callback_metadata['source'], 'stk_query')
+        self.assertEqual(DailySettlement.objects.get().successful_count, 1)
+
+    def test_cancelled_by_customer(self):
+        request, response = make_push('ws_CO_1')
+        self.reconcile(stk_query_result('1032', 'Request cancelled by user'))
+
+        request.refresh_from_db()
+        self.assertEqual(request.status, MpesaRequest.FAILED)
+        self.assertEqual(MpesaCallback.objects.get(response=response).result_code, '1032')
+        self.assertEqual(DailySettlement.objects.get().failed_count, 1)
+
+    def test_still_processing_backs_off(self):
+        request, _ = make_push('ws_CO_1')
+        processing = MpesaError('The transaction is being processed', status_code=500,
+                                response_data={'errorCode': PROCESSING_ERROR_CODE})
+        before = timezone.now()
+        counts = self.reconcile(processing)
+
+        self.assertEqual(counts['processing'], 1)
+        request.refresh_from_db()
+        self.assertEqual(request.status, MpesaRequest.PENDING)
+        self.assertEqual(request.reconcile_attempts, 1)
+        self.assertGreater(request.next_reconcile_at, before)
+        self.assertFalse(MpesaCallback.objects.exists())
+        # Not due again until the backoff has passed
+        self.assertEqual(self.reconcile(), {})
+
+        MpesaRequest.objects.filter(pk=request.pk).update(next_reconcile_at=timezone.now())
+        counts = self.reconcile(stk_query_result('4999', 'The transaction is still under processing'))
+        self.assertEqual(counts['processing'], 1)
+        request.refresh_from_db()
+        self.assertEqual(request.reconcile_attempts, 2)
+
+    def test_unknown_without_a_checkout_request_id(self):
+        request = make_request(next_reconcile_at=timezone.now() - timedelta(seconds=1))
+        counts = self.reconcile()
+        self.assertEqual(counts['unknown'], 1)
+        request.refresh_from_db()
+        self.assertEqual(request.status, MpesaRequest.PENDING)
+        self.assertIsNotNone(request.next_reconcile_at)
+
+    def test_gives_up_after_max_attempts(self):
+        max_attempts = settings.MPESA_RECONCILE['MAX_ATTEMPTS']
+        request, _ = make_push('ws_CO_1', reconcile_attempts=max_attempts - 1)
+        with self.assertLogs('payments.reconcile', 'ERROR'):
+            counts = self.reconcile(stk_query_result('4999', 'The transaction is still under processing'))
+
+        self.assertEqual(counts['gave_up'], 1)
+        request.refresh_from_db()
+        self.assertEqual(request.status, MpesaRequest.PENDING)
+        self.assertEqual(request.reconcile_attempts, max_attempts)
+        self.assertIsNone(request.next_reconcile_at)
+        self.assertEqual(self.reconcile(), {})
+
+    def test_later_callback_replaces_the_inferred_result(self):
+        request, response = make_push('ws_CO_1')
+        self.reconcile(stk_query_result('0', 'The service request is processed successfully.'))
+
+        body = {'Body': {'stkCallback': {
+            'MerchantRequestID': 'merchant-ws_CO_1', 'CheckoutRequestID': 'ws_CO_1', 'ResultCode': 0,
+            'ResultDesc': 'The service request is processed successfully.',
+            'CallbackMetadata': {'Item': [
+                {'Name': 'Amount', 'Value': 100},
+                {'Name': 'MpesaReceiptNumber', 'Value': 'QJK1ABC2DE'},
+                {'Name': 'TransactionDate', 'Value': 20261019101500},
+                {'Name': 'PhoneNumber', 'Value': 254712345678},
+            ]},
+        }}}
+        MpesaCallbackInbox.objects.create(checkout_request_id='ws_CO_1', body=json.dumps(body))
+        process_inbox()
+
+        callback = MpesaCallback.objects.get(response=response)
+        self.assertEqual(callback.mpesa_receipt_number, 'QJK1ABC2DE')
+        self.assertEqual(callback.amount, 100)
+        self.assertEqual(callback.callback_metadata['Item'][1]['Value'], 'QJK1ABC2DE')
+        request.refresh_from_db()
+        self.assertEqual(request.status, MpesaRequest.SUCCESS)
+        # Settled once, by whichever result came first
+        self.assertEqual(DailySettlement.objects.get().successful_count, 1)
+
+
+class TokenFetcher:
+    """Stands in for Daraja's OAuth endpoint, counting the calls"""
+
+    def __init__(self, delay=0.2):
+        self.delay = delay
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        return 'new-token', 3599
+
+
+def run_concurrently(workers, target):
+    """Call `target` from `workers` threads at once; returns their results"""
+    barrier = threading.Barrier(workers)
+    results = [None] * workers
+
+    def run(i):
+        barrier.wait()
+        results[i] = target(i)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    return results
+
+
+class MpesaTokenManagerTests(SimpleTestCase):
+    workers = 8
+
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis()
+        patcher = mock.patch('branchpoint_backend.redis_client._client', self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.fetcher = TokenFetcher()
+
+    def share_token(self, token, expires_in):
+        self.redis.set(TOKEN_KEY, json.dumps({
+            'token': token, 'expires_at': time.time() + expires_in, 'fetched_at': time.time(),
+        }))
+
+    def test_expired_token_is_fetched_once_across_workers(self):
+        # Inside EXPIRY_SAFETY: nobody may use it any more
+        self.share_token('old-token', 10)
+        managers = [MpesaTokenManager(fetcher=self.fetcher) for _ in range(self.workers)]
+        tokens = run_concurrently(self.workers, lambda i: managers[i].get_token())
+
+        self.assertEqual(tokens, ['new-token'] * self.workers)
+        self.assertEqual(self.fetcher.calls, 1)
+        self.assertEqual(sum(manager.lock_waits for manager in managers), self.workers - 1)
+
+    def test_expiring_token_is_used_while_one_worker_refreshes(self):
+        # Inside REFRESH_MARGIN but still valid
+        self.share_token('old-token', 120)
+        managers = [MpesaTokenManager(fetcher=self.fetcher) for _ in range(self.workers)]
+        tokens = run_concurrently(self.workers, lambda i: managers[i].get_token())
+
+        self.assertEqual(sorted(tokens), ['new-token'] + ['old-token'] * (self.workers - 1))
+        self.assertEqual(self.fetcher.calls, 1)
+        self.assertEqual(sum(manager.lock_waits for manager in managers), 0)
+        self.assertEqual(json.loads(self.redis.get(TOKEN_KEY))['token'], 'new-token')
+
+    def test_redis_down_falls_back_to_one_fetch_per_process(self):
+        manager = MpesaTokenManager(fetcher=self.fetcher)
+        with mock.patch('payments.tokens.get_redis', side_effect=RedisConnectionError('down')), \
+                self.assertLogs('payments.tokens', 'WARNING'):
+            tokens = run_concurrently(self.workers, lambda i: manager.get_token())
+
+        self.assertEqual(tokens, ['new-token'] * self.workers)
+        self.assertEqual(self.fetcher.calls, 1)
+        # The process-local copy serves later calls without Redis
+        with mock.patch('payments.tokens.get_redis', side_effect=RedisConnectionError('down')):
+            self.assertEqual(manager.get_token(), 'new-token')
+        self.assertEqual(self.fetcher.calls, 1)
+
+
+class MatchingTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch('branchpoint_backend.redis_client._client', fakeredis.FakeRedis())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.now = timezone.now()
+
+    def pay(self, amount=100, phone='254712345678', reference='Payment'):
+        """A successful STK payment, as its callback recorded it"""
+        request = make_request(amount=amount, phone_number=phone, account_reference=reference,
+                               status=MpesaRequest.SUCCESS)
+        response = MpesaResponse.objects.create(request=request, checkout_request_id=f'ws_CO_{request.pk}')
+        return MpesaCallback.objects.create(
+            response=response, result_code='0', result_description='Processed', amount=amount,
+            phone_number=phone, transaction_date=self.now, mpesa_receipt_number=f'RCPT{request.pk}',
+        )
+
+    def sale(self, amount=100, phone='254712345678', at=None):
+        customer = Customer.objects.create(name='Customer', phone_number=phone)
+        sale = Sale.objects.create(customer=customer, payment_method='mpesa', total_amount=amount)
+        Sale.objects.filter(pk=sale.pk).update(created_at=at or self.now)
+        return sale
+
+    def outcome(self, callback):
+        """(rule, target) of the callback's match, or its exception reason"""
+        callback.refresh_from_db()
+        self.assertIsNotNone(callback.reconciled_at)
+        match = PaymentMatch.objects.filter(callback=callback).first()
+        if match:
+            return match.rule, match.sale or match.customer_payment
+        return MatchException.objects.get(callback=callback).reason
+
+    def test_reference_match(self):
+        sale = self.sale(amount=250)
+        customer = Customer.objects.create(name='Account customer')
+        payment = Payment.objects.create(customer=customer, amount=80)
+        by_sale = self.pay(amount=250, reference=f'SALE-{sale.pk}')
+        by_payment = self.pay(amount=80, reference=f'pay-{payment.pk} ')
+
+        self.assertEqual(match_callbacks(), {'matched_reference': 2})
+        self.assertEqual(self.outcome(by_sale), (PaymentMatch.REFERENCE, sale))
+        self.assertEqual(self.outcome(by_payment), (PaymentMatch.REFERENCE, payment))
+
+    def test_amount_mismatch(self):
+        sale = self.sale(amount=250)
+        callback = self.pay(amount=200, reference=f'SALE-{sale.pk}')
+        match_callbacks()
+        self.assertEqual(self.outcome(callback), MatchException.AMOUNT_MISMATCH)
+        self.assertEqual(MatchException.objects.get().candidates, [{'sale': sale.pk}])
+
+    def test_already_matched(self):
+        sale = self.sale()
+        first = self.pay(reference=f'SALE-{sale.pk}')
+        second = self.pay(reference=f'SALE-{sale.pk}')
+        match_callbacks()
+        self.assertEqual(self.outcome(first), (PaymentMatch.REFERENCE, sale))
+        self.assertEqual(self.outcome(second), MatchException.ALREADY_MATCHED)
+
+        # And in a later batch
+        third = self.pay(reference=f'SALE-{sale.pk}')
+        match_callbacks()
+        self.assertEqual(self.outcome(third), MatchException.ALREADY_MATCHED)
+
+    def test_ambiguous(self):
+        sales = [self.sale(), self.sale(at=self.now - timedelta(minutes=5))]
+        callback = self.pay()
+        match_callbacks()
+        self.assertEqual(self.outcome(callback), MatchException.AMBIGUOUS)
+        self.assertCountEqual(MatchException.objects.get().candidates, [{'sale': sale.pk} for sale in sales])
+
+    def test_out_of_window(self):
+        window = timedelta(seconds=settings.MPESA_MATCHING['TIME_WINDOW'])
+        self.sale(at=self.now - window - timedelta(minutes=1))
+        inside = self.sale(amount=120, at=self.now - window + timedelta(minutes=1))
+        outside_callback = self.pay()
+        inside_callback = self.pay(amount=120)
+
+        match_callbacks()
+        self.assertEqual(self.outcome(outside_callback), MatchException.UNMATCHED)
+        self.assertEqual(self.outcome(inside_callback), (PaymentMatch.AMOUNT_PHONE, inside))
+
+    def test_phone_formats_agree(self):
+        for phone in ('0712345678', '254712345678', '+254712345678', '+254 712 345 678'):
+            self.assertEqual(normalize_phone(phone), '712345678')
+        self.assertIsNone(normalize_phone('12345'))
+        self.assertIsNone(normalize_phone(None))
+
+        sales = [
+            self.sale(amount=100, phone='0712345678'),
+            self.sale(amount=200, phone='254712345678'),
+            self.sale(amount=300, phone='+254712345678'),
+        ]
+        callbacks = [
+            self.pay(amount=100, phone='254712345678'),
+            self.pay(amount=200, phone='+254712345678'),
+            self.pay(amount=300, phone='0712345678'),
+        ]
+        self.assertEqual(match_callbacks(), {'matched_amount_phone': 3})
+        for callback, sale in zip(callbacks, sales):
+            self.assertEqual(self.outcome(callback), (PaymentMatch.AMOUNT_PHONE, sale))
+
+    def test_batch_conflicting_with_a_manual_match_is_skipped(self):
+        sale = self.sale()
+        callback = self.pay(reference=f'SALE-{sale.pk}')
+        other = self.pay(reference='Manual')
+        bulk_create = PaymentMatch.objects.bulk_create
+
+        def match_by_hand_meanwhile(matches):
+            PaymentMatch.objects.create(callback=other, sale=sale, rule=PaymentMatch.MANUAL)
+            return bulk_create(matches)
+
+        with mock.patch.object(PaymentMatch.objects, 'bulk_create', side_effect=match_by_hand_meanwhile), \
+                self.assertLogs('payments.matching', 'WARNING'):
+            counts = match_callbacks(max_batches=1)
+
+        self.assertEqual(counts, {'conflicts': 2})
+        callback.refresh_from_db()
+        self.assertIsNone(callback.reconciled_at)
+        self.assertFalse(PaymentMatch.objects.exists())
+        self.assertFalse(MatchException.objects.exists())
+
+        # The next run sees the sale is paid.
+        PaymentMatch.objects.create(callback=other, sale=sale, rule=PaymentMatch.MANUAL)
+        MpesaCallback.objects.filter(pk=other.pk).update(reconciled_at=timezone.now())
+        match_callbacks()
+        self.assertEqual(self.outcome(callback), MatchException.ALREADY_MATCHED)
+
+
+def c2b_confirmation(trans_id, amount=500):
+    return json.dumps({
+        'TransactionType': 'Pay Bill', 'TransID': trans_id, 'TransTime': '20261019101500',
+        'TransAmount': str(amount), 'BusinessShortCode': '600984', 'BillRefNumber': 'SALE-1',
+        'MSISDN': '2547 ***** 126', 'FirstName': 'John',
+    })
+
+
+class C2BConfirmationTests(TestCase):
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis()
+        for patcher in (mock.patch('branchpoint_backend.redis_client._client', self.redis),
+                        mock.patch('payments.c2b.schedule_drain')):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def assertSettled(self, count, amount):
+        settlement = DailySettlement.objects.get()
+        self.assertEqual((settlement.c2b_count, settlement.c2b_amount), (count, amount))
+
+    def test_redelivery_within_a_batch_is_saved_once(self):
+        bodies = [c2b_confirmation('QJK1ABC2DE'), c2b_confirmation('QJK1ABC2DE'), c2b_confirmation('QJK2XYZ3FG')]
+        self.assertEqual(save_confirmations(bodies), 2)
+        self.assertEqual(C2BTransaction.objects.count(), 2)
+        self.assertSettled(2, 1000)
+
+    def test_redelivery_across_batches_is_saved_once(self):
+        for trans_id in ('QJK1ABC2DE', 'QJK2XYZ3FG', 'QJK1ABC2DE', 'QJK3LMN4HI'):
+            buffer_confirmation(c2b_confirmation(trans_id).encode())
+        self.assertEqual(drain_buffer(batch_size=2), 4)
+        self.assertEqual(self.redis.llen(BUFFER_KEY), 0)
+        self.assertEqual(C2BTransaction.objects.count(), 3)
+        self.assertSettled(3, 1500)
+
+        # Redelivered after it was saved
+        buffer_confirmation(c2b_confirmation('QJK2XYZ3FG'))
+        self.assertEqual(drain_buffer(), 1)
+        self.assertEqual(C2BTransaction.objects.count(), 3)
+        self.assertSettled(3, 1500)
+
+    def test_receipt_saved_concurrently_is_settled_once(self):
+        bulk_create = C2BTransaction.objects.bulk_create
+        calls = []
+
+        def saved_directly_meanwhile(transactions):
+            calls.append(transactions)
+            if len(calls) == 1:
+                save_confirmations([c2b_confirmation('QJK2XYZ3FG')])
+            return bulk_create(transactions)
+
+        bodies = [c2b_confirmation('QJK1ABC2DE'), c2b_confirmation('QJK2XYZ3FG')]
+        with mock.patch.object(C2BTransaction.objects, 'bulk_create', side_effect=saved_directly_meanwhile):
+            save_confirmations(bodies)
+        self.assertEqual(C2BTransaction.objects.count(), 2)
+        self.assertSettled(2, 1000)
+
+    def test_redis_down_saves_directly(self):
+        body = c2b_confirmation('QJK1ABC2DE')
+        down = fakeredis.FakeServer()
+        down.connected = False
+        with mock.patch('branchpoint_backend.redis_client._client', fakeredis.FakeRedis(server=down)), \
+                self.assertLogs('payments.c2b', 'WARNING'):
+            buffer_confirmation(body)
+            buffer_confirmation(body)
+            self.assertEqual(drain_buffer(), 0)
+        self.assertEqual(C2BTransaction.objects.get().trans_id, 'QJK1ABC2DE')
+        self.assertSettled(1, 500)
+
+
+class SettlementTests(TestCase):
+    def stk_result(self, response, result_code='0', receipt=None):
+        """An outcome for `apply_outcomes()`; without a receipt, as the reconciler infers it"""
+        fields = {
+            'result_code': result_code, 'result_description': 'Result', 'mpesa_receipt_number': receipt,
+            'transaction_date': timezone.now() if receipt else None, 'phone_number': None, 'amount': None,
+            'callback_metadata': None,
+        }
+        return response.id, response.request_id, fields
+
+    def rollup(self):
+        return [
+            model_to_dict(row, exclude=['id', 'updated_at'])
+            for row in DailySettlement.objects.order_by('date', 'short_code')
+        ]
+
+    def test_rebuild_matches_the_incremental_rollup(self):
+        paid, paid_twice, declined, inferred = (make_push(f'ws_CO_{i}', amount=100 * i)[1] for i in range(1, 5))
+        apply_outcomes([self.stk_result(paid, receipt='RCPT1')], authoritative=True)
+        apply_outcomes([self.stk_result(paid_twice, receipt='RCPT2'), self.stk_result(declined, '1032')],
+                       authoritative=True)
+        # Redelivered
+        apply_outcomes([self.stk_result(paid_twice, receipt='RCPT2')], authoritative=True)
+        # Inferred by the reconciler, then confirmed by the callback
+        apply_outcomes([self.stk_result(inferred)], authoritative=False)
+        apply_outcomes([self.stk_result(inferred, receipt='RCPT4')], authoritative=True)
+        save_confirmations([c2b_confirmation('QJK1ABC2DE'), c2b_confirmation('QJK2XYZ3FG')])
+        save_confirmations([c2b_confirmation('QJK1ABC2DE')])
+
+        incremental = self.rollup()
+        totals = {
+            field: sum(row[field] for row in incremental)
+            for field in ('successful_count', 'successful_amount', 'failed_count', 'failed_amount',
+                          'c2b_count', 'c2b_amount')
+        }
+        self.assertEqual(totals, {
+            'successful_count': 3, 'successful_amount': 700, 'failed_count': 1, 'failed_amount': 300,
+            'c2b_count': 2, 'c2b_amount': 1000,
+        })
+
+        days = [row['date'] for row in incremental]
+        settlements.rebuild(min(days), max(days))
+        self.assertEqual(self.rollup(), incremental)
+
+
+@override_settings(ALLOWED_HOSTS=['*'])
+class SettlementReportPermissionTests(TestCase):
+    url = '/api/payments/settlements/'
+
+    def get(self, role=None):
+        client = APIClient()
+        if role:
+            client.force_authenticate(User.objects.create_user(email=f'{role}@example.com', role=role))
+        return client.get(self.url)
+
+    def test_managers_and_superadmins_only(self):
+        self.assertEqual(self.get().status_code, 401)
+        self.assertEqual(self.get('staff').status_code, 403)
+        self.assertEqual(self.get('manager').status_code, 200)
+        self.assertEqual(self.get('superadmin').status_code, 200)
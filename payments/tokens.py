@@ -0,0 +1,168 @@
+"""
+Daraja OAuth access tokens, shared by every worker.
+
+Daraja tokens live for about an hour, so fetching one per STK push doubles
+the outbound latency of every payment. `MpesaTokenManager` keeps the
+current token in Redis (and a copy in process memory) and only goes back
+to Daraja when it is about to expire.
+
+Refreshing is single-flight: once a token is within REFRESH_MARGIN of
+expiry, the first worker to take the Redis lock fetches a new one while
+everyone else keeps using the old token, which is still valid. Only when
+the token has actually expired do other workers wait briefly for the
+lock holder instead of all hitting the OAuth endpoint at once. If Redis
+is down each process falls back to its own cache, guarded by a thread lock.
+"""
+
+import json
+import logging
+import threading
+import time
+
+from django.conf import settings
+from redis.exceptions import RedisError
+
+from branchpoint_backend.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+TOKEN_KEY = 'mpesa:oauth-token'
+LOCK_KEY = 'mpesa:oauth-token:lock'
+REFRESH_COUNT_KEY = 'mpesa:oauth-token:refreshes'
+
+
+class MpesaTokenManager:
+    def __init__(self, fetcher=None):
+        # fetcher() -> (token, expires_in seconds); defaults to the OAuth call
+        self._fetcher = fetcher
+        self._lock = threading.Lock()
+        self._cached = None  # {'token', 'expires_at', 'fetched_at'}
+        self.refreshes = 0
+        self.refresh_failures = 0
+        self.lock_waits = 0
+        self.local_hits = 0
+        self.redis_hits = 0
+
+    @property
+    def config(self):
+        return settings.MPESA_TOKEN
+
+    def get_token(self):
+        """Return a valid access token, refreshing it if needed"""
+        cached = self._cached
+        if self._is_fresh(cached):
+            self.local_hits += 1
+            return cached['token']
+
+        try:
+            return self._get_shared_token()
+        except RedisError:
+            logger.warning('Redis unavailable for the M-Pesa token cache; using a process-local token',
+                           exc_info=True)
+            return self._get_local_token()
+
+    def invalidate(self):
+        """Drop the cached token, e.g. after Daraja rejected it with a 401"""
+        self._cached = None
+        try:
+            get_redis().delete(TOKEN_KEY)
+        except RedisError:
+            pass
+
+    def _is_fresh(self, entry):
+        return bool(entry) and time.time() < entry['expires_at'] - self.config['REFRESH_MARGIN']
+
+    def _is_valid(self, entry):
+        return bool(entry) and time.time() < entry['expires_at'] - self.config['EXPIRY_SAFETY']
+
+    def _read_shared(self, redis):
+        raw = redis.get(TOKEN_KEY)
+        return json.loads(raw) if raw else None
+
+    def _get_shared_token(self):
+        redis = get_redis()
+        entry = self._read_shared(redis)
+        if self._is_fresh(entry):
+            self.redis_hits += 1
+            self._cached = entry
+            return entry['token']
+
+        lock = redis.lock(LOCK_KEY, timeout=self.config['LOCK_TIMEOUT'])
+        if lock.acquire(blocking=False):
+            try:
+                # Another worker may have refreshed between our read and the lock.
+                entry = self._read_shared(redis)
+                if not self._is_fresh(entry):
+                    entry = self._refresh()
+                    ttl = max(1, int(entry['expires_at'] - time.time()))
+                    redis.set(TOKEN_KEY, json.dumps(entry), ex=ttl)
+                    redis.incr(REFRESH_COUNT_KEY)
+            finally:
+                try:
+                    lock.release()
+                except RedisError:
+                    pass
+            self._cached = entry
+            return entry['token']
+
+        # Someone else is refreshing. The old token is fine until it expires.
+        if self._is_valid(entry):
+            self._cached = entry
+            return entry['token']
+
+        self.lock_waits += 1
+        deadline = time.monotonic() + self.config['LOCK_WAIT']
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            entry = self._read_shared(redis)
+            if self._is_valid(entry):
+                self._cached = entry
+                return entry['token']
+
+        # The refreshing worker is stuck or gone; fetch one ourselves.
+        entry = self._refresh()
+        self._cached = entry
+        return entry['token']
+
+    def _get_local_token(self):
+        with self._lock:
+            if not self._is_fresh(self._cached):
+                self._cached = self._refresh()
+            return self._cached['token']
+
+    def _refresh(self):
+        try:
+            token, expires_in = (self._fetcher or fetch_access_token)()
+        except Exception:
+            self.refresh_failures += 1
+            raise
+        self.refreshes += 1
+        now = time.time()
+        return {'token': token, 'expires_at': now + expires_in, 'fetched_at': now}
+
+    def stats(self):
+        cached = self._cached
+        now = time.time()
+        stats = {
+            'token_age_seconds': round(now - cached['fetched_at'], 1) if cached else None,
+            'expires_in_seconds': round(cached['expires_at'] - now, 1) if cached else None,
+            'refreshes': self.refreshes,
+            'refresh_failures': self.refresh_failures,
+            'lock_waits': self.lock_waits,
+            'local_hits': self.local_hits,
+            'redis_hits': self.redis_hits,
+        }
+        try:
+            stats['refreshes_all_workers'] = int(get_redis().get(REFRESH_COUNT_KEY) or 0)
+        except RedisError:
+            stats['refreshes_all_workers'] = None
+        return stats
+
+
+def fetch_access_token():
+    """Ask Daraja for a new access token; returns (token, expires_in)"""
+    from .client import mpesa_client
+    return mpesa_client.fetch_access_token()
+
+
+mpesa_tokens = MpesaTokenManager()
@@ -1,8 +1,17 @@
 from django.urls import path
-from payments.views import stk_push
+from payments.views import (
+    c2b_confirmation, c2b_validation, mpesa_callback, settlement_report, stk_push, stk_push_events,
+    stk_push_status,
+)
 
 urlpatterns = [
     path('stkpush/', stk_push, name='stk push'),
+    path('stkpush/<int:pk>/status/', stk_push_status, name='stk-push-status'),
+    path('stkpush/<int:pk>/events/', stk_push_events, name='stk-push-events'),
+    path('callback/', mpesa_callback, name='mpesa-callback'),
+    path('c2b/validation/', c2b_validation, name='c2b-validation'),
+    path('c2b/confirmation/', c2b_confirmation, name='c2b-confirmation'),
+    path('settlements/', settlement_report, name='settlement-report'),
     
 
 ]
\ No newline at end of file
@@ -49,6 +49,12 @@ class Sale(models.Model):
     def __str__(self):
         return f"Sale #{self.pk} - {self.get_payment_method_display()}"
 
+    class Meta:
+        indexes = [
+            # M-Pesa payment matching scans sales by method and time.
+            models.Index(fields=['payment_method', 'created_at'], name='sale_method_time_idx'),
+        ]
+
 
 # 4. SaleItem Model
 class SaleItem(models.Model):
@@ -78,3 +84,8 @@ class Payment(models.Model):
 
     def __str__(self):
         return f"{self.amount} received from {self.customer.name}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['received_at'], name='payment_received_idx'),
+        ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.1 on 2026-10-19 01:36
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('salesaccounts', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='salesaccount',
+            index=models.Index(fields=['-created_at', '-id'], name='sales_account_created_idx'),
+        ),
+    ]
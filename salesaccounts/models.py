@@ -1,9 +1,41 @@
 from django.db import models
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator
+from django.db.models import Count, OuterRef, Prefetch, Subquery
+from django.db.models.functions import Coalesce
 
 User = get_user_model()
 
+
+def _count_per_account(model):
+    """Number of `model` rows per account, as a correlated subquery"""
+    return Coalesce(Subquery(
+        model.objects.filter(account=OuterRef('pk')).order_by()
+        .values('account').annotate(n=Count('pk')).values('n'),
+        output_field=models.IntegerField(),
+    ), 0)
+
+
+class SalesAccountQuerySet(models.QuerySet):
+    def for_list(self):
+        """
+        Join the assignee and annotate deal and activity counts, so a page
+        of the list costs one query. The counts are subqueries, evaluated
+        only for the rows on the page.
+        """
+        return self.select_related('assigned_to__profile').annotate(
+            total_deals=_count_per_account(Deal),
+            activities_count=_count_per_account(ContactActivity),
+        )
+
+    def for_detail(self):
+        """Join the users and prefetch deals and activities with their performers"""
+        return self.select_related('created_by__profile', 'assigned_to__profile').prefetch_related(
+            'deals',
+            Prefetch('activities', queryset=ContactActivity.objects.select_related('performed_by__profile')),
+        )
+
+
 class SalesAccount(models.Model):
     STATUS_CHOICES = [
         ('prospect', 'Prospect'),
@@ -55,10 +87,16 @@ class SalesAccount(models.Model):
         related_name='assigned_sales_accounts'
     )
 
+    objects = SalesAccountQuerySet.as_manager()
+
     class Meta:
         ordering = ['-created_at']
         verbose_name = "Sales Account"
         verbose_name_plural = "Sales Accounts"
+        indexes = [
+            # Keyset pagination of the CRM list
+            models.Index(fields=['-created_at', '-id'], name='sales_account_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} - {self.contact_person}"
@@ -0,0 +1,12 @@
+from rest_framework.pagination import CursorPagination
+
+
+class SalesAccountCursorPagination(CursorPagination):
+    """
+    Keyset pagination for the CRM account list, newest first. Pages cost
+    the same however deep the client goes.
+    """
+    ordering = ('-created_at', '-id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
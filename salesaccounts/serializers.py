@@ -6,9 +6,12 @@ User = get_user_model()
 
 
 class UserSerializer(serializers.ModelSerializer):
+    # Users have no username or names of their own; the name is on the profile.
+    full_name = serializers.CharField(source='profile.full_name', read_only=True, default=None)
+
     class Meta:
         model = User
-        fields = ['id', 'username', 'first_name', 'last_name', 'email']
+        fields = ['id', 'email', 'full_name']
 
 
 class DealSerializer(serializers.ModelSerializer):
@@ -32,7 +35,33 @@ class ContactActivitySerializer(serializers.ModelSerializer):
         ]
 
 
+class SalesAccountListSerializer(serializers.ModelSerializer):
+    """
+    Compact account for the CRM list: counts instead of the nested deals and
+    activities. Expects the queryset from `SalesAccount.objects.for_list()`.
+    """
+    assigned_to = UserSerializer(read_only=True)
+    status_display = serializers.CharField(source='get_status_display', read_only=True)
+    avatar = serializers.CharField(read_only=True)
+    total_deals = serializers.IntegerField(read_only=True)
+    activities_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = SalesAccount
+        fields = [
+            'id', 'name', 'contact_person', 'email', 'phone', 'location',
+            'account_value', 'status', 'status_display', 'deals_count',
+            'total_deals', 'activities_count', 'last_contact_date',
+            'created_at', 'updated_at', 'created_by', 'assigned_to', 'avatar'
+        ]
+        read_only_fields = fields
+
+
 class SalesAccountSerializer(serializers.ModelSerializer):
+    """
+    Full account with its deals and activities. Expects the queryset from
+    `SalesAccount.objects.for_detail()`.
+    """
     deals = DealSerializer(many=True, read_only=True)
     activities = ContactActivitySerializer(many=True, read_only=True)
     created_by = UserSerializer(read_only=True)
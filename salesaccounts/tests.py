@@ -1,3 +1,58 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from accounts.models import User
+from .models import SalesAccount, Deal, ContactActivity
+
+
+@override_settings(ALLOWED_HOSTS=['*'])
+class SalesAccountQueryCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='sales@example.com', password='pass', role='manager')
+        cls.rep = User.objects.create_user(email='rep@example.com', password='pass')
+        cls.accounts = []
+        for i in range(5):
+            account = SalesAccount.objects.create(
+                name=f'Account {i}',
+                contact_person=f'Contact {i}',
+                email=f'account{i}@example.com',
+                created_by=cls.user,
+                assigned_to=cls.rep,
+            )
+            for j in range(2):
+                deal = Deal.objects.create(account=account, title=f'Deal {j}', value=100, created_by=cls.user)
+                ContactActivity.objects.create(
+                    account=account, deal=deal, activity_type='call', subject=f'Call {j}', performed_by=cls.rep,
+                )
+            cls.accounts.append(account)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_list_is_one_query_per_page(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/salesaccounts/accounts/', {'page_size': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertEqual(response.data['results'][0]['total_deals'], 2)
+        self.assertEqual(response.data['results'][0]['activities_count'], 2)
+
+        seen = [row['id'] for row in response.data['results']]
+        next_url = response.data['next']
+        while next_url:
+            with self.assertNumQueries(1):
+                response = self.client.get(next_url)
+            self.assertEqual(response.status_code, 200)
+            seen += [row['id'] for row in response.data['results']]
+            next_url = response.data['next']
+        self.assertEqual(sorted(seen), sorted(account.id for account in self.accounts))
+
+    def test_detail_is_three_queries(self):
+        account = self.accounts[0]
+        with self.assertNumQueries(3):
+            response = self.client.get(f'/api/salesaccounts/accounts/{account.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['deals']), 2)
+        self.assertEqual(len(response.data['activities']), 2)
@@ -6,7 +6,9 @@ from django.db.models import Q, Sum, Count
 from django.shortcuts import get_object_or_404
 
 from .models import SalesAccount, Deal, ContactActivity
+from .pagination import SalesAccountCursorPagination
 from .serializers import (
+    SalesAccountListSerializer,
     SalesAccountSerializer,
     CreateSalesAccountSerializer,
     UpdateSalesAccountSerializer,
@@ -22,13 +24,17 @@ class SalesAccountListView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        """Get all sales accounts with filtering and search"""
+        """
+        Get sales accounts with filtering and search, a page at a time
+        (cursor pagination, newest first). Accounts are listed with deal
+        and activity counts; the detail view has the deals and activities.
+        """
         # Get query parameters
         search = request.query_params.get('search', '')
         status_filter = request.query_params.get('status', 'all')
         
         # Start with all accounts
-        accounts = SalesAccount.objects.all()
+        accounts = SalesAccount.objects.for_list()
         
         # Apply search filter
         if search:
@@ -42,9 +48,11 @@ class SalesAccountListView(APIView):
         if status_filter != 'all':
             accounts = accounts.filter(status=status_filter)
         
-        # Serialize and return
-        serializer = SalesAccountSerializer(accounts, many=True)
-        return Response(serializer.data)
+        # Paginate, serialize and return
+        paginator = SalesAccountCursorPagination()
+        page = paginator.paginate_queryset(accounts, request, view=self)
+        serializer = SalesAccountListSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
     def post(self, request):
         """Create a new sales account"""
@@ -63,7 +71,7 @@ class SalesAccountDetailView(APIView):
 
     def get(self, request, account_id):
         """Get a specific sales account with all details"""
-        account = get_object_or_404(SalesAccount, id=account_id)
+        account = get_object_or_404(SalesAccount.objects.for_detail(), id=account_id)
         serializer = SalesAccountSerializer(account)
         return Response(serializer.data)
 
@@ -139,7 +147,7 @@ class ContactActivityListView(APIView):
     def get(self, request, account_id):
         """Get all contact activities for a specific account"""
         account = get_object_or_404(SalesAccount, id=account_id)
-        activities = account.activities.all()
+        activities = account.activities.select_related('performed_by__profile')
         serializer = ContactActivitySerializer(activities, many=True)
         return Response(serializer.data)
 
@@ -172,7 +180,7 @@ def update_account_status(request, account_id):
     account.status = new_status
     account.save()
     
-    serializer = SalesAccountSerializer(account)
+    serializer = SalesAccountSerializer(SalesAccount.objects.for_detail().get(id=account.id))
     return Response(serializer.data)
 
 
@@ -199,5 +207,5 @@ def assign_account(request, account_id):
         account.assigned_to = None
         account.save()
     
-    serializer = SalesAccountSerializer(account)
+    serializer = SalesAccountSerializer(SalesAccount.objects.for_detail().get(id=account.id))
     return Response(serializer.data)
@@ -0,0 +1,10 @@
+from django.contrib import admin
+from .models import SearchEntry
+
+
+@admin.register(SearchEntry)
+class SearchEntryAdmin(admin.ModelAdmin):
+    list_display = ['title', 'entity_type', 'object_id', 'branch', 'updated_at']
+    list_filter = ['entity_type']
+    search_fields = ['title']
+    readonly_fields = ['updated_at']
@@ -0,0 +1,111 @@
+"""
+Database-specific full-text queries over SearchEntry.
+
+PostgreSQL ranks with ts_rank_cd over the weighted tsvector plus trigram
+similarity on the title (so typos and partial words still match); SQLite
+uses FTS5 with bm25. Other databases fall back to icontains.
+"""
+
+import re
+
+from django.db import connection
+from django.db.models import Q, Value, FloatField
+
+from .models import SearchEntry
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+ALL_BRANCHES = object()
+
+ENTRY_COLUMNS = 'e.id, e.entity_type, e.object_id, e.branch_id, e.title, e.subtitle'
+
+
+def _tokens(query):
+    return TOKEN_RE.findall(query.lower())[:10]
+
+
+def _filters(branch_id, entity_types):
+    clauses = []
+    params = []
+    if branch_id is not ALL_BRANCHES:
+        if branch_id is None:
+            clauses.append('e.branch_id IS NULL')
+        else:
+            clauses.append('(e.branch_id IS NULL OR e.branch_id = %s)')
+            params.append(branch_id)
+    if entity_types:
+        clauses.append('e.entity_type IN (%s)' % ', '.join(['%s'] * len(entity_types)))
+        params.extend(entity_types)
+    sql = ''.join(f' AND {clause}' for clause in clauses)
+    return sql, params
+
+
+def _postgresql_search(tokens, query, branch_id, entity_types, limit):
+    tsquery = ' & '.join(f"{token}:*" for token in tokens)
+    filter_sql, filter_params = _filters(branch_id, entity_types)
+    sql = f"""
+        SELECT {ENTRY_COLUMNS},
+               ts_rank_cd(e.document, q) + similarity(e.title, %s) AS rank
+        FROM search_searchentry e, to_tsquery('simple', %s) q
+        WHERE (e.document @@ q OR e.title %% %s){filter_sql}
+        ORDER BY rank DESC
+        LIMIT %s
+    """
+    return SearchEntry.objects.raw(sql, [query, tsquery, query, *filter_params, limit])
+
+
+def _sqlite_search(tokens, query, branch_id, entity_types, limit):
+    match = ' '.join(f'"{token}"*' for token in tokens)
+    filter_sql, filter_params = _filters(branch_id, entity_types)
+    sql = f"""
+        SELECT {ENTRY_COLUMNS},
+               -bm25(search_searchentry_fts, 10.0, 4.0, 1.0) AS rank
+        FROM search_searchentry_fts
+        JOIN search_searchentry e ON e.id = search_searchentry_fts.rowid
+        WHERE search_searchentry_fts MATCH %s{filter_sql}
+        ORDER BY rank DESC
+        LIMIT %s
+    """
+    return SearchEntry.objects.raw(sql, [match, *filter_params, limit])
+
+
+def _fallback_search(tokens, query, branch_id, entity_types, limit):
+    entries = SearchEntry.objects.all()
+    for token in tokens:
+        entries = entries.filter(
+            Q(title__icontains=token) | Q(subtitle__icontains=token) | Q(content__icontains=token)
+        )
+    if branch_id is not ALL_BRANCHES:
+        entries = entries.filter(Q(branch_id__isnull=True) | Q(branch_id=branch_id))
+    if entity_types:
+        entries = entries.filter(entity_type__in=entity_types)
+    return entries.annotate(rank=Value(0.0, output_field=FloatField()))[:limit]
+
+
+def search(query, branch_id=ALL_BRANCHES, entity_types=None, limit=20):
+    """
+    Ranked SearchEntry matches for `query`.
+
+    `branch_id` limits results to that branch plus branch-less entries;
+    `None` means branch-less entries only and `ALL_BRANCHES` means no limit.
+    """
+    tokens = _tokens(query)
+    if not tokens:
+        return []
+
+    backend = {
+        'postgresql': _postgresql_search,
+        'sqlite': _sqlite_search,
+    }.get(connection.vendor, _fallback_search)
+    return list(backend(tokens, query, branch_id, entity_types, limit))
+
+
+def search_objects(queryset, entity_type, query, branch_id=ALL_BRANCHES, limit=20):
+    """
+    Objects of `queryset` whose `entity_type` entries match `query`, best
+    match first. The queryset may narrow the results further, e.g. to the
+    objects a user can see.
+    """
+    ids = [entry.object_id for entry in search(query, branch_id, [entity_type], limit)]
+    objects = queryset.in_bulk(ids)
+    return [objects[object_id] for object_id in ids if object_id in objects]
@@ -0,0 +1,136 @@
+"""
+Keeps SearchEntry rows in step with the models they index.
+
+Each indexed model maps to an entity type and a function returning the
+entry fields for an instance. Entries are written from post_save and
+removed from post_delete; `rebuild_search_index` backfills them.
+"""
+
+from django.apps import apps
+from django.db.models.signals import post_delete, post_save
+
+from .models import SearchEntry
+
+
+def _join(*parts):
+    return ' '.join(str(part) for part in parts if part)
+
+
+def vendor_document(vendor):
+    return {
+        'branch_id': vendor.branch_id,
+        'title': vendor.name,
+        'subtitle': vendor.contact_person,
+        'content': _join(
+            vendor.email, vendor.phone_number, vendor.get_vendor_type_display(),
+            vendor.tax_id, vendor.address, vendor.description
+        ),
+    }
+
+
+def customer_document(customer):
+    return {
+        'branch_id': None,
+        'title': customer.name,
+        'subtitle': customer.phone_number or '',
+        'content': _join(customer.email),
+    }
+
+
+def sales_product_document(product):
+    return {
+        'branch_id': None,
+        'title': product.name,
+        'subtitle': product.sku,
+        'content': '',
+    }
+
+
+def product_document(product):
+    return {
+        'branch_id': None,
+        'title': product.name,
+        'subtitle': product.category.name,
+        'content': _join(product.category.description),
+    }
+
+
+def branch_document(branch):
+    return {
+        'branch_id': branch.id,
+        'title': branch.name,
+        'subtitle': branch.location,
+        'content': branch.description,
+    }
+
+
+def sales_account_document(account):
+    return {
+        'branch_id': None,
+        'title': account.name,
+        'subtitle': account.contact_person,
+        'content': _join(account.email, account.phone, account.location, account.get_status_display()),
+    }
+
+
+# model label -> (entity type, document function, related fields the
+# document reads, for select_related when rebuilding)
+INDEXED_MODELS = {
+    'vendors.Vendor': ('vendor', vendor_document, []),
+    'sales.Customer': ('customer', customer_document, []),
+    'sales.Product': ('sales_product', sales_product_document, []),
+    'products.Product': ('product', product_document, ['category']),
+    'branches.Branch': ('branch', branch_document, []),
+    'salesaccounts.SalesAccount': ('sales_account', sales_account_document, []),
+}
+
+
+def index_instance(entity_type, document, instance):
+    fields = document(instance)
+    fields['title'] = fields['title'][:255]
+    fields['subtitle'] = (fields['subtitle'] or '')[:255]
+    SearchEntry.objects.update_or_create(
+        entity_type=entity_type, object_id=instance.pk, defaults=fields
+    )
+
+
+def remove_instance(entity_type, instance):
+    SearchEntry.objects.filter(entity_type=entity_type, object_id=instance.pk).delete()
+
+
+def rebuild(label, batch_size=1000):
+    """Replace every entry for one indexed model; returns the entry count"""
+    entity_type, document, related = INDEXED_MODELS[label]
+    model = apps.get_model(label)
+
+    SearchEntry.objects.filter(entity_type=entity_type).delete()
+    batch = []
+    count = 0
+    for instance in model.objects.select_related(*related).iterator(chunk_size=batch_size):
+        fields = document(instance)
+        fields['title'] = fields['title'][:255]
+        fields['subtitle'] = (fields['subtitle'] or '')[:255]
+        batch.append(SearchEntry(entity_type=entity_type, object_id=instance.pk, **fields))
+        if len(batch) >= batch_size:
+            SearchEntry.objects.bulk_create(batch)
+            count += len(batch)
+            batch = []
+    if batch:
+        SearchEntry.objects.bulk_create(batch)
+        count += len(batch)
+    return count
+
+
+def connect_signals():
+    for label, (entity_type, document, _) in INDEXED_MODELS.items():
+        model = apps.get_model(label)
+
+        def handle_save(sender, instance, raw=False, entity_type=entity_type, document=document, **kwargs):
+            if not raw:
+                index_instance(entity_type, document, instance)
+
+        def handle_delete(sender, instance, entity_type=entity_type, **kwargs):
+            remove_instance(entity_type, instance)
+
+        post_save.connect(handle_save, sender=model, weak=False, dispatch_uid=f'search-index-{label}')
+        post_delete.connect(handle_delete, sender=model, weak=False, dispatch_uid=f'search-remove-{label}')
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from search.indexing import INDEXED_MODELS, rebuild
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the global search index from the indexed models'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', type=str, action='append',
+                            choices=list(INDEXED_MODELS),
+                            help='Only rebuild entries for this model (repeatable)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per bulk insert')
+
+    def handle(self, *args, **options):
+        labels = options['model'] or list(INDEXED_MODELS)
+
+        for label in labels:
+            with transaction.atomic():
+                count = rebuild(label, batch_size=options['batch_size'])
+            self.stdout.write(
+                self.style.SUCCESS(f'Indexed {count} {label} records')
+            )
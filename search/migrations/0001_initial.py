@@ -0,0 +1,33 @@
+# Generated by Django 5.2.1 on 2026-10-19 00:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('branches', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entity_type', models.CharField(choices=[('vendor', 'Vendor'), ('customer', 'Customer'), ('sales_product', 'Sales Product'), ('product', 'Product'), ('branch', 'Branch'), ('sales_account', 'Sales Account')], max_length=30)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('title', models.CharField(max_length=255)),
+                ('subtitle', models.CharField(blank=True, max_length=255)),
+                ('content', models.TextField(blank=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('branch', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='branches.branch')),
+            ],
+            options={
+                'verbose_name_plural': 'Search Entries',
+                'constraints': [models.UniqueConstraint(fields=('entity_type', 'object_id'), name='search_entry_unique_object')],
+            },
+        ),
+    ]
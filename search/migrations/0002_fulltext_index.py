@@ -0,0 +1,80 @@
+from django.db import migrations
+
+
+POSTGRESQL_FORWARD = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    """
+    ALTER TABLE search_searchentry ADD COLUMN document tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(subtitle, '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce(content, '')), 'C')
+    ) STORED
+    """,
+    'CREATE INDEX search_entry_document_gin ON search_searchentry USING GIN (document)',
+    'CREATE INDEX search_entry_title_trgm ON search_searchentry USING GIN (title gin_trgm_ops)',
+]
+
+POSTGRESQL_BACKWARD = [
+    'DROP INDEX IF EXISTS search_entry_title_trgm',
+    'DROP INDEX IF EXISTS search_entry_document_gin',
+    'ALTER TABLE search_searchentry DROP COLUMN IF EXISTS document',
+]
+
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE search_searchentry_fts USING fts5(
+        title, subtitle, content,
+        content='search_searchentry', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER search_searchentry_ai AFTER INSERT ON search_searchentry BEGIN
+        INSERT INTO search_searchentry_fts(rowid, title, subtitle, content)
+        VALUES (new.id, new.title, new.subtitle, new.content);
+    END
+    """,
+    """
+    CREATE TRIGGER search_searchentry_ad AFTER DELETE ON search_searchentry BEGIN
+        INSERT INTO search_searchentry_fts(search_searchentry_fts, rowid, title, subtitle, content)
+        VALUES ('delete', old.id, old.title, old.subtitle, old.content);
+    END
+    """,
+    """
+    CREATE TRIGGER search_searchentry_au AFTER UPDATE ON search_searchentry BEGIN
+        INSERT INTO search_searchentry_fts(search_searchentry_fts, rowid, title, subtitle, content)
+        VALUES ('delete', old.id, old.title, old.subtitle, old.content);
+        INSERT INTO search_searchentry_fts(rowid, title, subtitle, content)
+        VALUES (new.id, new.title, new.subtitle, new.content);
+    END
+    """,
+]
+
+SQLITE_BACKWARD = [
+    'DROP TRIGGER IF EXISTS search_searchentry_au',
+    'DROP TRIGGER IF EXISTS search_searchentry_ad',
+    'DROP TRIGGER IF EXISTS search_searchentry_ai',
+    'DROP TABLE IF EXISTS search_searchentry_fts',
+]
+
+
+def run_for_vendor(statements):
+    def run(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('search', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_for_vendor({'postgresql': POSTGRESQL_FORWARD, 'sqlite': SQLITE_FORWARD}),
+            run_for_vendor({'postgresql': POSTGRESQL_BACKWARD, 'sqlite': SQLITE_BACKWARD}),
+        ),
+    ]
@@ -0,0 +1,45 @@
+from django.db import models
+from branches.models import Branch
+
+
+ENTITY_TYPES = [
+    ('vendor', 'Vendor'),
+    ('customer', 'Customer'),
+    ('sales_product', 'Sales Product'),
+    ('product', 'Product'),
+    ('branch', 'Branch'),
+    ('sales_account', 'Sales Account'),
+]
+
+
+class SearchEntry(models.Model):
+    """
+    One searchable record per indexed object, maintained on save.
+
+    The full-text index itself lives outside the ORM and is created by the
+    migrations for the current database: a weighted tsvector column with
+    GIN and trigram indexes on PostgreSQL, an FTS5 table kept in sync by
+    triggers on SQLite. Entries with no branch are visible to every branch.
+    """
+    entity_type = models.CharField(max_length=30, choices=ENTITY_TYPES)
+    object_id = models.PositiveBigIntegerField()
+    branch = models.ForeignKey(
+        Branch,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
+    title = models.CharField(max_length=255)
+    subtitle = models.CharField(max_length=255, blank=True)
+    content = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = 'Search Entries'
+        constraints = [
+            models.UniqueConstraint(fields=['entity_type', 'object_id'], name='search_entry_unique_object'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_entity_type_display()}: {self.title}"
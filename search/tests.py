@@ -0,0 +1,101 @@
+from unittest import skipUnless
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from accounts.models import User
+from branches.models import Branch
+from sales.models import Customer
+from vendors.models import Vendor
+from .backends import ALL_BRANCHES, search
+from .models import SearchEntry
+from .views import branch_scope
+
+
+class SearchIndexTests(TestCase):
+    def test_entries_follow_saves_and_deletes(self):
+        branch = Branch.objects.create(name='Westlands')
+        vendor = Vendor.objects.create(name='Acme Supplies', contact_person='Jane', branch=branch)
+        entry = SearchEntry.objects.get(entity_type='vendor', object_id=vendor.pk)
+        self.assertEqual((entry.title, entry.subtitle, entry.branch_id), ('Acme Supplies', 'Jane', branch.pk))
+
+        vendor.name = 'Acme Hardware'
+        vendor.save()
+        entry.refresh_from_db()
+        self.assertEqual(entry.title, 'Acme Hardware')
+        self.assertEqual([e.object_id for e in search('hardware')], [vendor.pk])
+        self.assertEqual(search('supplies'), [])
+
+        vendor.delete()
+        self.assertFalse(SearchEntry.objects.filter(entity_type='vendor', object_id=vendor.pk).exists())
+        self.assertEqual(search('acme'), [])
+
+
+@skipUnless(connection.vendor == 'sqlite', 'the FTS5 index is SQLite only')
+class SQLiteSearchTests(TestCase):
+    def test_ranks_title_matches_first(self):
+        branch = Branch.objects.create(name='Westlands')
+        described = Vendor.objects.create(name='Kamau & Sons', description='Timber and hardware', branch=branch)
+        named = Vendor.objects.create(name='Hardware Centre', branch=branch)
+        Vendor.objects.create(name='Fresh Produce', branch=branch)
+
+        with CaptureQueriesContext(connection) as ctx:
+            entries = search('hardw')
+        self.assertIn('search_searchentry_fts MATCH', ctx.captured_queries[0]['sql'])
+        self.assertEqual([e.object_id for e in entries], [named.pk, described.pk])
+        self.assertGreater(entries[0].rank, entries[1].rank)
+
+    def test_every_token_must_match(self):
+        branch = Branch.objects.create(name='Westlands')
+        vendor = Vendor.objects.create(name='Hardware Centre', address='Mombasa Road', branch=branch)
+        Vendor.objects.create(name='Hardware Depot', branch=branch)
+        self.assertEqual([e.object_id for e in search('hardware mombasa')], [vendor.pk])
+
+    def test_query_syntax_is_not_interpreted(self):
+        vendor = Vendor.objects.create(name='Acme', branch=Branch.objects.create(name='Westlands'))
+        self.assertEqual([e.object_id for e in search('"acme* (')], [vendor.pk])
+        self.assertEqual(search(' * '), [])
+
+
+@override_settings(ALLOWED_HOSTS=['*'])
+class BranchScopeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user(email='manager@example.com', role='manager')
+        cls.branch = Branch.objects.create(name='Westlands', manager=cls.manager)
+        cls.other_branch = Branch.objects.create(name='Karen')
+        cls.own_vendor = Vendor.objects.create(name='Acme Westlands', branch=cls.branch)
+        cls.other_vendor = Vendor.objects.create(name='Acme Karen', branch=cls.other_branch)
+        cls.customer = Customer.objects.create(name='Acme Customer')
+        cls.superadmin = User.objects.create_user(email='admin@example.com', role='superadmin')
+
+    def get(self, user, url, **params):
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_scopes(self):
+        self.assertEqual(branch_scope(self.manager), self.branch.pk)
+        self.assertIs(branch_scope(self.superadmin), ALL_BRANCHES)
+        staff = User.objects.create_user(email='staff@example.com', branch=self.other_branch)
+        self.assertEqual(branch_scope(staff), self.other_branch.pk)
+
+    def test_manager_sees_only_their_branch(self):
+        results = self.get(self.manager, '/api/search/', q='acme')
+        self.assertCountEqual(
+            [(r['type'], r['id']) for r in results],
+            [('vendor', self.own_vendor.pk), ('customer', self.customer.pk)],
+        )
+        vendors = self.get(self.manager, '/api/vendors/search/', q='acme')
+        self.assertEqual([v['id'] for v in vendors], [self.own_vendor.pk])
+        self.assertEqual(self.get(self.manager, '/api/branches/search/', q='karen'), [])
+
+    def test_superadmin_sees_every_branch(self):
+        vendors = self.get(self.superadmin, '/api/vendors/search/', q='acme')
+        self.assertCountEqual([v['id'] for v in vendors], [self.own_vendor.pk, self.other_vendor.pk])
+        branches = self.get(self.superadmin, '/api/branches/search/', q='karen')
+        self.assertEqual([b['id'] for b in branches], [self.other_branch.pk])
@@ -0,0 +1,54 @@
+from rest_framework import status, permissions
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.response import Response
+
+from .backends import ALL_BRANCHES, search
+from .models import ENTITY_TYPES
+
+MAX_RESULTS = 100
+
+
+def branch_scope(user):
+    """Branch whose entries the user may search, or ALL_BRANCHES"""
+    if user.role == 'superadmin':
+        return ALL_BRANCHES
+    if user.role == 'manager' and hasattr(user, 'managed_branch') and user.managed_branch:
+        return user.managed_branch.id
+    return user.branch_id
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def global_search(request):
+    """Ranked search across vendors, customers, products, branches and sales accounts"""
+    query = request.query_params.get('q', '').strip()
+    
+    if not query:
+        return Response({
+            'error': True,
+            'message': 'Search query is required'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    valid_types = dict(ENTITY_TYPES)
+    entity_types = [
+        entity_type for entity_type in request.query_params.get('type', '').split(',')
+        if entity_type in valid_types
+    ]
+    try:
+        limit = min(int(request.query_params.get('limit', 20)), MAX_RESULTS)
+    except ValueError:
+        limit = 20
+    
+    entries = search(query, branch_scope(request.user), entity_types, limit)
+    
+    return Response([
+        {
+            'type': entry.entity_type,
+            'id': entry.object_id,
+            'title': entry.title,
+            'subtitle': entry.subtitle,
+            'branch': entry.branch_id,
+            'rank': round(float(entry.rank), 4),
+        }
+        for entry in entries
+    ])
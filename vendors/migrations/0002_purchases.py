@@ -0,0 +1,97 @@
+# Generated by Django 5.2.1 on 2026-10-19 00:34
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('branches', '0001_initial'),
+        ('products', '0001_initial'),
+        ('vendors', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Purchase',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reference', models.CharField(blank=True, max_length=50)),
+                ('purchase_date', models.DateField(default=django.utils.timezone.localdate)),
+                ('status', models.CharField(choices=[('draft', 'Draft'), ('posted', 'Posted'), ('cancelled', 'Cancelled')], default='draft', max_length=20)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('notes', models.TextField(blank=True)),
+                ('posted_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['-purchase_date', '-id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='PurchaseLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('description', models.CharField(blank=True, max_length=255)),
+                ('quantity', models.PositiveIntegerField()),
+                ('unit_cost', models.DecimalField(decimal_places=2, max_digits=10)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='vendor',
+            name='last_purchase_date',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='vendor',
+            name='total_purchases',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='vendor',
+            name='total_spent',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddIndex(
+            model_name='vendor',
+            index=models.Index(fields=['branch', '-total_spent'], name='vendor_branch_spent_idx'),
+        ),
+        migrations.AddField(
+            model_name='purchase',
+            name='branch',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='purchases', to='branches.branch'),
+        ),
+        migrations.AddField(
+            model_name='purchase',
+            name='created_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='purchases_created', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='purchase',
+            name='vendor',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='purchases', to='vendors.vendor'),
+        ),
+        migrations.AddField(
+            model_name='purchaseline',
+            name='product',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='purchase_lines', to='products.product'),
+        ),
+        migrations.AddField(
+            model_name='purchaseline',
+            name='purchase',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='vendors.purchase'),
+        ),
+        migrations.AddIndex(
+            model_name='purchase',
+            index=models.Index(fields=['vendor', 'purchase_date'], name='purchase_vendor_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchase',
+            index=models.Index(fields=['branch', 'purchase_date'], name='purchase_branch_date_idx'),
+        ),
+    ]
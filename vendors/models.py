@@ -1,9 +1,37 @@
-from django.db import models
+from django.db import models, transaction
 from django.core.exceptions import ValidationError
-from django.db.models import Count, Sum
+from django.db.models import Count, F, Max, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
 from branches.models import Branch
 from accounts.models import User
 
+
+class VendorQuerySet(models.QuerySet):
+    def for_user(self, user):
+        """Vendors visible to the given user"""
+        if user.role == 'superadmin':
+            return self.all()
+        elif user.role == 'manager' and hasattr(user, 'managed_branch') and user.managed_branch:
+            return self.filter(branch=user.managed_branch)
+        elif user.role == 'staff' and user.branch:
+            return self.filter(branch=user.branch)
+        return self.none()
+
+    def with_stats(self):
+        """
+        Join the branch and the adding user's profile and annotate the
+        per-vendor stats, so serialising a list costs a constant number of
+        queries. Purchase stats are denormalized columns on Vendor; the
+        remaining stat properties return these annotations when present.
+        """
+        # Nothing links products to vendors yet, so the count is a constant
+        # rather than a subquery.
+        return self.select_related('branch', 'added_by__profile').annotate(
+            num_products=Value(0, output_field=models.IntegerField()),
+        )
+
+
 class Vendor(models.Model):
     """
     Vendor model scoped to a specific branch and added by a user.
@@ -43,13 +71,23 @@ class Vendor(models.Model):
         related_name='vendors_added'
     )
 
+    # Denormalized purchase stats, maintained by Purchase.post()/cancel()
+    total_purchases = models.PositiveIntegerField(default=0)
+    total_spent = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    last_purchase_date = models.DateField(null=True, blank=True)
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = VendorQuerySet.as_manager()
+
     class Meta:
         unique_together = ('name', 'branch')
         ordering = ['-created_at']
         verbose_name_plural = 'Vendors'
+        indexes = [
+            models.Index(fields=['branch', '-total_spent'], name='vendor_branch_spent_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.branch.name})"
@@ -58,10 +96,8 @@ class Vendor(models.Model):
         """Custom validation"""
         if self.email and not self.email.strip():
             self.email = ''
-        
-        # Ensure vendor name is unique within the branch
-        if Vendor.objects.filter(name=self.name, branch=self.branch).exclude(id=self.id).exists():
-            raise ValidationError('A vendor with this name already exists in this branch.')
+        # Name uniqueness within the branch is enforced by the
+        # unique_together constraint rather than a query here.
 
     def save(self, *args, **kwargs):
         self.clean()
@@ -70,36 +106,13 @@ class Vendor(models.Model):
     @property
     def total_products(self):
         """Get count of products supplied by this vendor"""
+        if hasattr(self, 'num_products'):
+            return self.num_products
         try:
             return self.products.count()
         except:
             return 0
 
-    @property
-    def total_purchases(self):
-        """Get count of purchases from this vendor"""
-        try:
-            return self.purchases.count()
-        except:
-            return 0
-
-    @property
-    def total_spent(self):
-        """Get total amount spent with this vendor"""
-        try:
-            return self.purchases.aggregate(total=Sum('total_amount'))['total'] or 0
-        except:
-            return 0
-
-    @property
-    def last_purchase_date(self):
-        """Get the date of the last purchase from this vendor"""
-        try:
-            last_purchase = self.purchases.order_by('-purchase_date').first()
-            return last_purchase.purchase_date if last_purchase else None
-        except:
-            return None
-
     def get_stats(self):
         """Get comprehensive vendor statistics"""
         return {
@@ -124,3 +137,155 @@ class Vendor(models.Model):
         if user.role == 'manager':
             return user.managed_branch == self.branch
         return False
+
+
+class PurchaseQuerySet(models.QuerySet):
+    def for_user(self, user):
+        """Purchases visible to the given user"""
+        if user.role == 'superadmin':
+            return self.all()
+        elif user.role == 'manager' and hasattr(user, 'managed_branch') and user.managed_branch:
+            return self.filter(branch=user.managed_branch)
+        elif user.role == 'staff' and user.branch:
+            return self.filter(branch=user.branch)
+        return self.none()
+
+
+class Purchase(models.Model):
+    """
+    Purchase order placed with a vendor for a branch.
+
+    A purchase only counts towards the vendor's stats once it is posted;
+    posting and cancelling update the vendor's denormalized totals in
+    place instead of re-aggregating its purchase history.
+    """
+    STATUS_CHOICES = [
+        ('draft', 'Draft'),
+        ('posted', 'Posted'),
+        ('cancelled', 'Cancelled'),
+    ]
+
+    vendor = models.ForeignKey(
+        Vendor,
+        on_delete=models.PROTECT,
+        related_name='purchases'
+    )
+    branch = models.ForeignKey(
+        Branch,
+        on_delete=models.PROTECT,
+        related_name='purchases'
+    )
+    reference = models.CharField(max_length=50, blank=True)
+    purchase_date = models.DateField(default=timezone.localdate)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='draft')
+    total_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    notes = models.TextField(blank=True)
+    created_by = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='purchases_created'
+    )
+    posted_at = models.DateTimeField(null=True, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = PurchaseQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['-purchase_date', '-id']
+        indexes = [
+            models.Index(fields=['vendor', 'purchase_date'], name='purchase_vendor_date_idx'),
+            models.Index(fields=['branch', 'purchase_date'], name='purchase_branch_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"Purchase #{self.pk} from {self.vendor.name} ({self.get_status_display()})"
+
+    def calculate_total(self):
+        """Get the sum of this purchase's line totals"""
+        return self.lines.aggregate(
+            total=Sum(F('quantity') * F('unit_cost'))
+        )['total'] or 0
+
+    def post(self):
+        """Post a draft purchase and add it to the vendor's totals"""
+        from .stats import invalidate_stats_summary
+
+        with transaction.atomic():
+            purchase = Purchase.objects.select_for_update().get(pk=self.pk)
+            if purchase.status != 'draft':
+                raise ValidationError('Only draft purchases can be posted.')
+
+            self.total_amount = purchase.calculate_total()
+            self.status = 'posted'
+            self.posted_at = timezone.now()
+            self.save(update_fields=['total_amount', 'status', 'posted_at', 'updated_at'])
+
+            Vendor.objects.filter(pk=self.vendor_id).update(
+                total_purchases=F('total_purchases') + 1,
+                total_spent=F('total_spent') + self.total_amount,
+                last_purchase_date=Greatest(
+                    Coalesce('last_purchase_date', Value(self.purchase_date)),
+                    Value(self.purchase_date),
+                ),
+            )
+            invalidate_stats_summary(self.branch_id)
+
+    def cancel(self):
+        """Cancel a purchase, taking it back out of the vendor's totals if posted"""
+        from .stats import invalidate_stats_summary
+
+        with transaction.atomic():
+            purchase = Purchase.objects.select_for_update().get(pk=self.pk)
+            if purchase.status == 'cancelled':
+                raise ValidationError('Purchase is already cancelled.')
+            was_posted = purchase.status == 'posted'
+
+            self.status = 'cancelled'
+            self.save(update_fields=['status', 'updated_at'])
+
+            if was_posted:
+                # Only the last purchase date needs a lookup, and only when
+                # the cancelled purchase might have been the latest one.
+                # The vendor row is locked so a purchase posted meanwhile
+                # can't move the date under us.
+                vendor = Vendor.objects.select_for_update().only('last_purchase_date').get(pk=self.vendor_id)
+                changes = {}
+                if vendor.last_purchase_date is None or purchase.purchase_date >= vendor.last_purchase_date:
+                    changes['last_purchase_date'] = Purchase.objects.filter(
+                        vendor_id=self.vendor_id, status='posted'
+                    ).aggregate(last=Max('purchase_date'))['last']
+                Vendor.objects.filter(pk=self.vendor_id).update(
+                    total_purchases=F('total_purchases') - 1,
+                    total_spent=F('total_spent') - purchase.total_amount,
+                    **changes
+                )
+                invalidate_stats_summary(self.branch_id)
+
+
+class PurchaseLine(models.Model):
+    purchase = models.ForeignKey(
+        Purchase,
+        on_delete=models.CASCADE,
+        related_name='lines'
+    )
+    product = models.ForeignKey(
+        'products.Product',
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name='purchase_lines'
+    )
+    description = models.CharField(max_length=255, blank=True)
+    quantity = models.PositiveIntegerField()
+    unit_cost = models.DecimalField(max_digits=10, decimal_places=2)
+
+    def __str__(self):
+        return f"{self.quantity} x {self.description or self.product} @ {self.unit_cost}"
+
+    @property
+    def line_total(self):
+        return self.quantity * self.unit_cost
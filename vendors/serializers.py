@@ -1,10 +1,13 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
-from .models import Vendor
+from django.db import IntegrityError, transaction
+from .models import Vendor, Purchase, PurchaseLine
 from branches.serializers import BranchSerializer
 
 User = get_user_model()
 
+DUPLICATE_VENDOR_NAME = 'A vendor with this name already exists in your branch.'
+
 
 class VendorSerializer(serializers.ModelSerializer):
     """Basic vendor serializer for reading"""
@@ -12,7 +15,7 @@ class VendorSerializer(serializers.ModelSerializer):
     added_by_name = serializers.CharField(source='added_by.profile.full_name', read_only=True)
     total_products = serializers.IntegerField(read_only=True)
     total_purchases = serializers.IntegerField(read_only=True)
-    total_spent = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+    total_spent = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
     last_purchase_date = serializers.DateField(read_only=True)
     
     class Meta:
@@ -38,15 +41,6 @@ class VendorCreateSerializer(serializers.ModelSerializer):
             'website'
         ]
     
-    def validate_name(self, value):
-        """Ensure vendor name is unique within the branch"""
-        request = self.context.get('request')
-        if request and hasattr(request.user, 'managed_branch') and request.user.managed_branch:
-            branch = request.user.managed_branch
-            if Vendor.objects.filter(name=value, branch=branch).exists():
-                raise serializers.ValidationError('A vendor with this name already exists in your branch.')
-        return value
-    
     def create(self, validated_data):
         request = self.context.get('request')
         if not request or request.user.role != 'manager':
@@ -58,7 +52,14 @@ class VendorCreateSerializer(serializers.ModelSerializer):
         validated_data['branch'] = request.user.managed_branch
         validated_data['added_by'] = request.user
         
-        return super().create(validated_data)
+        # The (name, branch) unique constraint does the duplicate check
+        try:
+            with transaction.atomic():
+                return super().create(validated_data)
+        except IntegrityError:
+            if not Vendor.objects.filter(name=validated_data['name'], branch=validated_data['branch']).exists():
+                raise
+            raise serializers.ValidationError({'name': [DUPLICATE_VENDOR_NAME]})
 
 
 class VendorUpdateSerializer(serializers.ModelSerializer):
@@ -72,17 +73,6 @@ class VendorUpdateSerializer(serializers.ModelSerializer):
             'website'
         ]
     
-    def validate_name(self, value):
-        """Ensure vendor name is unique within the branch (excluding current instance)"""
-        request = self.context.get('request')
-        instance = self.instance
-        
-        if request and hasattr(request.user, 'managed_branch') and request.user.managed_branch:
-            branch = request.user.managed_branch
-            if Vendor.objects.filter(name=value, branch=branch).exclude(id=instance.id).exists():
-                raise serializers.ValidationError('A vendor with this name already exists in your branch.')
-        return value
-    
     def update(self, instance, validated_data):
         request = self.context.get('request')
         if not request or request.user.role != 'manager':
@@ -91,11 +81,19 @@ class VendorUpdateSerializer(serializers.ModelSerializer):
         if not instance.can_be_managed_by(request.user):
             raise serializers.ValidationError('You can only update vendors in your managed branch.')
         
-        return super().update(instance, validated_data)
+        try:
+            with transaction.atomic():
+                return super().update(instance, validated_data)
+        except IntegrityError:
+            duplicate = Vendor.objects.filter(name=instance.name, branch_id=instance.branch_id).exclude(pk=instance.pk)
+            if not duplicate.exists():
+                raise
+            raise serializers.ValidationError({'name': [DUPLICATE_VENDOR_NAME]})
 
 
 class VendorStatsSerializer(serializers.ModelSerializer):
     """Serializer for vendor statistics"""
+    branch_name = serializers.CharField(source='branch.name', read_only=True)
     stats = serializers.SerializerMethodField()
     
     class Meta:
@@ -140,20 +138,18 @@ class VendorPurchaseSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'purchases']
     
     def get_purchases(self, obj):
-        try:
-            purchases = obj.purchases.all()[:10]  # Limit to last 10 purchases
-            return [
-                {
-                    'id': purchase.id,
-                    'purchase_date': purchase.purchase_date,
-                    'total_amount': purchase.total_amount,
-                    'status': getattr(purchase, 'status', ''),
-                    'reference': getattr(purchase, 'reference', '')
-                }
-                for purchase in purchases
-            ]
-        except:
-            return []
+        # The last 10 purchases, latest first
+        purchases = obj.purchases.order_by('-purchase_date', '-id')[:10]
+        return [
+            {
+                'id': purchase.id,
+                'purchase_date': purchase.purchase_date,
+                'total_amount': purchase.total_amount,
+                'status': purchase.status,
+                'reference': purchase.reference
+            }
+            for purchase in purchases
+        ]
 
 
 class VendorSearchSerializer(serializers.ModelSerializer):
@@ -162,4 +158,63 @@ class VendorSearchSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Vendor
-        fields = ['id', 'name', 'contact_person', 'phone_number', 'email', 'vendor_type', 'branch_name', 'is_active'] 
\ No newline at end of file
+        fields = ['id', 'name', 'contact_person', 'phone_number', 'email', 'vendor_type', 'branch_name', 'is_active']
+
+
+class PurchaseLineSerializer(serializers.ModelSerializer):
+    """Serializer for purchase order lines"""
+    line_total = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
+
+    class Meta:
+        model = PurchaseLine
+        fields = ['id', 'product', 'description', 'quantity', 'unit_cost', 'line_total']
+        read_only_fields = ['id']
+
+
+class PurchaseSerializer(serializers.ModelSerializer):
+    """Serializer for reading and creating purchase orders (BranchManagers only for creation)"""
+    vendor_name = serializers.CharField(source='vendor.name', read_only=True)
+    lines = PurchaseLineSerializer(many=True)
+
+    class Meta:
+        model = Purchase
+        fields = [
+            'id', 'vendor', 'vendor_name', 'branch', 'reference', 'purchase_date',
+            'status', 'total_amount', 'notes', 'created_by', 'posted_at',
+            'created_at', 'lines'
+        ]
+        read_only_fields = [
+            'id', 'branch', 'status', 'total_amount', 'created_by', 'posted_at', 'created_at'
+        ]
+
+    def validate_vendor(self, value):
+        """Ensure the vendor belongs to the manager's branch"""
+        request = self.context.get('request')
+        if request and not value.can_be_managed_by(request.user):
+            raise serializers.ValidationError('You can only purchase from vendors in your managed branch.')
+        return value
+
+    def validate_lines(self, value):
+        if not value:
+            raise serializers.ValidationError('A purchase needs at least one line.')
+        return value
+
+    def create(self, validated_data):
+        request = self.context.get('request')
+        if not request or request.user.role != 'manager':
+            raise serializers.ValidationError('Only branch managers can create purchases.')
+
+        lines_data = validated_data.pop('lines')
+        vendor = validated_data['vendor']
+        with transaction.atomic():
+            purchase = Purchase.objects.create(
+                branch_id=vendor.branch_id,
+                created_by=request.user,
+                **validated_data
+            )
+            lines = PurchaseLine.objects.bulk_create([
+                PurchaseLine(purchase=purchase, **line) for line in lines_data
+            ])
+            purchase.total_amount = sum(line.line_total for line in lines)
+            purchase.save(update_fields=['total_amount', 'updated_at'])
+        return purchase
@@ -1,6 +1,7 @@
-from django.db.models.signals import post_save, pre_delete
+from django.db.models.signals import post_delete, post_save, pre_delete
 from django.dispatch import receiver
 from .models import Vendor
+from .stats import invalidate_stats_summary
 
 
 @receiver(post_save, sender=Vendor)
@@ -8,12 +9,7 @@ def handle_vendor_save(sender, instance, created, **kwargs):
     """
     Handle vendor save operations
     """
-    if created:
-        # New vendor created
-        pass
-    else:
-        # Vendor updated
-        pass
+    invalidate_stats_summary(instance.branch_id)
 
 
 @receiver(pre_delete, sender=Vendor)
@@ -22,5 +18,13 @@ def handle_vendor_delete(sender, instance, **kwargs):
     Handle vendor deletion - ensure no associated data
     """
     # Check if vendor has associated data
-    if instance.total_products > 0 or instance.total_purchases > 0:
-        raise Exception("Cannot delete vendor with associated products or purchases") 
\ No newline at end of file
+    if instance.total_products > 0 or instance.purchases.exists():
+        raise Exception("Cannot delete vendor with associated products or purchases")
+
+
+@receiver(post_delete, sender=Vendor)
+def handle_vendor_deleted(sender, instance, **kwargs):
+    """
+    Drop cached stats that included the deleted vendor
+    """
+    invalidate_stats_summary(instance.branch_id)
@@ -0,0 +1,59 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q
+
+from .models import Vendor
+
+VENDOR_TYPES = [choice for choice, _ in Vendor._meta.get_field('vendor_type').choices]
+
+
+def stats_summary_cache_key(branch_id):
+    return f'vendors:stats-summary:{branch_id or "all"}'
+
+
+def build_stats_summary(branch=None):
+    """
+    Vendor totals, active count and per-type breakdown in a single query,
+    plus the top five vendors by spend.
+    """
+    from .serializers import VendorSerializer
+
+    vendors = Vendor.objects.all()
+    if branch is not None:
+        vendors = vendors.filter(branch=branch)
+
+    counts = vendors.aggregate(
+        total=Count('id'),
+        active=Count('id', filter=Q(is_active=True)),
+        **{
+            f'type_{vendor_type}': Count('id', filter=Q(vendor_type=vendor_type))
+            for vendor_type in VENDOR_TYPES
+        }
+    )
+    top_vendors = vendors.with_stats().order_by('-total_spent', 'name')[:5]
+
+    return {
+        'total_vendors': counts['total'],
+        'active_vendors': counts['active'],
+        'vendors_by_type': {
+            vendor_type: counts[f'type_{vendor_type}'] for vendor_type in VENDOR_TYPES
+        },
+        'top_vendors': list(VendorSerializer(top_vendors, many=True).data),
+    }
+
+
+def get_stats_summary(branch=None):
+    """Cached vendor stats summary for a branch (or all branches)"""
+    key = stats_summary_cache_key(branch.id if branch else None)
+    summary = cache.get(key)
+    if summary is None:
+        summary = build_stats_summary(branch)
+        cache.set(key, summary, timeout=settings.VENDOR_STATS_CACHE_TIMEOUT)
+    return summary
+
+
+def invalidate_stats_summary(branch_id):
+    """Drop the cached summaries that include the given branch"""
+    keys = [stats_summary_cache_key(branch_id), stats_summary_cache_key(None)]
+    transaction.on_commit(lambda: cache.delete_many(keys))
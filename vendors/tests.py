@@ -1,3 +1,142 @@
-from django.test import TestCase
+from datetime import date
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from accounts.models import User
+from branches.models import Branch
+from .models import Purchase, PurchaseLine, Vendor
+from .serializers import DUPLICATE_VENDOR_NAME, VendorCreateSerializer
+
+
+@override_settings(ALLOWED_HOSTS=['*'])
+class VendorCreateTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user(email='manager@example.com', password='pass', role='manager')
+        cls.branch = Branch.objects.create(name='Vendor branch', manager=cls.manager)
+
+    def serializer(self, **data):
+        request = SimpleNamespace(user=self.manager)
+        return VendorCreateSerializer(data={'name': 'Acme', **data}, context={'request': request})
+
+    def test_create_queries(self):
+        self.manager.managed_branch  # cached, as on an authenticated request
+        serializer = self.serializer()
+        # The insert and the search index entry (lookup and insert), with
+        # their savepoints. No query checks the name first: the unique
+        # constraint does.
+        with self.assertNumQueries(9) as ctx:
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+        self.assertFalse([q for q in ctx.captured_queries if 'FROM "vendors_vendor"' in q['sql']])
+
+    def test_duplicate_name(self):
+        Vendor.objects.create(name='Acme', branch=self.branch, added_by=self.manager)
+        client = APIClient()
+        client.force_authenticate(self.manager)
+        response = client.post('/api/vendors/', {'name': 'Acme'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'name': [DUPLICATE_VENDOR_NAME]})
+        self.assertEqual(Vendor.objects.filter(name='Acme').count(), 1)
+
+    def test_same_name_in_another_branch(self):
+        other = Branch.objects.create(name='Other branch')
+        Vendor.objects.create(name='Acme', branch=other, added_by=self.manager)
+        serializer = self.serializer()
+        serializer.is_valid(raise_exception=True)
+        self.assertEqual(serializer.save().branch, self.branch)
+
+    def test_other_integrity_errors_are_not_reported_as_duplicate_name(self):
+        serializer = self.serializer()
+        serializer.is_valid(raise_exception=True)
+        with mock.patch('vendors.serializers.Vendor.objects.create', side_effect=IntegrityError('other')):
+            with self.assertRaisesMessage(IntegrityError, 'other'):
+                serializer.save()
+
+
+@override_settings(ALLOWED_HOSTS=['*'])
+class PurchaseTotalsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user(email='manager@example.com', password='pass', role='manager')
+        cls.branch = Branch.objects.create(name='Purchases branch', manager=cls.manager)
+        cls.vendor = Vendor.objects.create(name='Acme', branch=cls.branch, added_by=cls.manager)
+
+    def purchase(self, purchase_date, *lines):
+        purchase = Purchase.objects.create(vendor=self.vendor, branch=self.branch, purchase_date=purchase_date)
+        for quantity, unit_cost in lines:
+            PurchaseLine.objects.create(purchase=purchase, description='Item', quantity=quantity,
+                                        unit_cost=unit_cost)
+        return purchase
+
+    def totals(self):
+        self.vendor.refresh_from_db()
+        return self.vendor.total_purchases, self.vendor.total_spent, self.vendor.last_purchase_date
+
+    def test_post_adds_to_the_vendor_totals(self):
+        later = self.purchase(date(2026, 3, 10), (2, Decimal('50.00')), (1, Decimal('25.50')))
+        earlier = self.purchase(date(2026, 3, 1), (4, Decimal('10.00')))
+        later.post()
+        earlier.post()
+
+        self.assertEqual(later.total_amount, Decimal('125.50'))
+        self.assertEqual(self.totals(), (2, Decimal('165.50'), date(2026, 3, 10)))
+        with self.assertRaisesMessage(ValidationError, 'Only draft purchases can be posted.'):
+            later.post()
+        self.assertEqual(self.totals(), (2, Decimal('165.50'), date(2026, 3, 10)))
+
+    def test_cancel_takes_a_posted_purchase_out_of_the_totals(self):
+        earlier = self.purchase(date(2026, 3, 1), (4, Decimal('10.00')))
+        later = self.purchase(date(2026, 3, 10), (2, Decimal('50.00')))
+        draft = self.purchase(date(2026, 3, 20), (1, Decimal('999.00')))
+        earlier.post()
+        later.post()
+
+        draft.cancel()
+        self.assertEqual(self.totals(), (2, Decimal('140.00'), date(2026, 3, 10)))
+        later.cancel()
+        self.assertEqual(self.totals(), (1, Decimal('40.00'), date(2026, 3, 1)))
+        earlier.cancel()
+        self.assertEqual(self.totals(), (0, Decimal('0.00'), None))
+        with self.assertRaisesMessage(ValidationError, 'Purchase is already cancelled.'):
+            earlier.cancel()
+
+    def test_cancelling_an_older_purchase_keeps_the_last_date(self):
+        earlier = self.purchase(date(2026, 3, 1), (4, Decimal('10.00')))
+        later = self.purchase(date(2026, 3, 10), (2, Decimal('50.00')))
+        earlier.post()
+        later.post()
+        earlier.cancel()
+        self.assertEqual(self.totals(), (1, Decimal('100.00'), date(2026, 3, 10)))
+
+    def test_post_and_cancel_endpoints(self):
+        purchase = self.purchase(date(2026, 3, 1), (3, Decimal('20.00')))
+        client = APIClient()
+        client.force_authenticate(self.manager)
+
+        response = client.post(f'/api/vendors/purchases/{purchase.pk}/post/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.totals(), (1, Decimal('60.00'), date(2026, 3, 1)))
+
+        self.assertEqual(client.post(f'/api/vendors/purchases/{purchase.pk}/cancel/').status_code, 200)
+        response = client.post(f'/api/vendors/purchases/{purchase.pk}/cancel/')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': True, 'message': 'Purchase is already cancelled.'})
+        self.assertEqual(self.totals(), (0, Decimal('0.00'), None))
+
+    def test_vendor_purchases_are_the_latest_ten(self):
+        purchases = [self.purchase(date(2026, 1, day)) for day in (5, 20, 1, 15, 10, 25, 2, 30, 8, 12, 3, 28)]
+        client = APIClient()
+        client.force_authenticate(self.manager)
+        response = client.get(f'/api/vendors/{self.vendor.pk}/purchases/')
+        self.assertEqual(response.status_code, 200)
+
+        latest = sorted(purchases, key=lambda purchase: purchase.purchase_date, reverse=True)[:10]
+        self.assertEqual([row['id'] for row in response.json()['purchases']], [p.pk for p in latest])
+        self.assertEqual(response.json()['purchases'][0]['status'], 'draft')
@@ -2,7 +2,8 @@ from django.urls import path
 from .views import (
     VendorListView, VendorDetailView, VendorStatsView, VendorProductsView,
     VendorPurchasesView, vendor_search, vendor_stats_summary, bulk_update_vendor_status,
-    vendor_by_type, active_vendors
+    vendor_by_type, active_vendors, PurchaseListView, PurchaseDetailView,
+    post_purchase, cancel_purchase
 )
 
 app_name = 'vendors'
@@ -25,4 +26,10 @@ urlpatterns = [
     # Statistics and bulk operations
     path('stats/summary/', vendor_stats_summary, name='vendor-stats-summary'),
     path('bulk-update-status/', bulk_update_vendor_status, name='bulk-update-vendor-status'),
+    
+    # Purchase orders
+    path('purchases/', PurchaseListView.as_view(), name='purchase-list'),
+    path('purchases/<int:pk>/', PurchaseDetailView.as_view(), name='purchase-detail'),
+    path('purchases/<int:pk>/post/', post_purchase, name='purchase-post'),
+    path('purchases/<int:pk>/cancel/', cancel_purchase, name='purchase-cancel'),
 ]
\ No newline at end of file
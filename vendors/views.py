@@ -3,14 +3,17 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.shortcuts import get_object_or_404
-from django.db.models import Q
-from .models import Vendor
+from django.core.exceptions import ValidationError
+from .models import Vendor, Purchase
+from .stats import get_stats_summary, invalidate_stats_summary
 from .serializers import (
     VendorSerializer, VendorCreateSerializer, VendorUpdateSerializer,
     VendorStatsSerializer, VendorProductSerializer, VendorPurchaseSerializer,
-    VendorSearchSerializer
+    VendorSearchSerializer, PurchaseSerializer
 )
 from branches.permissions import IsManagerOrSuperAdmin, IsBranchManager
+from search.backends import search_objects
+from search.views import MAX_RESULTS, branch_scope
 
 
 class VendorListView(generics.ListCreateAPIView):
@@ -19,16 +22,7 @@ class VendorListView(generics.ListCreateAPIView):
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
-        user = self.request.user
-        
-        if user.role == 'superadmin':
-            return Vendor.objects.all()
-        elif user.role == 'manager' and hasattr(user, 'managed_branch') and user.managed_branch:
-            return Vendor.objects.filter(branch=user.managed_branch)
-        elif user.role == 'staff' and user.branch:
-            return Vendor.objects.filter(branch=user.branch)
-        else:
-            return Vendor.objects.none()
+        return Vendor.objects.for_user(self.request.user).with_stats()
     
     def get_serializer_class(self):
         if self.request.method == 'POST':
@@ -42,16 +36,7 @@ class VendorDetailView(generics.RetrieveUpdateDestroyAPIView):
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
-        user = self.request.user
-        
-        if user.role == 'superadmin':
-            return Vendor.objects.all()
-        elif user.role == 'manager' and hasattr(user, 'managed_branch') and user.managed_branch:
-            return Vendor.objects.filter(branch=user.managed_branch)
-        elif user.role == 'staff' and user.branch:
-            return Vendor.objects.filter(branch=user.branch)
-        else:
-            return Vendor.objects.none()
+        return Vendor.objects.for_user(self.request.user).with_stats()
     
     def get_serializer_class(self):
         if self.request.method in ['PUT', 'PATCH']:
@@ -61,8 +46,9 @@ class VendorDetailView(generics.RetrieveUpdateDestroyAPIView):
     def destroy(self, request, *args, **kwargs):
         vendor = self.get_object()
         
-        # Check if vendor has associated products or purchases
-        if vendor.total_products > 0 or vendor.total_purchases > 0:
+        # Check if vendor has associated products or purchases. Draft and
+        # cancelled purchases count too: Purchase.vendor is PROTECT.
+        if vendor.total_products > 0 or vendor.purchases.exists():
             return Response({
                 'error': True,
                 'message': 'Cannot delete vendor with associated products or purchases'
@@ -77,16 +63,7 @@ class VendorStatsView(generics.RetrieveAPIView):
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
-        user = self.request.user
-        
-        if user.role == 'superadmin':
-            return Vendor.objects.all()
-        elif user.role == 'manager' and hasattr(user, 'managed_branch') and user.managed_branch:
-            return Vendor.objects.filter(branch=user.managed_branch)
-        elif user.role == 'staff' and user.branch:
-            return Vendor.objects.filter(branch=user.branch)
-        else:
-            return Vendor.objects.none()
+        return Vendor.objects.for_user(self.request.user).with_stats()
 
 
 class VendorProductsView(generics.RetrieveAPIView):
@@ -95,16 +72,7 @@ class VendorProductsView(generics.RetrieveAPIView):
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
-        user = self.request.user
-        
-        if user.role == 'superadmin':
-            return Vendor.objects.all()
-        elif user.role == 'manager' and hasattr(user, 'managed_branch') and user.managed_branch:
-            return Vendor.objects.filter(branch=user.managed_branch)
-        elif user.role == 'staff' and user.branch:
-            return Vendor.objects.filter(branch=user.branch)
-        else:
-            return Vendor.objects.none()
+        return Vendor.objects.for_user(self.request.user).with_stats()
 
 
 class VendorPurchasesView(generics.RetrieveAPIView):
@@ -113,22 +81,13 @@ class VendorPurchasesView(generics.RetrieveAPIView):
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
-        user = self.request.user
-        
-        if user.role == 'superadmin':
-            return Vendor.objects.all()
-        elif user.role == 'manager' and hasattr(user, 'managed_branch') and user.managed_branch:
-            return Vendor.objects.filter(branch=user.managed_branch)
-        elif user.role == 'staff' and user.branch:
-            return Vendor.objects.filter(branch=user.branch)
-        else:
-            return Vendor.objects.none()
+        return Vendor.objects.for_user(self.request.user).with_stats()
 
 
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def vendor_search(request):
-    """Search vendors by name, contact person, or email"""
+    """Search vendors by name, contact person, email and other details, best match first"""
     query = request.query_params.get('q', '')
     
     if not query:
@@ -137,30 +96,10 @@ def vendor_search(request):
             'message': 'Search query is required'
         }, status=status.HTTP_400_BAD_REQUEST)
     
-    user = request.user
-    
-    if user.role == 'superadmin':
-        vendors = Vendor.objects.filter(
-            Q(name__icontains=query) | 
-            Q(contact_person__icontains=query) | 
-            Q(email__icontains=query)
-        )
-    elif user.role == 'manager' and hasattr(user, 'managed_branch') and user.managed_branch:
-        vendors = Vendor.objects.filter(
-            Q(branch=user.managed_branch) &
-            (Q(name__icontains=query) | 
-             Q(contact_person__icontains=query) | 
-             Q(email__icontains=query))
-        )
-    elif user.role == 'staff' and user.branch:
-        vendors = Vendor.objects.filter(
-            Q(branch=user.branch) &
-            (Q(name__icontains=query) | 
-             Q(contact_person__icontains=query) | 
-             Q(email__icontains=query))
-        )
-    else:
-        vendors = Vendor.objects.none()
+    vendors = search_objects(
+        Vendor.objects.for_user(request.user).select_related('branch'), 'vendor', query,
+        branch_scope(request.user), MAX_RESULTS
+    )
     
     serializer = VendorSearchSerializer(vendors, many=True)
     return Response(serializer.data)
@@ -173,52 +112,18 @@ def vendor_stats_summary(request):
     user = request.user
     
     if user.role == 'superadmin':
-        total_vendors = Vendor.objects.count()
-        active_vendors = Vendor.objects.filter(is_active=True).count()
-        vendors_by_type = {}
-        
-        for vendor_type, _ in Vendor._meta.get_field('vendor_type').choices:
-            vendors_by_type[vendor_type] = Vendor.objects.filter(vendor_type=vendor_type).count()
-        
-        # Get top vendors by total spent
-        top_vendors = Vendor.objects.all()[:5]
-        
+        branch = None
     elif user.role == 'manager' and hasattr(user, 'managed_branch') and user.managed_branch:
         branch = user.managed_branch
-        total_vendors = Vendor.objects.filter(branch=branch).count()
-        active_vendors = Vendor.objects.filter(branch=branch, is_active=True).count()
-        vendors_by_type = {}
-        
-        for vendor_type, _ in Vendor._meta.get_field('vendor_type').choices:
-            vendors_by_type[vendor_type] = Vendor.objects.filter(branch=branch, vendor_type=vendor_type).count()
-        
-        # Get top vendors by total spent
-        top_vendors = Vendor.objects.filter(branch=branch)[:5]
-        
     elif user.role == 'staff' and user.branch:
         branch = user.branch
-        total_vendors = Vendor.objects.filter(branch=branch).count()
-        active_vendors = Vendor.objects.filter(branch=branch, is_active=True).count()
-        vendors_by_type = {}
-        
-        for vendor_type, _ in Vendor._meta.get_field('vendor_type').choices:
-            vendors_by_type[vendor_type] = Vendor.objects.filter(branch=branch, vendor_type=vendor_type).count()
-        
-        # Get top vendors by total spent
-        top_vendors = Vendor.objects.filter(branch=branch)[:5]
-        
     else:
         return Response({
             'error': True,
             'message': 'No branch assigned'
         }, status=status.HTTP_400_BAD_REQUEST)
     
-    return Response({
-        'total_vendors': total_vendors,
-        'active_vendors': active_vendors,
-        'vendors_by_type': vendors_by_type,
-        'top_vendors': VendorSerializer(top_vendors, many=True).data
-    })
+    return Response(get_stats_summary(branch))
 
 
 @api_view(['POST'])
@@ -240,6 +145,8 @@ def bulk_update_vendor_status(request):
     try:
         vendors = Vendor.objects.filter(id__in=vendor_ids, branch=branch)
         updated_count = vendors.update(is_active=is_active)
+        # update() bypasses the post_save signal that normally does this
+        invalidate_stats_summary(branch.id)
         
         return Response({
             'message': f'{updated_count} vendors updated successfully',
@@ -256,16 +163,7 @@ def bulk_update_vendor_status(request):
 @permission_classes([permissions.IsAuthenticated])
 def vendor_by_type(request, vendor_type):
     """Get vendors by type"""
-    user = request.user
-    
-    if user.role == 'superadmin':
-        vendors = Vendor.objects.filter(vendor_type=vendor_type)
-    elif user.role == 'manager' and hasattr(user, 'managed_branch') and user.managed_branch:
-        vendors = Vendor.objects.filter(branch=user.managed_branch, vendor_type=vendor_type)
-    elif user.role == 'staff' and user.branch:
-        vendors = Vendor.objects.filter(branch=user.branch, vendor_type=vendor_type)
-    else:
-        vendors = Vendor.objects.none()
+    vendors = Vendor.objects.for_user(request.user).filter(vendor_type=vendor_type).with_stats()
     
     serializer = VendorSerializer(vendors, many=True)
     return Response(serializer.data)
@@ -275,16 +173,63 @@ def vendor_by_type(request, vendor_type):
 @permission_classes([permissions.IsAuthenticated])
 def active_vendors(request):
     """Get only active vendors"""
-    user = request.user
-    
-    if user.role == 'superadmin':
-        vendors = Vendor.objects.filter(is_active=True)
-    elif user.role == 'manager' and hasattr(user, 'managed_branch') and user.managed_branch:
-        vendors = Vendor.objects.filter(branch=user.managed_branch, is_active=True)
-    elif user.role == 'staff' and user.branch:
-        vendors = Vendor.objects.filter(branch=user.branch, is_active=True)
-    else:
-        vendors = Vendor.objects.none()
+    vendors = Vendor.objects.for_user(request.user).filter(is_active=True).with_stats()
     
     serializer = VendorSerializer(vendors, many=True)
     return Response(serializer.data)
+
+
+class PurchaseListView(generics.ListCreateAPIView):
+    """List and create purchase orders (BranchManagers only for creation)"""
+    serializer_class = PurchaseSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get_queryset(self):
+        purchases = Purchase.objects.for_user(self.request.user).select_related('vendor')
+        vendor_id = self.request.query_params.get('vendor')
+        if vendor_id:
+            purchases = purchases.filter(vendor_id=vendor_id)
+        return purchases.prefetch_related('lines')
+
+
+class PurchaseDetailView(generics.RetrieveAPIView):
+    """Get a specific purchase order"""
+    serializer_class = PurchaseSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get_queryset(self):
+        return Purchase.objects.for_user(self.request.user).select_related('vendor').prefetch_related('lines')
+
+
+@api_view(['POST'])
+@permission_classes([IsBranchManager])
+def post_purchase(request, pk):
+    """Post a draft purchase, adding it to the vendor's totals (BranchManagers only)"""
+    purchase = get_object_or_404(Purchase, pk=pk, branch=request.user.managed_branch)
+    
+    try:
+        purchase.post()
+    except ValidationError as e:
+        return Response({
+            'error': True,
+            'message': e.messages[0]
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    return Response(PurchaseSerializer(purchase).data)
+
+
+@api_view(['POST'])
+@permission_classes([IsBranchManager])
+def cancel_purchase(request, pk):
+    """Cancel a purchase, removing it from the vendor's totals (BranchManagers only)"""
+    purchase = get_object_or_404(Purchase, pk=pk, branch=request.user.managed_branch)
+    
+    try:
+        purchase.cancel()
+    except ValidationError as e:
+        return Response({
+            'error': True,
+            'message': e.messages[0]
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    return Response(PurchaseSerializer(purchase).data)